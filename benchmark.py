@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+效能基準：以固定 seed 與固定兌現表 fixture 量測各模擬熱點，結果寫成 JSON，不同版本間可直接比較。
+
+涵蓋：
+- cash out：get_cashout_value、dealer_play、play_round、_play_round_strategy_b 的每次呼叫延遲，
+  以及 run_simulation（逐局 / 批次引擎、策略 A / B）在數種局數下的整體吞吐量
+- bust it：單核心 random.choices 迴圈、bust_count_histogram（C 後端 / NumPy）、無限副牌分片、
+  有限牌組無放回抽牌
+
+每個項目先做一次暖身（編譯 C 後端、建立快取），再計時 repeat 次取中位數；之後另以 tracemalloc 跑一次量測
+記憶體峰值（tracemalloc 會拖慢執行，不計入時間，--no-memory 可略過）。
+兌現表 fixture 沿用平滑推算表的列與欄，但數值由固定公式產生，表格校準後基準仍可比較。
+
+用法：
+  python benchmark.py [--only 名稱片段] [--rounds 1e4,1e5,1e6] [--repeat N] [--output 路徑]
+  python benchmark.py --compare 舊.json 新.json     # 逐項比較，變慢超過 BENCH_TOLERANCE 時結束碼為 1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+from importlib.util import module_from_spec, spec_from_file_location
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CASH_OUT_DIR = os.path.join(ROOT_DIR, "cash out")
+BUST_IT_DIR = os.path.join(ROOT_DIR, "bust it")
+for _path in (CASH_OUT_DIR, BUST_IT_DIR):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+BENCH_SEED = int(os.environ.get("BENCH_SEED", "20240917"))
+BENCH_ROUNDS = os.environ.get("BENCH_ROUNDS", "1e4,1e5,1e6")
+BENCH_REPEAT = int(os.environ.get("BENCH_REPEAT", "3"))
+BENCH_OUTPUT_DIR = os.environ.get("BENCH_OUTPUT_DIR", "").strip() or os.path.join(ROOT_DIR, "benchmark_results")
+# --compare 時每次呼叫延遲變慢超過此比例即視為退步
+BENCH_TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", "0.10"))
+
+CALL_COUNT = 200_000          # 單一函式基準每次計時的呼叫次數
+BUST_IT_HANDS = 1_000_000     # Bust It 基準每次計時的手數（單核心迴圈以 100 萬手為一段）
+HEAVY_UNITS = 1_000_000       # 工作量達此值的項目只計時一次
+FIXTURE_SOURCE = os.path.join(CASH_OUT_DIR, "data", "blackjack 對照表 - 平滑推算表.csv")
+FIXTURE_MIN, FIXTURE_MAX = 40, 177
+FIXTURE_BASE = {"hard": 70, "soft": 95, "split": 85}
+
+Case = namedtuple("Case", ["name", "setup", "units", "unit"])
+Case.__doc__ = """
+一個基準項目。setup() 回傳不帶參數的 callable（準備工作不計時），每次呼叫完成 units 個 unit
+（call / round / hand）的工作；callable 的回傳值若為數字則記入結果，供比較時確認行為未變。
+"""
+
+
+def _load_rtp_module():
+    spec = spec_from_file_location("cash_out_rtp", os.path.join(CASH_OUT_DIR, "cash out RTP.py"))
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fixture_tables():
+    """固定兌現表：平滑推算表的列 / 欄，數值為 FIXTURE_BASE + 2×點數 − 3×明牌（限制於 [40, 177]）。"""
+    import table_io
+    from cashout_lookup import with_lookup
+    tables = table_io.load_tables(FIXTURE_SOURCE)
+    for block, df in tables.items():
+        totals = np.array([int(str(r).split(" ", 1)[0]) for r in df.index])[:, None]
+        upcards = np.array(df.columns, dtype=np.int64)[None, :]
+        df.loc[:, :] = np.clip(FIXTURE_BASE[block] + 2 * totals - 3 * upcards, FIXTURE_MIN, FIXTURE_MAX)
+    return with_lookup(tables)
+
+
+def _cashout_cases(rtp, tables, rounds_list):
+    rng = np.random.default_rng(BENCH_SEED)
+
+    def get_cashout_value():
+        totals = rng.integers(4, 22, CALL_COUNT).tolist()
+        upcards = rng.integers(2, 12, CALL_COUNT).tolist()
+        soft = (rng.random(CALL_COUNT) < 0.3).tolist()
+        pair = (rng.random(CALL_COUNT) < 0.1).tolist()
+        args = list(zip(totals, upcards, soft, pair))
+        get = rtp.get_cashout_value
+
+        def run():
+            total = 0.0
+            for t, u, s, p in args:
+                total += get(tables, t, u, s, p, rtp.BASE_BET)
+            return total
+        return run
+
+    def dealer_play():
+        shoe = rtp.create_shoe(seed=BENCH_SEED)
+        upcards = rng.integers(2, 12, CALL_COUNT).tolist()
+        states = [rtp.NEXT[rtp.EMPTY * rtp.CARD_STRIDE + u] for u in upcards]
+        play = rtp.dealer_play
+
+        def run():
+            return sum(play(shoe, s) for s in states)
+        return run
+
+    def rounds(play):
+        def setup():
+            shoe = rtp.create_shoe(seed=BENCH_SEED)
+
+            def run():
+                total = 0.0
+                for _ in range(CALL_COUNT):
+                    total += play(shoe, tables)[0]
+                return total
+            return run
+        return setup
+
+    cases = [
+        Case("cashout.get_cashout_value", get_cashout_value, CALL_COUNT, "call"),
+        Case("cashout.dealer_play", dealer_play, CALL_COUNT, "call"),
+        Case("cashout.play_round", rounds(rtp.play_round), CALL_COUNT, "round"),
+        Case("cashout.play_round_strategy_b", rounds(rtp._play_round_strategy_b), CALL_COUNT, "round"),
+    ]
+    for engine in ("scalar", "batch"):
+        for strategy in ("A", "B"):
+            for n in rounds_list:
+                def setup(engine=engine, strategy=strategy, n=n):
+                    return lambda: rtp.run_simulation(tables, n, seed=BENCH_SEED, strategy=strategy,
+                                                      engine=engine, precision=None)[2]
+                cases.append(Case(f"cashout.run_simulation.{engine}.{strategy}.{n}", setup, n, "round"))
+    return cases
+
+
+def _bust_it_cases():
+    import bust_it_deck_determination as deck
+    import bust_it_infinite_deck as infinite
+    import native_kernels
+    import rng_streams
+
+    def scalar_loop():
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                return infinite.simulate_infinite_deck_bust_it(BUST_IT_HANDS, BENCH_SEED)[0]
+        return run
+
+    def histogram(func):
+        def setup():
+            rng = np.random.default_rng(BENCH_SEED)
+            faces = rng.integers(0, len(infinite._FACE_VALUES), size=(BUST_IT_HANDS, infinite.CARDS_PER_HAND),
+                                 dtype=np.uint8)
+            cards = infinite._FACE_VALUES[faces]
+            return lambda: int(func(cards)[3:].sum())
+        return setup
+
+    def shard():
+        return lambda: int(infinite._simulate_shard(BUST_IT_HANDS, rng_streams.seed_sequence(BENCH_SEED, 0))[1].sum())
+
+    def deck_count(num_decks):
+        def setup():
+            seed_seq = rng_streams.seed_sequence(BENCH_SEED, num_decks)
+            return lambda: int(deck._simulate_deck_count(num_decks, BUST_IT_HANDS, seed_seq, deck.PAYOUTS,
+                                                         adaptive=False)[2].sum())
+        return setup
+
+    cases = [Case("bust_it.scalar_loop", scalar_loop, BUST_IT_HANDS, "hand")]
+    if native_kernels.available():
+        cases.append(Case("bust_it.histogram.native", histogram(native_kernels.bust_histogram), BUST_IT_HANDS, "hand"))
+    cases += [
+        Case("bust_it.histogram.numpy", histogram(infinite._bust_count_histogram_numpy), BUST_IT_HANDS, "hand"),
+        Case("bust_it.infinite_shard", shard, BUST_IT_HANDS, "hand"),
+        Case("bust_it.deck_count.8", deck_count(8), BUST_IT_HANDS, "hand"),
+    ]
+    return cases
+
+
+def build_cases(rounds_list):
+    rtp = _load_rtp_module()
+    return _cashout_cases(rtp, fixture_tables(), rounds_list) + _bust_it_cases()
+
+
+def _peak_memory(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(case, repeat=None, memory=True):
+    """執行單一基準：暖身一次、計時 repeat 次（工作量 ≥ HEAVY_UNITS 時預設 1 次），回傳結果 dict。"""
+    run = case.setup()
+    result = run()
+    if repeat is None:
+        repeat = 1 if case.units >= HEAVY_UNITS else BENCH_REPEAT
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    median = statistics.median(seconds)
+    return {
+        "name": case.name,
+        "unit": case.unit,
+        "units": case.units,
+        "repeat": repeat,
+        "seconds": seconds,
+        "median_s": median,
+        "per_call_us": median / case.units * 1e6,
+        "units_per_s": case.units / median if median else None,
+        "peak_memory_bytes": _peak_memory(run) if memory else None,
+        "result": float(result) if isinstance(result, (int, float, np.number)) else None,
+    }
+
+
+def _git(*args):
+    try:
+        out = subprocess.run(["git", *args], cwd=ROOT_DIR, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() if out.returncode == 0 else None
+
+
+def environment():
+    """執行環境與版本資訊（寫入 JSON 的 meta）。"""
+    import native_kernels
+    revision = _git("rev-parse", "--short", "HEAD")
+    return {
+        "revision": revision,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "seed": BENCH_SEED,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "native_kernels": native_kernels.available(),
+    }
+
+
+def default_output_path(meta):
+    name = meta["revision"] or "unknown"
+    if meta["dirty"]:
+        name += "-dirty"
+    return os.path.join(BENCH_OUTPUT_DIR, f"{name}.json")
+
+
+def write_results(path, meta, results):
+    """寫出 JSON（先寫暫存檔再改名）。"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def _format_memory(n):
+    return "-" if n is None else f"{n / 2 ** 20:.1f} MiB"
+
+
+def print_result(r):
+    print(f"  {r['name']:<42} {r['per_call_us']:10.3f} µs/{r['unit']:<5} {r['units_per_s']:14,.0f} {r['unit']}s/s"
+          f"  峰值 {_format_memory(r['peak_memory_bytes'])}")
+
+
+def compare(old_path, new_path, tolerance=BENCH_TOLERANCE):
+    """逐項比較兩份結果，印出延遲比值與記憶體變化；回傳變慢超過 tolerance 的項目名稱。"""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"舊: {old['meta'].get('revision')}（{old['meta'].get('timestamp')}）"
+          f" → 新: {new['meta'].get('revision')}（{new['meta'].get('timestamp')}）")
+    old_results = {r["name"]: r for r in old["results"]}
+    regressions = []
+    for r in new["results"]:
+        before = old_results.pop(r["name"], None)
+        if before is None:
+            print(f"  {r['name']:<42} （僅新結果有）")
+            continue
+        ratio = r["per_call_us"] / before["per_call_us"]
+        mark = ""
+        if ratio > 1 + tolerance:
+            mark = "  ← 變慢"
+            regressions.append(r["name"])
+        elif ratio < 1 - tolerance:
+            mark = "  ← 變快"
+        if before.get("result") is not None and r.get("result") is not None and before["result"] != r["result"]:
+            mark += "  （結果不同）"
+        print(f"  {r['name']:<42} {before['per_call_us']:10.3f} → {r['per_call_us']:10.3f} µs/{r['unit']:<5}"
+              f" ×{ratio:.2f}  峰值 {_format_memory(before.get('peak_memory_bytes'))}"
+              f" → {_format_memory(r.get('peak_memory_bytes'))}{mark}")
+    for name in old_results:
+        print(f"  {name:<42} （僅舊結果有）")
+    return regressions
+
+
+def _parse_rounds(text):
+    return [int(float(s)) for s in text.split(",") if s.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬熱點效能基準")
+    parser.add_argument("--only", action="append", default=[], help="只執行名稱含此片段的項目（可重複）")
+    parser.add_argument("--rounds", default=BENCH_ROUNDS, help="run_simulation 的局數，以逗號分隔")
+    parser.add_argument("--repeat", type=int, default=None, help="每項計時次數（預設輕量項目 BENCH_REPEAT、重量項目 1）")
+    parser.add_argument("--no-memory", action="store_true", help="不量測記憶體峰值")
+    parser.add_argument("--output", default=None, help="結果 JSON 路徑（預設 benchmark_results/<revision>.json）")
+    parser.add_argument("--list", action="store_true", help="列出所有項目後結束")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="比較兩份結果 JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+
+    cases = build_cases(_parse_rounds(args.rounds))
+    if args.only:
+        cases = [c for c in cases if any(part in c.name for part in args.only)]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return
+
+    meta = environment()
+    print(f"revision {meta['revision']}{'（未提交修改）' if meta['dirty'] else ''} | seed {BENCH_SEED}"
+          f" | native_kernels {'可用' if meta['native_kernels'] else '不可用'}")
+    results = []
+    for case in cases:
+        results.append(run_case(case, args.repeat, memory=not args.no_memory))
+        print_result(results[-1])
+    path = args.output or default_output_path(meta)
+    write_results(path, meta, results)
+    print(f"已寫出 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+/*
+ * Blackjack 熱點迴圈的 C 版本，由 native_kernels.py 在本機以 cc 編譯、ctypes 載入。
+ * 每個函式都與對應的 NumPy 實作逐位元相同（整數結果；金額以相同的 double 運算得出）。
+ *
+ *   bj_dealer_draw_out  對應 batch_engine.dealer_draw_out
+ *   bj_resolve_hands    對應 batch_engine._resolve_hands
+ *   bj_bust_histogram   對應 bust_it_infinite_deck.bust_count_histogram 的 NumPy 版
+ */
+#include <stdint.h>
+
+#define N_TOTALS 22
+#define N_UPCARDS 12
+#define BLOCK_HARD 0
+#define BLOCK_SOFT 1
+#define BLOCK_SPLIT 2
+#define MAX_BUST_COUNT 8
+
+/* 莊家（S17）自 total / soft_aces 起依序補 cards[0..slots)，回傳最終點數；n_cards 累加補牌張數。 */
+static int16_t draw_out(int16_t total, int soft_aces, const uint8_t *cards, int slots, int *n_cards)
+{
+    for (int j = 0; j < slots && total < 17; j++) {
+        int card = cards[j];
+        total += card;
+        if (card == 11)
+            soft_aces++;
+        if (total > 21 && soft_aces > 0) {
+            total -= 10;
+            soft_aces--;
+        }
+        (*n_cards)++;
+    }
+    return total;
+}
+
+void bj_dealer_draw_out(const uint8_t *upcard, const uint8_t *dealer_cards, int64_t n, int32_t slots,
+                        int16_t *out)
+{
+    for (int64_t i = 0; i < n; i++) {
+        int n_cards = 0;
+        int up = upcard[i];
+        out[i] = draw_out((int16_t)up, up == 11, dealer_cards + i * slots, slots, &n_cards);
+    }
+}
+
+void bj_resolve_hands(const uint8_t *c1, const uint8_t *c2, const uint8_t *upcard,
+                      const uint8_t *dealer_cards, int64_t n, int32_t slots,
+                      const double *values, double base_bet, double *returned, int64_t *hits)
+{
+    const double scale = base_bet / 100.0;
+    for (int64_t i = 0; i < n; i++) {
+        int a = c1[i], b = c2[i], up = upcard[i];
+        int total = a + b;
+        int aces = (a == 11) + (b == 11);
+        if (total > 21) {          /* A,A 計為軟 12 */
+            total -= 10;
+            aces--;
+        }
+        int is_soft = aces > 0;
+        int is_pair = a == b;
+        if (is_pair || is_soft || total < 17) {
+            int block = is_pair ? BLOCK_SPLIT : (is_soft ? BLOCK_SOFT : BLOCK_HARD);
+            int64_t flat = ((int64_t)block * N_TOTALS + total) * N_UPCARDS + up;
+            returned[i] = values[flat] * scale;
+            if (hits)
+                hits[flat]++;
+            continue;
+        }
+        int n_cards = 0;
+        int dealer = draw_out((int16_t)up, up == 11, dealer_cards + i * slots, slots, &n_cards);
+        if (dealer > 21 || total > dealer)
+            returned[i] = base_bet * 2.0;
+        else if (total == dealer)
+            returned[i] = base_bet;
+        else
+            returned[i] = 0.0;
+    }
+}
+
+void bj_bust_histogram(const uint8_t *cards, int64_t n, int32_t k, int64_t *hist)
+{
+    for (int64_t i = 0; i < n; i++) {
+        int n_cards = 0;
+        int16_t total = draw_out(0, 0, cards + i * k, k, &n_cards);
+        if (total > 21)
+            hist[n_cards < MAX_BUST_COUNT ? n_cards : MAX_BUST_COUNT]++;
+    }
+}
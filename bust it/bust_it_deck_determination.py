@@ -1,15 +1,63 @@
-import random
+import argparse
+import math
+import os
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def find_evolution_magic_number_precision(simulation_hands=20000000):
+import numpy as np
+
+# 專案根目錄放有共用模組（rng_streams.py、hand_state.py）
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import rng_streams
+from bust_it_exact import PAYOUTS, TARGET_RTP, bust_it_rtp, find_equivalent_decks
+from bust_it_infinite_deck import bust_count_histogram
+from hand_state import CARD_STRIDE, EMPTY, NEXT, TOTAL
+
+DECK_COUNTS_TO_TEST = list(range(1, 26))
+
+# 平行掃描：每個 worker 每次處理的手數；自適應模式每處理完一塊即檢查一次信賴區間
+CHUNK_HANDS = 1_000_000
+ADAPTIVE_MIN_HANDS = 2_000_000
+CONFIDENCE_Z = 3.0   # 約 99.7% 信賴區間
+_RANK_VALUES = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 11], dtype=np.uint8)
+_RANK_COUNTS_PER_DECK = np.array([4, 4, 4, 4, 4, 4, 4, 4, 16, 4], dtype=np.int32)
+
+
+def find_evolution_magic_number_exact(deck_counts=DECK_COUNTS_TO_TEST, payouts=PAYOUTS):
+    """各牌組數量的精確 RTP（毫秒級），回傳 {副牌數: RTP%}。"""
+    print("--- Evolution 逆向工程 (精確解模式) ---")
+    print("目標 RTP: 94.12% | 規則: S17 | 精確爆牌張數分佈（bust_it_exact）\n")
+    results = {}
+    for num_decks in deck_counts:
+        rtp = bust_it_rtp(num_decks, payouts)
+        results[num_decks] = rtp
+        diff = rtp - TARGET_RTP
+        sign = "+" if diff > 0 else ""
+        print(f"{num_decks:2d} Decks -> RTP: {rtp:.5f}% | 誤差: {sign}{diff:.4f}%")
+    best_deck = min(results, key=lambda d: abs(results[d] - TARGET_RTP))
+    print("-" * 50)
+    print(f"無限副牌理論值: {bust_it_rtp(None, payouts):.5f}%")
+    print(f"掃描範圍內最接近官方 94.12% 的模型是: {best_deck} 副牌")
+    decks, n = find_equivalent_decks(TARGET_RTP, payouts)
+    if decks is not None:
+        print(f"精確求根：RTP = 94.12% 的等效牌組數量為 {decks:.2f} 副（整數解 {n} 副）")
+    return results
+
+
+def find_evolution_magic_number_precision(simulation_hands=20000000, seed=None):
+    seed = rng_streams.make_seed(seed)
     print(f"--- 啟動 Evolution 逆向工程 (高精度狙擊模式) ---")
-    print(f"目標 RTP: 94.12% | 規則: S17 | 每組手數: {simulation_hands} (20M)")
+    print(f"目標 RTP: 94.12% | 規則: S17 | 每組手數: {simulation_hands} (20M) | seed: {seed}")
     print(f"說明：大幅增加手數以消除 250倍 大獎帶來的統計波動\n")
     
     # 我們鎖定 12 ~ 20 副牌這個區間進行地毯式搜索
-    deck_counts_to_test = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25]
+    deck_counts_to_test = DECK_COUNTS_TO_TEST
     
-    payouts = {3: 1, 4: 2, 5: 9, 6: 50, 7: 100, 8: 250}
+    payouts = PAYOUTS
     
     results = {}
 
@@ -22,8 +70,8 @@ def find_evolution_magic_number_precision(simulation_hands=20000000):
         
         total_return = 0
         
-        # 優化：提取 random.sample
-        sample_func = random.sample
+        # 優化：提取 random.sample（每個牌組數量各自一條亂數流）
+        sample_func = rng_streams.py_random(seed, "deck_sweep_single", num_decks).sample
         
         start_t = time.time()
         
@@ -35,24 +83,15 @@ def find_evolution_magic_number_precision(simulation_hands=20000000):
             for _ in range(chunk_size):
                 cards = sample_func(full_shoe, 12)
                 
-                hand_value = 0
+                state = EMPTY
                 card_count = 0
-                aces = 0
-                idx = 0
                 
-                # S17 邏輯
-                while hand_value < 17:
-                    card = cards[idx]
-                    idx += 1
+                # S17 邏輯：每張牌查一次 hand_state 轉移表
+                while TOTAL[state] < 17:
+                    state = NEXT[state * CARD_STRIDE + cards[card_count]]
                     card_count += 1
-                    hand_value += card
-                    if card == 11:
-                        aces += 1
-                    while hand_value > 21 and aces > 0:
-                        hand_value -= 10
-                        aces -= 1
                 
-                if hand_value > 21:
+                if TOTAL[state] > 21:
                     final_count = card_count if card_count < 8 else 8
                     total_return += (1 + payouts[final_count])
         
@@ -83,5 +122,101 @@ def find_evolution_magic_number_precision(simulation_hands=20000000):
     print(f"最接近官方 94.12% 的模型是: {best_deck} 副牌")
     print(f"(這代表 Evo 的數學模型將 '洗牌機延遲' 等效為了 {best_deck} 副牌的厚度)")
 
+def _deal_without_replacement(rng, n_hands, num_decks, k=12):
+    """每手自完整 num_decks 副牌無放回抽 k 張（等同 random.sample(full_shoe, k)），回傳 (n_hands, k) 牌值。"""
+    remaining = int(_RANK_COUNTS_PER_DECK.sum()) * num_decks
+    cum = np.tile(np.cumsum(_RANK_COUNTS_PER_DECK * num_decks), (n_hands, 1))
+    out = np.empty((n_hands, k), dtype=np.uint8)
+    for j in range(k):
+        r = rng.integers(0, remaining - j, size=n_hands)
+        above = cum > r[:, None]
+        rank = len(_RANK_VALUES) - above.sum(axis=1)
+        cum -= above
+        out[:, j] = _RANK_VALUES[rank]
+    return out
+
+
+def _rtp_interval(hist, n_hands, payouts, z=CONFIDENCE_Z):
+    """由爆牌張數直方圖計算 (RTP%, 信賴區間半寬%)。"""
+    pay = np.array([1 + payouts.get(k, 0) if k >= 3 else 0 for k in range(len(hist))], dtype=np.float64)
+    mean = float((hist * pay).sum()) / n_hands
+    second = float((hist * pay ** 2).sum()) / n_hands
+    se = math.sqrt(max(second - mean * mean, 0.0) / n_hands)
+    return mean * 100, z * se * 100
+
+
+def _simulate_deck_count(num_decks, max_hands, seed_seq, payouts, adaptive, target=TARGET_RTP):
+    """
+    worker：模擬單一牌組數量。adaptive=True 時，一旦信賴區間不再涵蓋 target 即提前停止。
+    回傳 (num_decks, 已模擬手數, 直方圖, 耗時秒數)。
+    """
+    rng = np.random.default_rng(seed_seq)
+    hist = np.zeros(9, dtype=np.int64)
+    done = 0
+    start_t = time.time()
+    while done < max_hands:
+        n = min(CHUNK_HANDS, max_hands - done)
+        hist += bust_count_histogram(_deal_without_replacement(rng, n, num_decks))
+        done += n
+        if adaptive and done >= ADAPTIVE_MIN_HANDS:
+            rtp, half = _rtp_interval(hist, done, payouts)
+            if abs(rtp - target) > half:
+                break
+    return num_decks, done, hist, time.time() - start_t
+
+
+def find_evolution_magic_number_parallel(simulation_hands=20000000, workers=None, seed=None,
+                                         adaptive=False, deck_counts=DECK_COUNTS_TO_TEST, payouts=PAYOUTS):
+    """
+    平行版牌組掃描：各牌組數量在行程池中同時模擬，完成一個就印出一個。
+    adaptive=True 時信賴區間一旦排除 94.12% 即停止該牌組的抽樣。回傳 {副牌數: RTP%}。
+    """
+    workers = workers or os.cpu_count() or 1
+    seed = rng_streams.make_seed(seed)
+    seeds = [rng_streams.seed_sequence(seed, i) for i in range(len(deck_counts))]
+    mode = "自適應" if adaptive else "固定手數"
+    print(f"--- Evolution 逆向工程 (平行掃描，{mode}) ---")
+    print(f"目標 RTP: {TARGET_RTP}% | 每組最多手數: {simulation_hands} | workers: {workers} | seed: {seed}\n")
+
+    results = {}
+    hands_used = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_simulate_deck_count, d, simulation_hands, s, payouts, adaptive)
+            for d, s in zip(deck_counts, seeds)
+        ]
+        for fut in as_completed(futures):
+            num_decks, n_hands, hist, elapsed = fut.result()
+            rtp, half = _rtp_interval(hist, n_hands, payouts)
+            results[num_decks] = rtp
+            hands_used += n_hands
+            diff = rtp - TARGET_RTP
+            sign = "+" if diff > 0 else ""
+            print(f"{num_decks:2d} 副牌完成! RTP: {rtp:.5f}% ± {half:.4f}% | 誤差: {sign}{diff:.4f}% "
+                  f"| 手數: {n_hands} | 耗時: {elapsed:.1f}s")
+
+    print("\n" + "="*50)
+    best_deck = min(results, key=lambda d: abs(results[d] - TARGET_RTP))
+    for d in sorted(results):
+        print(f"{d:2d} Decks -> RTP: {results[d]:.5f}%")
+    print("-" * 50)
+    print(f"總模擬手數: {hands_used}（上限 {simulation_hands * len(deck_counts)}）")
+    print(f"最接近官方 94.12% 的模型是: {best_deck} 副牌")
+    return results
+
+
 if __name__ == "__main__":
-    find_evolution_magic_number_precision(20000000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Bust It 牌組數量掃描")
+    parser.add_argument("--simulate", action="store_true", help="以蒙地卡羅抽牌交叉驗證（預設使用精確解）")
+    parser.add_argument("--hands", type=int, default=20000000, help="每組牌數最多模擬手數")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="平行 worker 數（預設為 CPU 核心數）；0 表示原始逐組單核心掃描")
+    parser.add_argument("--adaptive", action="store_true", help="信賴區間排除 94.12%% 即提前停止該組")
+    parser.add_argument("--seed", type=int, default=None, help="亂數種子（rng_streams），用於重現結果")
+    args = parser.parse_args()
+    if not args.simulate:
+        find_evolution_magic_number_exact()
+    elif args.workers == 0:
+        find_evolution_magic_number_precision(args.hands, args.seed)
+    else:
+        find_evolution_magic_number_parallel(args.hands, args.workers, args.seed, args.adaptive)
\ No newline at end of file
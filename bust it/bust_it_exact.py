@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Bust It 側注的精確 RTP（不抽樣）。
+
+莊家爆牌張數分佈取自 dealer_probability：以 (點數, 軟 A 張數, 張數) 為狀態遞迴列舉莊家補牌，
+無限副牌以單副牌權重（每張 4/52、10 點 16/52）計算，有限牌組則連同剩餘牌組一起記憶化。
+任意賠率表的 RTP 只是爆牌機率的加權和，每次查詢在毫秒級完成；牌組數量因此可以精確求根。
+"""
+import os
+import sys
+
+# 專案根目錄放有共用模組（dealer_probability.py）
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import dealer_probability
+
+PAYOUTS = {3: 1, 4: 2, 5: 9, 6: 50, 7: 100, 8: 250}
+TARGET_RTP = 94.12
+# 求根時牌組數量的搜尋上限（再多副牌已與無限副牌差距 < 0.001%）
+MAX_DECKS = 4096
+
+
+def bust_probabilities(num_decks=None, max_count=8):
+    """
+    莊家以 k 張牌爆牌的精確機率，回傳 {k: 機率}，k = 3..max_count（max_count 為「以上」合併）。
+    num_decks=None 為無限副牌。
+    """
+    bust_by_cards = dealer_probability.dealer_outcome(None, num_decks).bust_by_cards
+    probs = {k: 0.0 for k in range(3, max_count + 1)}
+    for count, p in enumerate(bust_by_cards):
+        if p:
+            probs[min(count, max_count)] += p
+    return probs
+
+
+def bust_it_rtp(num_decks=None, payouts=PAYOUTS):
+    """賠率表 payouts（{爆牌張數: 賠率}，最大鍵代表「以上」）下的精確 RTP%。"""
+    max_count = max(payouts)
+    probs = bust_probabilities(num_decks, max_count)
+    return sum(p * (1 + payouts.get(k, 0)) for k, p in probs.items()) * 100
+
+
+def find_equivalent_decks(target=TARGET_RTP, payouts=PAYOUTS, max_decks=MAX_DECKS):
+    """
+    找出 RTP 恰為 target 的等效牌組數量（RTP 隨副牌數單調上升）。
+    以整數二分搜尋找到 rtp(n-1) < target <= rtp(n)，再於兩者之間線性內插。
+    回傳 (等效副牌數（浮點）, n)；target 高於無限副牌極限時回傳 (None, None)。
+    """
+    if target > bust_it_rtp(None, payouts):
+        return None, None
+    if bust_it_rtp(1, payouts) >= target:
+        return 1.0, 1
+    lo, hi = 1, 2
+    while bust_it_rtp(hi, payouts) < target:
+        lo, hi = hi, hi * 2
+        if hi > max_decks:
+            return None, None
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if bust_it_rtp(mid, payouts) < target:
+            lo = mid
+        else:
+            hi = mid
+    r_lo, r_hi = bust_it_rtp(lo, payouts), bust_it_rtp(hi, payouts)
+    return lo + (target - r_lo) / (r_hi - r_lo), hi
+
+
+def print_paytable(num_decks=None, payouts=PAYOUTS):
+    """印出與 README 3.1 節相同格式的爆牌機率與 RTP 貢獻表。"""
+    max_count = max(payouts)
+    probs = bust_probabilities(num_decks, max_count)
+    label = "無限副牌" if num_decks is None else f"{num_decks} 副牌"
+    print(f"=== {label} 精確爆牌分佈 ===")
+    print("| 爆牌張數 | 機率 | 賠率 | 貢獻 RTP |")
+    total_p = 0.0
+    total_rtp = 0.0
+    for k, p in probs.items():
+        name = f"{k} Cards" if k < max_count else f"{k}+ Cards"
+        contrib = p * (1 + payouts.get(k, 0)) * 100
+        total_p += p
+        total_rtp += contrib
+        print(f"| {name} | {p * 100:.4f}% | {payouts.get(k, 0)}:1 | {contrib:.2f}% |")
+    print(f"| Total | {total_p * 100:.4f}% | | {total_rtp:.4f}% |")
+
+
+if __name__ == "__main__":
+    print_paytable(None)
+    print_paytable(8)
+    decks, n = find_equivalent_decks()
+    if decks is None:
+        print(f"\n{TARGET_RTP}% 高於無限副牌極限，找不到等效牌組數量")
+    else:
+        print(f"\nRTP = {TARGET_RTP}% 的等效牌組數量: {decks:.2f} 副（整數解 {n} 副: {bust_it_rtp(n):.5f}%）")
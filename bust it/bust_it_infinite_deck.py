@@ -1,10 +1,49 @@
-import random
+import argparse
+import os
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def simulate_infinite_deck_bust_it(num_simulations=50000000):
+import numpy as np
+
+# 專案根目錄放有共用模組（hand_state.py）
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import checkpoint
+import native_kernels
+import rng_streams
+from hand_state import CARD_STRIDE, COUNT_TABLE, EMPTY, NEXT, NEXT_TABLE, TOTAL, TOTAL_TABLE
+
+PAYOUTS = {3: 1, 4: 2, 5: 9, 6: 50, 7: 100, 8: 250}
+
+# 平行模式：手數切成固定大小的分片，第 i 片使用 rng_streams.seed_sequence(seed, i) 的獨立亂數流，
+# 因此同一個 seed 不論幾個 worker 結果都相同，任一分片也可用 _simulate_shard 單獨重播
+SHARD_HANDS = 10_000_000
+CHUNK_HANDS = 1_000_000
+CARDS_PER_HAND = 12
+_FACE_VALUES = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11], dtype=np.uint8)
+
+# 檢查點（見專案根目錄 checkpoint.py）：單核心迴圈每 CHECKPOINT_HANDS 手、平行模式每完成一個分片寫一次；
+# --checkpoint 指定檔案路徑，--resume 自該檔續跑（亂數狀態一併還原，結果與不中斷執行相同）
+CHECKPOINT_HANDS = int(float(os.environ.get("BUST_IT_CHECKPOINT_HANDS", "5000000")))
+
+def simulate_infinite_deck_bust_it(num_simulations=50000000, seed=None, checkpoint_path=None, resume=False,
+                                   checkpoint_hands=CHECKPOINT_HANDS):
+    # 檢查點記錄 total_return、bust_counts、已完成的百萬手段數與 random.Random 狀態；續跑未指定 seed 時沿用檢查點的
+    if checkpoint_path and resume and seed is None:
+        seed = (checkpoint.saved_params(checkpoint_path) or {}).get("seed")
+    seed = rng_streams.make_seed(seed)
+    ckpt = restored = None
+    if checkpoint_path:
+        ckpt = checkpoint.Checkpointer(checkpoint_path, "bust_it_single",
+                                       {"seed": seed, "num_simulations": num_simulations}, checkpoint_hands)
+        if resume:
+            restored = ckpt.load()
     print(f"--- 啟動終極驗證：無限副牌模型 (Infinite Deck) ---")
     print(f"假設：官方 94.12% 是基於無限牌組計算的")
-    print(f"模擬手數: {num_simulations} (50M) | 規則: S17")
+    print(f"模擬手數: {num_simulations} (50M) | 規則: S17 | seed: {seed}")
     
     start_time = time.time()
     
@@ -13,6 +52,7 @@ def simulate_infinite_deck_bust_it(num_simulations=50000000):
     
     total_return = 0
     bust_counts = {k: 0 for k in range(3, 10)}
+    start_chunk = 0
     
     # 無限副牌模型：
     # 不需要建立 massive shoe，只需要定義單副牌的結構
@@ -21,12 +61,21 @@ def simulate_infinite_deck_bust_it(num_simulations=50000000):
     
     # 優化：直接使用 random.choices (有放回抽樣)
     # 這比 random.sample (無放回) 快且符合無限牌定義
-    choices_func = random.choices
+    rng = rng_streams.py_random(seed, "bust_it_single")
+    choices_func = rng.choices
     
     # 為了進度顯示
     chunk_size = 1000000 
+
+    if restored is not None:
+        state, _ = restored
+        total_return = state["total_return"]
+        bust_counts = {int(k): v for k, v in state["bust_counts"].items()}
+        start_chunk = state["chunks"]
+        checkpoint.set_py_random_state(rng, state["rng"])
+        print(f"自檢查點 {checkpoint_path} 續跑：已完成 {start_chunk * chunk_size} 手")
     
-    for i in range(num_simulations // chunk_size):
+    for i in range(start_chunk, num_simulations // chunk_size):
         # 顯示進度
         if i % 5 == 0 and i > 0:
              current_rtp = (total_return / (i * chunk_size)) * 100
@@ -36,28 +85,25 @@ def simulate_infinite_deck_bust_it(num_simulations=50000000):
             # 核心差異：choices (無限牌)
             cards = choices_func(single_deck_cards, k=12)
             
-            hand_value = 0
+            state = EMPTY
             card_count = 0
-            aces = 0
-            idx = 0
             
-            # S17 邏輯
-            while hand_value < 17:
-                card = cards[idx]
-                idx += 1
+            # S17 邏輯：每張牌查一次 hand_state 轉移表
+            while TOTAL[state] < 17:
+                state = NEXT[state * CARD_STRIDE + cards[card_count]]
                 card_count += 1
-                hand_value += card
-                if card == 11:
-                    aces += 1
-                while hand_value > 21 and aces > 0:
-                    hand_value -= 10
-                    aces -= 1
             
-            if hand_value > 21:
+            if TOTAL[state] > 21:
                 final_count = card_count if card_count < 8 else 8
                 bust_counts[final_count] += 1
                 total_return += (1 + payouts[final_count])
 
+        if ckpt is not None and ckpt.due((i + 1) * chunk_size):
+            _save_single_checkpoint(ckpt, i + 1, chunk_size, total_return, bust_counts, rng)
+
+    if ckpt is not None and ckpt.last < (num_simulations // chunk_size) * chunk_size:
+        _save_single_checkpoint(ckpt, num_simulations // chunk_size, chunk_size, total_return, bust_counts, rng)
+
     final_rtp = (total_return / num_simulations) * 100
     
     print("\n" + "="*50)
@@ -73,7 +119,130 @@ def simulate_infinite_deck_bust_it(num_simulations=50000000):
         label = f"{c} 張" if c < 8 else "8+ 張"
         prob = (bust_counts[c] / num_simulations)
         print(f"  {label}: {prob:.6f}")
+    return final_rtp, bust_counts, seed
+
+def _save_single_checkpoint(ckpt, chunks, chunk_size, total_return, bust_counts, rng):
+    state = {"chunks": chunks, "total_return": total_return,
+             "bust_counts": {str(k): v for k, v in bust_counts.items()},
+             "rng": checkpoint.py_random_state(rng)}
+    ckpt.save(chunks * chunk_size, state)
+
+
+def bust_count_histogram(cards):
+    """
+    向量化 S17 莊家補牌：cards 為 (n, 12) 牌值陣列，每列依序為莊家的牌。
+    回傳長度 9 的 int64 陣列，索引 k 為以 k 張爆牌的手數（8 張以上計入 8）。
+    C 後端（native_kernels）可用時改走編譯版，結果逐位元相同。
+    """
+    hist = native_kernels.bust_histogram(cards)
+    if hist is not None:
+        return hist
+    return _bust_count_histogram_numpy(cards)
+
+
+def _bust_count_histogram_numpy(cards):
+    state = np.full(cards.shape[0], EMPTY, dtype=np.int16)
+    for j in range(cards.shape[1]):
+        active = TOTAL_TABLE[state] < 17
+        if not active.any():
+            break
+        # 每張牌一次 (狀態, 牌值) 查表，取代逐項更新點數 / 軟 A / 張數
+        state = np.where(active, NEXT_TABLE[state, cards[:, j]], state)
+    final_count = np.minimum(COUNT_TABLE[state[TOTAL_TABLE[state] > 21]], 8)
+    return np.bincount(final_count, minlength=9).astype(np.int64)
+
+
+def _simulate_shard(n_hands, seed_seq):
+    """worker：以 seed_seq 的獨立亂數流模擬 n_hands 手無限副牌，回傳 (n_hands, 爆牌張數直方圖)。"""
+    rng = np.random.default_rng(seed_seq)
+    hist = np.zeros(9, dtype=np.int64)
+    done = 0
+    while done < n_hands:
+        n = min(CHUNK_HANDS, n_hands - done)
+        faces = rng.integers(0, len(_FACE_VALUES), size=(n, CARDS_PER_HAND), dtype=np.uint8)
+        hist += bust_count_histogram(_FACE_VALUES[faces])
+        done += n
+    return n_hands, hist
+
+
+def simulate_infinite_deck_bust_it_parallel(num_simulations, workers=None, seed=None, checkpoint_path=None,
+                                            resume=False):
+    """
+    多核心版無限副牌模擬：切成 SHARD_HANDS 手的分片分派給 worker 行程，合併爆牌計數與總回報（整數，完全精確）。
+    seed 為 None 時自動產生並印出，以便重現。回傳 (RTP%, bust_counts, seed)。
+    checkpoint_path 指定時每完成一個分片即記錄已完成的分片與合併後的直方圖；resume=True 時只補跑其餘分片。
+    """
+    workers = workers or os.cpu_count() or 1
+    if checkpoint_path and resume and seed is None:
+        seed = (checkpoint.saved_params(checkpoint_path) or {}).get("seed")
+    seed = rng_streams.make_seed(seed)
+    n_shards = -(-num_simulations // SHARD_HANDS)
+    shard_sizes = [min(SHARD_HANDS, num_simulations - i * SHARD_HANDS) for i in range(n_shards)]
+    seeds = [rng_streams.seed_sequence(seed, i) for i in range(n_shards)]
+
+    print(f"--- 無限副牌模型 (Infinite Deck)：平行模式 ---")
+    print(f"模擬手數: {num_simulations} | workers: {workers} | 分片: {n_shards} | seed: {seed}")
+    start_time = time.time()
+
+    hist = np.zeros(9, dtype=np.int64)
+    done = 0
+    finished = set()
+    ckpt = None
+    if checkpoint_path:
+        # 分片各自獨立，檢查點只需已完成的分片編號與直方圖；每個分片只寫一次，不受 CHECKPOINT_HANDS 限制
+        ckpt = checkpoint.Checkpointer(checkpoint_path, "bust_it_shards",
+                                       {"seed": seed, "num_simulations": num_simulations,
+                                        "shard_hands": SHARD_HANDS}, every=1)
+        restored = ckpt.load() if resume else None
+        if restored is not None:
+            state, arrays = restored
+            finished = set(state["shards"])
+            hist += arrays["hist"]
+            done = sum(shard_sizes[i] for i in finished)
+            print(f"自檢查點 {checkpoint_path} 續跑：已完成 {len(finished)} / {n_shards} 個分片（{done} 手）")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_simulate_shard, n, s): i
+                   for i, (n, s) in enumerate(zip(shard_sizes, seeds)) if i not in finished}
+        for fut in as_completed(futures):
+            n, shard_hist = fut.result()
+            hist += shard_hist
+            done += n
+            finished.add(futures[fut])
+            if ckpt is not None:
+                ckpt.save(done, {"shards": sorted(finished)}, {"hist": hist})
+            current_rtp = sum(int(hist[k]) * (1 + PAYOUTS[k]) for k in PAYOUTS) / done * 100
+            print(f"進度: {done // 1000000}M / {num_simulations // 1000000}M | 當前 RTP: {current_rtp:.4f}%")
+
+    bust_counts = {k: int(hist[k]) if k < len(hist) else 0 for k in range(3, 10)}
+    total_return = sum(bust_counts[k] * (1 + PAYOUTS[k]) for k in PAYOUTS)
+    final_rtp = (total_return / num_simulations) * 100
+
+    print("\n" + "="*50)
+    print(f"無限副牌模擬結束（耗時 {time.time() - start_time:.1f}s）")
+    print(f"最終 RTP: {final_rtp:.5f}%")
+    print(f"官方 RTP: 94.12%")
+    print(f"誤差: {final_rtp - 94.12:.5f}%")
+    print("="*50)
+    print("詳細機率分佈 (Infinite Deck Probabilities):")
+    for c in range(3, 9):
+        label = f"{c} 張" if c < 8 else "8+ 張"
+        print(f"  {label}: {bust_counts[c] / num_simulations:.6f}")
+    return final_rtp, bust_counts, seed
+
 
 if __name__ == "__main__":
-    # 跑 5000 萬次，這會給出非常穩定的無限牌數值
-    simulate_infinite_deck_bust_it(1000000000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Bust It 無限副牌 RTP 模擬")
+    parser.add_argument("--hands", type=int, default=1000000000, help="模擬手數（預設 10 億）")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker 行程數（預設為 CPU 核心數）；0 表示使用原始單核心迴圈")
+    parser.add_argument("--seed", type=int, default=None, help="亂數種子（rng_streams），用於重現結果")
+    parser.add_argument("--checkpoint", default=None, help="檢查點檔案路徑（.npz），定期寫入以便中斷後續跑")
+    parser.add_argument("--resume", action="store_true", help="自 --checkpoint 指定的檔案續跑（未指定 --seed 時沿用其 seed）")
+    args = parser.parse_args()
+    if args.resume and not args.checkpoint:
+        parser.error("--resume 需要同時指定 --checkpoint")
+    if args.workers == 0:
+        simulate_infinite_deck_bust_it(args.hands, args.seed, args.checkpoint, args.resume)
+    else:
+        simulate_infinite_deck_bust_it_parallel(args.hands, args.workers, args.seed, args.checkpoint, args.resume)
\ No newline at end of file
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+向量化批次 RTP 引擎：一次以 NumPy 陣列處理整批牌局（預設每批 100 萬局），
+回傳與 run_simulation 相同的 (總拿回金額, 總下注金額, RTP%)，策略 A / B 規則與「cash out RTP.py」一致。
+
+牌局模型：每局從一副完整的 num_decks 副牌靴「無放回」抽牌（等同連續洗牌機 CSM，每局獨立）；
+num_decks=None 為無限副牌（有放回）。逐局引擎使用的是低於 52 張才洗牌的連續牌靴，兩者 RTP 差異極小。
+
+每局的牌以固定牌位排成一列（見 SLOT_*），同一批牌可重複餵給不同策略或不同兌現表。
+莊家補牌與單手結算在 C 後端可用時改走 native_kernels（結果逐位元相同），否則使用本檔的 NumPy 實作。
+"""
+import numpy as np
+
+import native_kernels
+import rng_streams
+import round_log
+from cashout_lookup import BLOCK_HARD, BLOCK_SOFT, BLOCK_SPLIT, N_TOTALS, N_UPCARDS, get_lookup
+from rtp_stats import RatioStats
+
+BASE_BET = 100
+DEFAULT_BATCH_SIZE = 1_000_000
+
+# 牌值 2..10、A(11)；每副牌各點數張數（10 點含 J/Q/K 共 16 張）
+CARD_VALUES = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 11], dtype=np.int8)
+RANK_COUNTS_PER_DECK = np.array([4, 4, 4, 4, 4, 4, 4, 4, 16, 4], dtype=np.int16)
+# 無限副牌：13 種牌面等機率
+_FACE_VALUES = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11], dtype=np.int8)
+
+# --- 每局固定牌位 ---
+# 莊家手牌最多 12 張（含明牌），故暗牌 + 補牌最多 11 張
+DEALER_SLOTS = 11
+SLOT_P1, SLOT_P2, SLOT_UP = 0, 1, 2
+SLOT_DEALER_A = 3                                # 策略 A / 分牌第一手的莊家暗牌與補牌
+SLOT_SPLIT_1 = SLOT_DEALER_A + DEALER_SLOTS      # 分牌後第一手補的牌
+SLOT_SPLIT_2 = SLOT_SPLIT_1 + 1                  # 分牌後第二手補的牌
+SLOT_DEALER_B = SLOT_SPLIT_2 + 1                 # 分牌第二手比牌時的莊家暗牌與補牌
+CARDS_PER_ROUND = SLOT_DEALER_B + DEALER_SLOTS
+
+
+def deal_cards(rng, n_rounds, num_decks=8):
+    """
+    產生 n_rounds 局的牌，回傳 uint8 陣列 (n_rounds, CARDS_PER_ROUND)，值為 2..11。
+    num_decks=None 為無限副牌；否則每局自完整的 num_decks 副牌無放回抽出。
+    """
+    if num_decks is None:
+        faces = rng.integers(0, len(_FACE_VALUES), size=(n_rounds, CARDS_PER_ROUND), dtype=np.uint8)
+        return _FACE_VALUES.astype(np.uint8)[faces]
+
+    remaining = int(RANK_COUNTS_PER_DECK.sum()) * num_decks
+    dtype = np.int16 if remaining < np.iinfo(np.int16).max else np.int32
+    # 各列維護「累積張數」，抽到第 k 種點數時，k 之後的累積值各減 1
+    cum = np.tile(np.cumsum(RANK_COUNTS_PER_DECK * num_decks).astype(dtype), (n_rounds, 1))
+    out = np.empty((n_rounds, CARDS_PER_ROUND), dtype=np.uint8)
+    for j in range(CARDS_PER_ROUND):
+        r = rng.integers(0, remaining - j, size=n_rounds, dtype=dtype)
+        above = cum > r[:, None]
+        rank = len(CARD_VALUES) - above.sum(axis=1, dtype=np.int8)
+        cum -= above
+        out[:, j] = CARD_VALUES[rank]
+    return out
+
+
+def _two_card_hand(c1, c2):
+    """兩張牌的 (點數, 是否軟牌)；A,A 計為軟 12。"""
+    total = c1.astype(np.int16) + c2
+    aces = (c1 == 11).astype(np.int8) + (c2 == 11)
+    double_ace = total > 21
+    total = np.where(double_ace, total - 10, total)
+    aces = np.where(double_ace, aces - 1, aces)
+    return total, aces > 0
+
+
+def dealer_draw_out(upcard, dealer_cards):
+    """
+    向量化莊家補牌（軟 17 停牌）。upcard: (n,) 明牌；dealer_cards: (n, DEALER_SLOTS) 依序為暗牌與補牌。
+    回傳莊家最終點數 (n,)，> 21 為爆牌。
+    """
+    out = native_kernels.dealer_draw_out(upcard, dealer_cards)
+    if out is not None:
+        return out
+    return _dealer_draw_out_numpy(upcard, dealer_cards)
+
+
+def _dealer_draw_out_numpy(upcard, dealer_cards):
+    total = upcard.astype(np.int16)
+    soft_aces = (upcard == 11).astype(np.int8)
+    for j in range(dealer_cards.shape[1]):
+        active = total < 17
+        if not active.any():
+            break
+        card = dealer_cards[:, j]
+        total = np.where(active, total + card, total)
+        soft_aces = np.where(active & (card == 11), soft_aces + 1, soft_aces)
+        demote = (total > 21) & (soft_aces > 0)
+        total = np.where(demote, total - 10, total)
+        soft_aces = np.where(demote, soft_aces - 1, soft_aces)
+    return total
+
+
+def _resolve_hands(c1, c2, upcard, dealer_cards, values, base_bet, hits=None):
+    """
+    單手「可兌現就兌現、否則與莊家比牌」的向量化版本（對應 _resolve_single_hand / play_round 非 BJ 分支）。
+    回傳每手拿回金額 (n,) float64。
+    hits: 選配 (3 * 22 * 12,) int64 陣列，累加每格被兌現的次數（攤平索引同 CashoutLookup.flat_index）。
+    """
+    returned = native_kernels.resolve_hands(c1, c2, upcard, dealer_cards, values, base_bet, hits)
+    if returned is not None:
+        return returned
+    return _resolve_hands_numpy(c1, c2, upcard, dealer_cards, values, base_bet, hits)
+
+
+def _resolve_hands_numpy(c1, c2, upcard, dealer_cards, values, base_bet, hits=None):
+    total, is_soft = _two_card_hand(c1, c2)
+    is_pair = c1 == c2
+    can_cash = is_pair | is_soft | (total < 17)
+    block = np.where(is_pair, BLOCK_SPLIT, np.where(is_soft, BLOCK_SOFT, BLOCK_HARD))
+    returned = values[block, total, upcard] * (base_bet / 100.0)
+    if hits is not None:
+        flat = (block[can_cash] * N_TOTALS + total[can_cash]) * N_UPCARDS + upcard[can_cash]
+        hits += np.bincount(flat, minlength=hits.size)
+
+    # 硬 17+：僅對需要比牌的手做莊家補牌
+    stand = np.flatnonzero(~can_cash)
+    if stand.size:
+        dealer_final = _dealer_draw_out_numpy(upcard[stand], dealer_cards[stand])
+        player = total[stand]
+        win = (dealer_final > 21) | (player > dealer_final)
+        push = player == dealer_final
+        returned[stand] = np.where(win, base_bet * 2.0, np.where(push, float(base_bet), 0.0))
+    return returned
+
+
+def _hand_records(c1, c2, upcard, returned, base_bet, extra_flags=0):
+    """每手一筆 round_log 紀錄（點數、軟/對子/比牌旗標、兌現格）；BJ 手不兌現也不比牌。"""
+    total, is_soft = _two_card_hand(c1, c2)
+    is_pair = c1 == c2
+    can_cash = is_pair | is_soft | (total < 17)
+    if extra_flags & round_log.FLAG_BLACKJACK:
+        cell = np.full(total.shape, -1)
+        flags = (is_soft * round_log.FLAG_SOFT) | extra_flags
+        return round_log.make_records(upcard, total, flags, cell, returned, base_bet)
+    block = np.where(is_pair, BLOCK_SPLIT, np.where(is_soft, BLOCK_SOFT, BLOCK_HARD))
+    cell = np.where(can_cash, (block * N_TOTALS + total) * N_UPCARDS + upcard, -1)
+    flags = (is_soft * round_log.FLAG_SOFT) | (is_pair * round_log.FLAG_PAIR) \
+        | (~can_cash * round_log.FLAG_STAND) | extra_flags
+    return round_log.make_records(upcard, total, flags, cell, returned, base_bet)
+
+
+def evaluate_batch(cards, values, strategy='A', base_bet=BASE_BET, hits=None, sink=None):
+    """
+    以固定牌位的 cards 計算每局結果，回傳 (拿回金額 (n,), 下注金額 (n,))，皆為 float64。
+    values 為 CashoutLookup.values（(3, 22, 12) 陣列，單位為每 100 元注金）。
+    hits: 選配，累加每格兌現次數（見 _resolve_hands）。
+    sink: 選配 round_log.RoundLogWriter，依局序寫入每手紀錄。
+    """
+    p1 = cards[:, SLOT_P1]
+    p2 = cards[:, SLOT_P2]
+    upcard = cards[:, SLOT_UP]
+    dealer_a = cards[:, SLOT_DEALER_A:SLOT_DEALER_A + DEALER_SLOTS]
+    n = cards.shape[0]
+
+    total, _ = _two_card_hand(p1, p2)
+    is_bj = total == 21
+    dealer_bj = (upcard.astype(np.int16) + dealer_a[:, 0]) == 21
+    bj_return = np.where(dealer_bj, float(base_bet), base_bet * 2.5)
+
+    returned = np.empty(n, dtype=np.float64)
+    bet = np.full(n, float(base_bet))
+    returned[is_bj] = bj_return[is_bj]
+    logged = []   # (局索引, 手序, 紀錄)
+
+    if strategy == 'A':
+        rest = np.flatnonzero(~is_bj)
+    else:
+        is_split = (p1 == p2) & ~is_bj
+        rest = np.flatnonzero(~is_bj & ~is_split)
+        split = np.flatnonzero(is_split)
+        if split.size:
+            up_s = upcard[split]
+            r1 = _resolve_hands(p1[split], cards[split, SLOT_SPLIT_1], up_s,
+                                dealer_a[split], values, base_bet, hits)
+            r2 = _resolve_hands(p2[split], cards[split, SLOT_SPLIT_2], up_s,
+                                cards[split, SLOT_DEALER_B:SLOT_DEALER_B + DEALER_SLOTS], values, base_bet, hits)
+            returned[split] = r1 + r2
+            bet[split] = 2.0 * base_bet
+            if sink is not None:
+                logged.append((split, 0, _hand_records(p1[split], cards[split, SLOT_SPLIT_1], up_s, r1, base_bet,
+                                                       round_log.FLAG_SPLIT)))
+                logged.append((split, 1, _hand_records(p2[split], cards[split, SLOT_SPLIT_2], up_s, r2, base_bet,
+                                                       round_log.FLAG_SPLIT | round_log.FLAG_SPLIT_SECOND)))
+
+    if rest.size:
+        returned[rest] = _resolve_hands(p1[rest], p2[rest], upcard[rest], dealer_a[rest], values, base_bet, hits)
+    if sink is not None:
+        if rest.size:
+            logged.append((rest, 0, _hand_records(p1[rest], p2[rest], upcard[rest], returned[rest], base_bet)))
+        bj = np.flatnonzero(is_bj)
+        if bj.size:
+            logged.append((bj, 0, _hand_records(p1[bj], p2[bj], upcard[bj], returned[bj], base_bet,
+                                                round_log.FLAG_BLACKJACK)))
+        _write_in_round_order(sink, logged)
+    return returned, bet
+
+
+def _write_in_round_order(sink, logged):
+    if not logged:
+        return
+    order_key = np.concatenate([idx * 2 + hand for idx, hand, _ in logged])
+    records = np.concatenate([rec for _, _, rec in logged])
+    sink.append(records[np.argsort(order_key, kind="stable")])
+
+
+def batch_rng(seed, strategy, batch_index):
+    """第 batch_index 批的亂數流：每個 (seed, 策略, 批次) 各自獨立，可單獨重播。"""
+    return rng_streams.generator(seed, "batch", strategy, batch_index)
+
+
+def simulate_stats(tables, n_rounds, seed=None, strategy='A', num_decks=8,
+                   batch_size=DEFAULT_BATCH_SIZE, progress=None, precision=None, sink=None,
+                   stats=None, batch_index=0, checkpoint=None):
+    """
+    以批次引擎模擬至多 n_rounds 局，回傳 RatioStats（其 seed 欄位記錄本次使用的 seed）。
+    progress: 選配 callback(RatioStats)，每批結束呼叫一次。
+    precision: RTP 信賴區間半寬（百分點）達到此值即提前停止，None 表示跑滿 n_rounds。
+    sink: 選配 round_log.RoundLogWriter，逐手寫入紀錄（呼叫端負責 close）。
+    stats / batch_index: 自檢查點續跑時傳入已累積的 RatioStats 與下一批的編號（各批亂數流只由編號決定）。
+    checkpoint: 選配 callback(RatioStats, 下一批編號)，每批結束呼叫一次。
+    """
+    seed = rng_streams.make_seed(seed)
+    values = get_lookup(tables).values
+    n_rounds = int(n_rounds)
+    if stats is None:
+        stats = RatioStats(seed)
+    while stats.n < n_rounds:
+        n = min(batch_size, n_rounds - stats.n)
+        cards = deal_cards(batch_rng(seed, strategy, batch_index), n, num_decks)
+        batch_index += 1
+        returned, bet = evaluate_batch(cards, values, strategy, sink=sink)
+        stats.add_batch(returned, bet)
+        if progress is not None:
+            progress(stats)
+        if checkpoint is not None:
+            checkpoint(stats, batch_index)
+        if stats.reached(precision):
+            break
+    return stats
+
+
+def replay_batch(tables, seed, batch_index, strategy='A', num_decks=8, n=DEFAULT_BATCH_SIZE):
+    """
+    重播 simulate_stats(seed=seed, strategy=strategy) 的第 batch_index 批（除錯離群批次用）。
+    n 須與當時該批局數相同（最後一批可能較小）。回傳 (cards, 拿回金額, 下注金額)。
+    """
+    cards = deal_cards(batch_rng(seed, strategy, batch_index), n, num_decks)
+    returned, bet = evaluate_batch(cards, get_lookup(tables).values, strategy)
+    return cards, returned, bet
+
+
+def run_simulation_batch(tables, n_rounds, seed=None, strategy='A', num_decks=8,
+                         batch_size=DEFAULT_BATCH_SIZE, progress=None, precision=None):
+    """批次版 run_simulation：回傳 (總拿回金額, 總下注金額, RTP%)；參數同 simulate_stats。"""
+    stats = simulate_stats(tables, n_rounds, seed, strategy, num_decks, batch_size, progress, precision)
+    return stats.sum_r, stats.sum_b, stats.rtp_pct
@@ -6,10 +6,18 @@
 """
 import os
 import sys
-import pandas as pd
 import numpy as np
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 專案根目錄放有共用模組（如 dealer_probability.py）
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import fit_cashout_formula
+import instrumentation
+import table_io
+
 DATA_DIR = os.path.join(SCRIPT_DIR, "data")
 ORIGINAL_PATH = os.path.join(DATA_DIR, "blackjack 對照表 - 原始數據整理表.csv")
 SMOOTH_PATH = os.path.join(DATA_DIR, "blackjack 對照表 - 平滑推算表.csv")
@@ -18,18 +26,9 @@ TARGET_RTP = 96.80
 # 優化時模擬局數（較小以加速），正式驗證可用 1e7；可設環境變數 CALIBRATION_ROUNDS 覆寫
 CALIBRATION_ROUNDS = int(os.environ.get("CALIBRATION_ROUNDS", "500000"))
 
-
-def _normalize_columns(df):
-    cols = []
-    for c in df.columns:
-        s = str(c).replace("A (11)", "11").replace("A", "11").strip()
-        try:
-            cols.append(int(s))
-        except ValueError:
-            cols.append(c)
-    df = df.copy()
-    df.columns = cols
-    return df
+# 估計方式：'exact' 以解析解計算 RTP 與 p_filled（見 exact_rtp.py）；'simulate' 以模擬估計
+CALIBRATION_MODE = os.environ.get("CALIBRATION_MODE", "exact").strip().lower()
+EXACT_NUM_DECKS = 8
 
 
 def load_original_and_mask():
@@ -37,41 +36,12 @@ def load_original_and_mask():
     載入原始數據表，回傳三個區塊的「-」遮罩（True 表示該格原始為缺漏）。
     遮罩的欄位已正規化為 2..11，與平滑表一致。
     """
-    df_hard = pd.read_csv(ORIGINAL_PATH, skiprows=1, nrows=15, index_col=0)
-    df_soft = pd.read_csv(ORIGINAL_PATH, skiprows=19, nrows=9, index_col=0)
-    df_split = pd.read_csv(ORIGINAL_PATH, skiprows=32, nrows=12, index_col=0)
-
-    def is_missing(val):
-        if pd.isna(val):
-            return True
-        s = str(val).strip()
-        return s == "-" or s == ""
-
-    def build_mask(df):
-        try:
-            mask = df.map(is_missing)
-        except AttributeError:
-            mask = df.applymap(is_missing)
-        mask = _normalize_columns(mask)
-        return mask
-
-    return {
-        "hard": build_mask(df_hard),
-        "soft": build_mask(df_soft),
-        "split": build_mask(df_split),
-    }
+    return table_io.load_missing_mask(ORIGINAL_PATH)
 
 
 def load_smooth_tables():
     """載入當前平滑推算表（三個區塊）。"""
-    df_hard = pd.read_csv(SMOOTH_PATH, skiprows=1, nrows=15, index_col=0)
-    df_soft = pd.read_csv(SMOOTH_PATH, skiprows=19, nrows=9, index_col=0)
-    df_split = pd.read_csv(SMOOTH_PATH, skiprows=32, nrows=12, index_col=0)
-
-    df_hard = _normalize_columns(df_hard)
-    df_soft = _normalize_columns(df_soft)
-    df_split = _normalize_columns(df_split)
-    return {"hard": df_hard, "soft": df_soft, "split": df_split}
+    return table_io.load_tables(SMOOTH_PATH)
 
 
 def apply_delta_to_filled_cells(smooth_tables, masks, delta):
@@ -120,10 +90,9 @@ def run_simulation_estimate_filled(tables, masks, n_rounds, seed=42):
     跑一次模擬，回傳 (當前 RTP%, 兌現時命中「-」格的機率 p_filled)。
     用於直接計算 δ = (TARGET_RTP - 當前RTP) / p_filled。
     """
-    import random
     rtp_module = _get_rtp_module()
-    random.seed(seed)
-    shoe = rtp_module.create_shoe(8)
+    tables = rtp_module.with_lookup(tables)
+    shoe = rtp_module.create_shoe(seed=seed)
     total_returned = 0.0
     n_filled = 0
     n_rounds = int(n_rounds)
@@ -144,6 +113,21 @@ def run_simulation_estimate_filled(tables, masks, n_rounds, seed=42):
     return rtp_pct, p_filled
 
 
+def exact_estimate_filled(tables, masks, num_decks=EXACT_NUM_DECKS):
+    """
+    run_simulation_estimate_filled 的解析版：回傳精確的 (RTP%, p_filled)。
+    p_filled 為策略 A 每局兌現時命中「-」格的機率。
+    """
+    import exact_rtp
+    rtp_pct, _ = exact_rtp.exact_rtp(tables, num_decks)
+    p_filled = 0.0
+    for (block, row, col), p in exact_rtp.cell_hit_probabilities(tables, num_decks).items():
+        mask = masks[block]
+        if row in mask.index and col in mask.columns and mask.loc[row, col]:
+            p_filled += p
+    return rtp_pct, p_filled
+
+
 def objective_delta(delta, smooth_tables, masks):
     """目標：| RTP - TARGET_RTP | 最小（僅對「-」格加 delta）。"""
     tables = apply_delta_to_filled_cells(smooth_tables, masks, delta)
@@ -161,9 +145,13 @@ def main():
     smooth_tables = load_smooth_tables()
 
     print(f"目標 RTP: {TARGET_RTP}%")
-    print(f"校準模擬局數: {CALIBRATION_ROUNDS} (用於估計當前 RTP 與「-」格出現率)")
-    print("估計當前 RTP 與兌現時命中「-」格的機率...")
-    current_rtp, p_filled = run_simulation_estimate_filled(smooth_tables, masks, CALIBRATION_ROUNDS)
+    if CALIBRATION_MODE == "exact":
+        print(f"以解析解計算當前 RTP 與「-」格命中機率（{EXACT_NUM_DECKS} 副牌）...")
+        current_rtp, p_filled = exact_estimate_filled(smooth_tables, masks)
+    else:
+        print(f"校準模擬局數: {CALIBRATION_ROUNDS} (用於估計當前 RTP 與「-」格出現率)")
+        print("估計當前 RTP 與兌現時命中「-」格的機率...")
+        current_rtp, p_filled = run_simulation_estimate_filled(smooth_tables, masks, CALIBRATION_ROUNDS)
     print(f"  當前 RTP: {current_rtp:.2f}%")
     print(f"  兌現時命中「-」格機率: {p_filled:.2%}")
 
@@ -177,8 +165,12 @@ def main():
         print(f"  依公式計算 δ = (目標 - 當前) / p_filled ≈ {delta_opt:.1f}")
 
     tables_calibrated = apply_delta_to_filled_cells(smooth_tables, masks, delta_opt)
-    rtp_cal = run_simulation_with_tables(tables_calibrated, CALIBRATION_ROUNDS)
-    print(f"  僅調整「-」格後 RTP (約 {CALIBRATION_ROUNDS} 局): {rtp_cal:.2f}%")
+    if CALIBRATION_MODE == "exact":
+        rtp_cal, _ = exact_estimate_filled(tables_calibrated, masks)
+        print(f"  僅調整「-」格後 RTP (解析解): {rtp_cal:.2f}%")
+    else:
+        rtp_cal = run_simulation_with_tables(tables_calibrated, CALIBRATION_ROUNDS)
+        print(f"  僅調整「-」格後 RTP (約 {CALIBRATION_ROUNDS} 局): {rtp_cal:.2f}%")
 
     # 寫出新的平滑推算表（僅「-」格被加上 δ，其餘與原平滑表相同）
     out_path = SMOOTH_PATH
@@ -188,34 +180,13 @@ def main():
         shutil.copy(out_path, backup_path)
         print(f"  已備份原表至: {backup_path}")
 
-    def _write_block(f, title, df):
-        f.write(title + "\n")
-        header = "您的點數 \\ 莊家," + ",".join(
-            "A (11)" if c == 11 else str(c) for c in df.columns
-        ) + "\n"
-        f.write(header)
-        for idx in df.index:
-            row_vals = [
-                str(int(round(float(df.loc[idx, c])))) if pd.notna(df.loc[idx, c]) else ""
-                for c in df.columns
-            ]
-            # 列名含逗號（如 "20 (A,9)"）必須用雙引號包住，否則 CSV 解析會錯
-            idx_str = str(idx)
-            if "," in idx_str:
-                idx_str = '"' + idx_str + '"'
-            f.write(idx_str + "," + ",".join(row_vals) + "\n")
-
-    with open(out_path, "w", encoding="utf-8") as f:
-        _write_block(f, "硬牌,,,,,,,,,,", tables_calibrated["hard"])
-        f.write(",,,,,,,,,,\n")
-        _write_block(f, "軟牌,,,,,,,,,,", tables_calibrated["soft"])
-        f.write(",,,,,,,,,,\n")
-        f.write(",,,,,,,,,,\n")
-        _write_block(f, "分牌,,,,,,,,,,", tables_calibrated["split"])
+    table_io.write_tables(out_path, tables_calibrated)
 
     print(f"已寫入校準後平滑推算表: {out_path}")
+    fit_cashout_formula.refit_after_calibration(out_path)
     print("請再執行「cash out RTP.py」用 1000 萬局驗證 RTP。")
 
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.session("calibrate_smooth_table"):
+        main()
@@ -6,9 +6,20 @@
 """
 import os
 import sys
-import pandas as pd
+from functools import lru_cache
+
+import numpy as np
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 專案根目錄放有共用模組（如 dealer_probability.py）
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import fit_cashout_formula
+import instrumentation
+import table_io
+
 DATA_DIR = os.path.join(SCRIPT_DIR, "data")
 SMOOTH_PATH = os.path.join(DATA_DIR, "blackjack 對照表 - 平滑推算表.csv")
 TARGET_RTP = 96.80
@@ -19,31 +30,16 @@ CALIBRATION_ROUNDS = int(os.environ.get("CALIBRATION_ROUNDS", "20000000"))
 MAX_SCALE_ITERATIONS = 20
 RTP_TOLERANCE = 0.01  # 與目標差距小於 0.01% 即停止
 TIE_PREFER_BELOW = 0.005  # 兩候選 abs(err) 差 < 此值時，優先選 rtp <= TARGET_RTP
+# 'stats'（預設）：一次批次模擬收集每格兌現次數與非兌現回報（充分統計量），之後任何 scale 的 RTP 皆為一次內積；
+# 'exact'：以 exact_rtp 的精確命中機率取代模擬；'simulate'：舊流程，每次迭代重新模擬 CALIBRATION_ROUNDS 局
+CALIBRATION_MODE = os.environ.get("CALIBRATION_MODE", "stats").strip().lower()
+EXACT_NUM_DECKS = 8
 DO_FINAL_VERIFY = os.environ.get("DO_FINAL_VERIFY", "").strip().lower() in ("1", "true", "yes")
 
 
-def _normalize_columns(df):
-    cols = []
-    for c in df.columns:
-        s = str(c).replace("A (11)", "11").replace("A", "11").strip()
-        try:
-            cols.append(int(s))
-        except ValueError:
-            cols.append(c)
-    df = df.copy()
-    df.columns = cols
-    return df
-
-
 def load_smooth_tables():
     """載入當前平滑推算表（三個區塊）。"""
-    df_hard = pd.read_csv(SMOOTH_PATH, skiprows=1, nrows=15, index_col=0)
-    df_soft = pd.read_csv(SMOOTH_PATH, skiprows=19, nrows=9, index_col=0)
-    df_split = pd.read_csv(SMOOTH_PATH, skiprows=32, nrows=12, index_col=0)
-    df_hard = _normalize_columns(df_hard)
-    df_soft = _normalize_columns(df_soft)
-    df_split = _normalize_columns(df_split)
-    return {"hard": df_hard, "soft": df_soft, "split": df_split}
+    return table_io.load_tables(SMOOTH_PATH)
 
 
 def apply_gentle_scale(tables, scale, v_min=V_MIN, v_max=V_MAX):
@@ -66,6 +62,44 @@ def apply_gentle_scale(tables, scale, v_min=V_MIN, v_max=V_MAX):
     return out
 
 
+def scale_lookup_values(lookup, scale, v_min=V_MIN, v_max=V_MAX):
+    """
+    apply_gentle_scale 的陣列版：對 CashoutLookup 中存在的格子套用 V * scale、四捨五入並限制在 [v_min, v_max]，
+    查不到的格子維持 80% 保守估計。結果與對 apply_gentle_scale 後的表重新 compile_lookup 相同。
+    """
+    scaled = np.clip(np.round(lookup.values * scale), v_min, v_max)
+    return np.where(lookup.valid, scaled, lookup.values)
+
+
+def collect_cell_weights(mode=CALIBRATION_MODE, n_rounds=None, seed=42):
+    """
+    收集策略 A / B 的每格命中機率與固定回報（exact_rtp.CellWeights），與表值無關，整個校準只需一次。
+    mode='exact' 為解析解；否則以批次引擎模擬 n_rounds（預設 CALIBRATION_ROUNDS）局。
+    """
+    import exact_rtp
+    if mode == "exact":
+        return exact_rtp.cell_weights(EXACT_NUM_DECKS)
+    return exact_rtp.simulated_cell_weights(n_rounds or CALIBRATION_ROUNDS, seed=seed)
+
+
+def make_scale_estimator(tables, mode=CALIBRATION_MODE):
+    """
+    回傳 (當前 RTP%, rtp_of_scale)。rtp_of_scale(scale) 為策略 A 在 apply_gentle_scale(tables, scale) 下的 RTP%。
+    mode='simulate' 時每次呼叫重新模擬；其餘模式先收集充分統計量，之後每次呼叫只是一次內積。
+    """
+    if mode == "simulate":
+        current = run_simulation(tables, CALIBRATION_ROUNDS)
+        return current, lambda scale: run_simulation(apply_gentle_scale(tables, scale), CALIBRATION_ROUNDS)
+
+    import exact_rtp
+    from cashout_lookup import compile_lookup
+    weights = collect_cell_weights(mode)
+    lookup = compile_lookup(tables)
+    current, _ = exact_rtp.rtp_from_values(lookup.values, weights)
+    return current, lambda scale: exact_rtp.rtp_from_values(scale_lookup_values(lookup, scale), weights)[0]
+
+
+@lru_cache(maxsize=None)
 def _get_rtp_module():
     from importlib.util import spec_from_file_location, module_from_spec
     spec = spec_from_file_location("rtp", os.path.join(SCRIPT_DIR, "cash out RTP.py"))
@@ -80,29 +114,9 @@ def run_simulation(tables, n_rounds, seed=42):
     return rtp_pct
 
 
-def write_smooth_csv(path, tables):
-    def _write_block(f, title, df):
-        f.write(title + "\n")
-        f.write("您的點數 \\ 莊家," + ",".join(
-            "A (11)" if c == 11 else str(c) for c in df.columns
-        ) + "\n")
-        for idx in df.index:
-            row_vals = [
-                str(int(round(float(df.loc[idx, c])))) if pd.notna(df.loc[idx, c]) else ""
-                for c in df.columns
-            ]
-            idx_str = str(idx)
-            if "," in idx_str:
-                idx_str = '"' + idx_str + '"'
-            f.write(idx_str + "," + ",".join(row_vals) + "\n")
-
-    with open(path, "w", encoding="utf-8") as f:
-        _write_block(f, "硬牌,,,,,,,,,,", tables["hard"])
-        f.write(",,,,,,,,,,\n")
-        _write_block(f, "軟牌,,,,,,,,,,", tables["soft"])
-        f.write(",,,,,,,,,,\n")
-        f.write(",,,,,,,,,,\n")
-        _write_block(f, "分牌,,,,,,,,,,", tables["split"])
+def write_smooth_csv(path, tables, fmt=table_io.format_int):
+    """以平滑推算表的區塊格式寫出 tables（見 table_io.write_tables）。"""
+    table_io.write_tables(path, tables, fmt)
 
 
 def _is_better_candidate(err, rtp, best_err, best_rtp):
@@ -124,9 +138,14 @@ def main():
 
     print(f"目標 RTP: {TARGET_RTP}%")
     print(f"兌現賠付限制: [{V_MIN}, {V_MAX}]（0.4～1.77 倍，主注 100）")
-    print(f"校準模擬局數: {CALIBRATION_ROUNDS}")
+    if CALIBRATION_MODE == "exact":
+        print(f"校準方式: 解析解（{EXACT_NUM_DECKS} 副牌）")
+    elif CALIBRATION_MODE == "simulate":
+        print(f"校準方式: 每次迭代重新模擬 {CALIBRATION_ROUNDS} 局")
+    else:
+        print(f"校準方式: 一次模擬 {CALIBRATION_ROUNDS} 局收集每格命中次數，之後各 scale 直接計算")
     print("估計當前 RTP...")
-    current_rtp = run_simulation(tables_base, CALIBRATION_ROUNDS)
+    current_rtp, rtp_of_scale = make_scale_estimator(tables_base)
     print(f"  當前 RTP: {current_rtp:.2f}%")
 
     # 帶上下界的類二分搜尋：scale 大則 RTP 大，記錄與目標差距最小的表格（略偏下優先）
@@ -134,19 +153,16 @@ def main():
     scale = TARGET_RTP / current_rtp
     scale = max(scale_low, min(scale_high, scale))
 
-    best_tables = None
     best_err = None
     best_rtp = None
     best_scale = None
 
     for it in range(MAX_SCALE_ITERATIONS):
-        tables_calibrated = apply_gentle_scale(tables_base, scale)
-        rtp_after = run_simulation(tables_calibrated, CALIBRATION_ROUNDS)
+        rtp_after = rtp_of_scale(scale)
         err = TARGET_RTP - rtp_after
         print(f"  迭代 {it + 1}: scale={scale:.4f} → RTP={rtp_after:.2f}% (差 {err:+.2f}%)")
 
         if _is_better_candidate(err, rtp_after, best_err, best_rtp):
-            best_tables = tables_calibrated
             best_err = err
             best_rtp = rtp_after
             best_scale = scale
@@ -165,11 +181,11 @@ def main():
         scale = max(0.5, min(scale, 2.0))
 
     # 若從未更新過 best（理論上不會），仍用最後一輪
-    if best_tables is None:
-        best_tables = tables_calibrated
+    if best_scale is None:
         best_scale = scale
         best_rtp = rtp_after
         best_err = TARGET_RTP - best_rtp
+    best_tables = apply_gentle_scale(tables_base, best_scale)
 
     # 選配：最終大樣本驗證
     if DO_FINAL_VERIFY:
@@ -200,8 +216,10 @@ def main():
     write_smooth_csv(SMOOTH_PATH, best_tables)
     print(f"最終採用 scale: {best_scale:.4f} | 校準時最佳 RTP: {best_rtp:.2f}% (差 {best_err:+.2f}%)")
     print(f"已寫入校準後平滑推算表: {SMOOTH_PATH}")
+    fit_cashout_formula.refit_after_calibration(SMOOTH_PATH)
     print("請再執行「cash out RTP.py」用 1000 萬局驗證 RTP。")
 
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.session("calibrate_smooth_table_gentle"):
+        main()
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+逐格校準：兌現表每一格都是變數，同時讓策略 A 與策略 B 的 RTP 命中目標。
+
+RTP 對表值為線性（見 exact_rtp.py），每格的精確命中機率即為 RTP 對該格的梯度，因此校準是一個凸二次規劃：
+    最小化  Σ (V - V0)²  +  SMOOTHNESS_WEIGHT × Σ_相鄰格 ((V_i - V0_i) - (V_j - V0_j))²
+    限制    RTP_A(V) = TARGET_RTP_A，RTP_B(V) = TARGET_RTP_B
+            V_MIN ≤ V ≤ V_MAX
+            原表中相鄰兩格（同列左右、同欄上下）的嚴格大小關係不得反轉（單調性）
+平滑項懲罰的是「調整量」的相鄰差，使改動在表上平滑分佈、不破壞原表形狀。
+命中機率為 0 的格子（如硬 18、硬 20）不影響 RTP，固定不動。
+
+求解以 ADMM（OSQP 的迭代形式）完成，只需 NumPy；之後四捨五入為整數，再以逐格 ±1 的貪婪修正把
+RTP 拉回目標（每步都維持上下限與單調性）。整個流程數秒內完成，結果以平滑表 CSV 格式寫回。
+"""
+import os
+import shutil
+import sys
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 專案根目錄放有共用模組（如 dealer_probability.py）
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import exact_rtp
+import fit_cashout_formula
+import instrumentation
+from calibrate_smooth_table_gentle import SMOOTH_PATH, DATA_DIR, V_MAX, V_MIN, load_smooth_tables, write_smooth_csv
+from cashout_lookup import BLOCK_NAMES, compile_lookup, iter_table_cells
+
+TARGET_RTP_A = float(os.environ.get("TARGET_RTP_A", "96.80"))
+TARGET_RTP_B = float(os.environ.get("TARGET_RTP_B", "96.80"))
+# 平滑項權重：越大則調整量在相鄰格間越一致（越接近整表平移）
+SMOOTHNESS_WEIGHT = float(os.environ.get("SMOOTHNESS_WEIGHT", "4.0"))
+EXACT_NUM_DECKS = 8
+# 設為 1 只印結果，不寫回 CSV
+DRY_RUN = os.environ.get("DRY_RUN", "").strip().lower() in ("1", "true", "yes")
+
+ADMM_RHO = 1.0
+ADMM_SIGMA = 1e-6
+ADMM_ALPHA = 1.6
+ADMM_MAX_ITERATIONS = 20000
+ADMM_TOLERANCE = 1e-7
+MAX_REPAIR_STEPS = 2000
+
+
+def table_cells(tables):
+    """兌現表中的格子，回傳 [(區塊編號, 玩家點數, 莊家明牌, 列名), ...] 與其原值陣列。"""
+    cells = list(iter_table_cells(tables))
+    v0 = np.array([float(tables[BLOCK_NAMES[b]].loc[row, col]) for b, _, col, row in cells])
+    return cells, v0
+
+
+def adjacent_pairs(cells):
+    """同區塊中相鄰格的索引對 (i, j)：同列相鄰明牌、同明牌相鄰點數列。"""
+    pos = {}
+    rows = {}
+    for k, (b, _, col, row) in enumerate(cells):
+        pos[(b, row, col)] = k
+        rows.setdefault(b, [])
+        if row not in rows[b]:
+            rows[b].append(row)
+    pairs = []
+    for (b, row, col), i in pos.items():
+        right = pos.get((b, row, col + 1))
+        if right is not None:
+            pairs.append((i, right))
+        r = rows[b].index(row)
+        if r + 1 < len(rows[b]):
+            below = pos.get((b, rows[b][r + 1], col))
+            if below is not None:
+                pairs.append((i, below))
+    return pairs
+
+
+def rtp_targets(weights, lookup, cells, target_a=TARGET_RTP_A, target_b=TARGET_RTP_B):
+    """
+    把兩個 RTP 目標寫成線性等式 G @ V = h。
+    RTP_A = (fixed_a + s·p_a·V) / BASE_BET × 100，RTP_B 以期望下注 bet_b 取代 BASE_BET（s = BASE_BET / 100）。
+    表外格子（查不到、以 80 兌現）不是變數，其貢獻併入常數項。
+    """
+    scale = exact_rtp.BASE_BET / 100.0
+    p_a = np.array([weights.prob_a[b, t, c] for b, t, c, _ in cells])
+    p_b = np.array([weights.prob_b[b, t, c] for b, t, c, _ in cells])
+    fallback = np.where(lookup.valid, 0.0, lookup.values)
+    h_a = (target_a / 100 * exact_rtp.BASE_BET - weights.fixed_a) / scale - float((weights.prob_a * fallback).sum())
+    h_b = (target_b / 100 * weights.bet_b - weights.fixed_b) / scale - float((weights.prob_b * fallback).sum())
+    return np.vstack([p_a, p_b]), np.array([h_a, h_b])
+
+
+def solve_qp(v0, G, h, lower, upper, order_pairs, smooth_pairs, smoothness=SMOOTHNESS_WEIGHT):
+    """
+    以 ADMM 解上述二次規劃，回傳連續解 V。
+    限制式統一寫成 l ≤ A V ≤ u：等式列（RTP 目標，列向量正規化）、上下限列、單調列（V_j - V_i ≥ 0）。
+    """
+    n = v0.size
+    # 目標函數 ½ VᵀPV + qᵀV，P = 2(I + λ LᵀL)，L 為相鄰差分算子
+    L = np.zeros((len(smooth_pairs), n))
+    for k, (i, j) in enumerate(smooth_pairs):
+        L[k, i], L[k, j] = 1.0, -1.0
+    P = 2.0 * (np.eye(n) + smoothness * L.T @ L)
+    q = -P @ v0
+
+    norms = np.linalg.norm(G, axis=1, keepdims=True)
+    D = np.zeros((len(order_pairs), n))
+    for k, (i, j) in enumerate(order_pairs):
+        D[k, i], D[k, j] = -1.0, 1.0
+    A = np.vstack([G / norms, np.eye(n), D])
+    lo = np.concatenate([h / norms.ravel(), lower, np.zeros(len(order_pairs))])
+    hi = np.concatenate([h / norms.ravel(), upper, np.full(len(order_pairs), np.inf)])
+    # 等式列用較大的 ρ（OSQP 的做法），收斂較快
+    rho = np.full(A.shape[0], ADMM_RHO)
+    rho[lo == hi] *= 1e3
+
+    K_inv = np.linalg.inv(P + ADMM_SIGMA * np.eye(n) + A.T @ (rho[:, None] * A))
+    x = np.clip(v0, lower, upper)
+    z = np.clip(A @ x, lo, hi)
+    y = np.zeros(A.shape[0])
+    for _ in range(ADMM_MAX_ITERATIONS):
+        x_tilde = K_inv @ (ADMM_SIGMA * x - q + A.T @ (rho * z - y))
+        z_tilde = A @ x_tilde
+        x = ADMM_ALPHA * x_tilde + (1 - ADMM_ALPHA) * x
+        z_relaxed = ADMM_ALPHA * z_tilde + (1 - ADMM_ALPHA) * z
+        z_new = np.clip(z_relaxed + y / rho, lo, hi)
+        y += rho * (z_relaxed - z_new)
+        dual = np.max(np.abs(A.T @ (rho * (z_new - z))))
+        z = z_new
+        primal = np.max(np.abs(A @ x - z))
+        if primal < ADMM_TOLERANCE and dual < ADMM_TOLERANCE * 1e3:
+            break
+    return x
+
+
+def _move_allowed(values, k, step, lower, upper, below_of, above_of):
+    """V_k 加 step（±1）後是否仍滿足上下限與單調性。"""
+    new = values[k] + step
+    if not (lower[k] <= new <= upper[k]):
+        return False
+    if step > 0:
+        return all(new <= values[j] for j in above_of[k])
+    return all(new >= values[i] for i in below_of[k])
+
+
+def round_and_repair(x, G, h, lower, upper, order_pairs, max_steps=MAX_REPAIR_STEPS):
+    """
+    四捨五入為整數（單調的四捨五入不會反轉大小關係），再反覆挑選最能縮小
+    兩個 RTP 等式殘差平方和的單格 ±1 調整，直到無法再改善。
+    """
+    values = np.clip(np.round(x), lower, upper)
+    below_of = [[] for _ in values]   # below_of[j]: 必須 ≤ V_j 的格子
+    above_of = [[] for _ in values]   # above_of[i]: 必須 ≥ V_i 的格子
+    for i, j in order_pairs:
+        below_of[j].append(i)
+        above_of[i].append(j)
+    # ADMM 的微小殘差可能讓少數單調關係在四捨五入後反轉，先往下拉平
+    changed = True
+    while changed:
+        changed = False
+        for i, j in order_pairs:
+            if values[i] > values[j]:
+                values[i] = values[j]
+                changed = True
+
+    # 以相對殘差衡量（兩個等式的量級不同）
+    weight = 1.0 / np.abs(h)
+    for _ in range(max_steps):
+        resid = (G @ values - h) * weight
+        best = None
+        best_cost = float(resid @ resid)
+        for step in (1.0, -1.0):
+            trial = resid[:, None] + step * G * weight[:, None]
+            cost = (trial * trial).sum(axis=0)
+            for k in np.argsort(cost):
+                if cost[k] >= best_cost:
+                    break
+                if _move_allowed(values, k, step, lower, upper, below_of, above_of):
+                    best, best_cost = (k, step), cost[k]
+                    break
+        if best is None:
+            break
+        values[best[0]] += best[1]
+    return values
+
+
+def optimize_table(tables, target_a=TARGET_RTP_A, target_b=TARGET_RTP_B,
+                   smoothness=SMOOTHNESS_WEIGHT, num_decks=EXACT_NUM_DECKS):
+    """
+    逐格最佳化兌現表，回傳 (新 tables, 策略 A RTP%, 策略 B RTP%)。tables 不會被修改。
+    """
+    weights = exact_rtp.cell_weights(num_decks)
+    cells, v0 = table_cells(tables)
+    G, h = rtp_targets(weights, compile_lookup(tables), cells, target_a, target_b)
+
+    # 不影響 RTP 的格子固定；原值已超出上下限的格子以原值為界，避免被強迫改動
+    active = (G != 0).any(axis=0)
+    lower = np.where(active, np.minimum(V_MIN, v0), v0)
+    upper = np.where(active, np.maximum(V_MAX, v0), v0)
+    pairs = adjacent_pairs(cells)
+    order_pairs = [(i, j) if v0[i] < v0[j] else (j, i) for i, j in pairs if v0[i] != v0[j]]
+
+    x = solve_qp(v0, G, h, lower, upper, order_pairs, pairs, smoothness)
+    values = round_and_repair(x, G, h, lower, upper, order_pairs)
+
+    out = {block: tables[block].copy() for block in BLOCK_NAMES}
+    for (b, _, col, row), v in zip(cells, values):
+        out[BLOCK_NAMES[b]].loc[row, col] = int(v)
+    rtp_a, rtp_b = exact_rtp.exact_rtp(out, num_decks)
+    return out, rtp_a, rtp_b
+
+
+def main():
+    print("載入平滑推算表...")
+    tables = load_smooth_tables()
+    rtp_a, rtp_b = exact_rtp.exact_rtp(tables, EXACT_NUM_DECKS)
+    print(f"目標 RTP: 策略 A {TARGET_RTP_A:.2f}% / 策略 B {TARGET_RTP_B:.2f}%（{EXACT_NUM_DECKS} 副牌解析解）")
+    print(f"兌現賠付限制: [{V_MIN}, {V_MAX}]，平滑權重 {SMOOTHNESS_WEIGHT}")
+    print(f"  當前 RTP: 策略 A {rtp_a:.4f}% / 策略 B {rtp_b:.4f}%")
+
+    new_tables, new_a, new_b = optimize_table(tables)
+    old = compile_lookup(tables)
+    new = compile_lookup(new_tables)
+    diff = (new.values - old.values)[old.valid]
+    print(f"  最佳化後 RTP: 策略 A {new_a:.4f}% / 策略 B {new_b:.4f}%")
+    print(f"  變動格數: {int((diff != 0).sum())} / {diff.size}，最大調整 {np.abs(diff).max():.0f}，"
+          f"平均調整 {diff.mean():+.2f}")
+
+    if DRY_RUN:
+        print("DRY_RUN：未寫入 CSV")
+        return
+
+    backup_path = os.path.join(DATA_DIR, "blackjack 對照表 - 平滑推算表.backup.csv")
+    if os.path.exists(SMOOTH_PATH):
+        shutil.copy(SMOOTH_PATH, backup_path)
+        print(f"  已備份原表至: {backup_path}")
+    write_smooth_csv(SMOOTH_PATH, new_tables)
+    print(f"已寫入校準後平滑推算表: {SMOOTH_PATH}")
+    fit_cashout_formula.refit_after_calibration(SMOOTH_PATH)
+
+
+if __name__ == "__main__":
+    with instrumentation.session("calibrate_table_optimizer"):
+        main()
@@ -1,12 +1,56 @@
-import pandas as pd
-import random
+import hashlib
 import numpy as np
 import os
+import sys
 from datetime import datetime
+from functools import lru_cache
 
 # --- 1. 遊戲基本設定 ---
 BASE_BET = 100
-SIMULATION_ROUNDS = 100000000  # 模擬局數，可依需求調高以增加精準度
+SIMULATION_ROUNDS = 100000000  # 模擬局數上限，可依需求調高以增加精準度
+# 要求精度：RTP 95% 信賴區間半寬（百分點），達到即提前停止；預設 0 表示跑滿 SIMULATION_ROUNDS。
+# 以環境變數 RTP_PRECISION 指定（例如 0.02）才啟用提前停止
+SIMULATION_PRECISION = float(os.environ.get("RTP_PRECISION", "0"))
+PROGRESS_INTERVAL = 1000000  # 每隔多少局印出進度並檢查精度
+# 亂數 seed（見 rng_streams.py）：未設定時每次執行自動產生並印出，以 RTP_SEED 指定即可重現
+SIMULATION_SEED = int(os.environ["RTP_SEED"]) if os.environ.get("RTP_SEED") else None
+
+# 模擬引擎：'scalar' 逐局（8 副牌連續牌靴）；'batch' 向量化批次（每局新牌靴，見 batch_engine.py）
+# 可用環境變數 RTP_ENGINE 覆寫，校準腳本呼叫 run_simulation 時亦適用
+SIMULATION_ENGINE = os.environ.get("RTP_ENGINE", "scalar").strip().lower()
+
+# 逐局引擎中硬 17+ 比牌的莊家處理：'exact' 以 dealer_probability 的精確分佈取期望值（不抽牌，變異數較低）；
+# 'draw' 自牌靴逐張抽牌。可用環境變數 RTP_DEALER 覆寫
+DEALER_MODE = os.environ.get("RTP_DEALER", "exact").strip().lower()
+
+# 配對比較模式（共同亂數）：RTP_PAIRED=1 時以同一條預先產生的牌流評估所有表格與策略，
+# 直接報告 RTP 差值與其信賴區間（見 paired_eval.py）。RTP_PAIRED_ROUNDS 為牌流局數；
+# RTP_CARD_STREAM 指定 .npy 路徑時，檔案存在即載入重用，否則產生後存檔
+PAIRED_MODE = os.environ.get("RTP_PAIRED", "0").strip() not in ("", "0")
+PAIRED_ROUNDS = int(float(os.environ.get("RTP_PAIRED_ROUNDS", "2000000")))
+CARD_STREAM_PATH = os.environ.get("RTP_CARD_STREAM", "").strip() or None
+
+# 逐局引擎的牌靴（見 shoe.py）：RTP_SHOE_DECKS 為副牌數，'infinite' 為無限副牌（CSM，每張牌獨立）；
+# RTP_PENETRATION 為切牌卡位置（佔牌靴比例），未設定時為剩 1 副牌即洗牌
+SHOE_DECKS = os.environ.get("RTP_SHOE_DECKS", "8").strip().lower()
+SHOE_DECKS = None if SHOE_DECKS in ("inf", "infinite") else int(SHOE_DECKS)
+SHOE_PENETRATION = float(os.environ["RTP_PENETRATION"]) if os.environ.get("RTP_PENETRATION") else None
+
+# 逐手紀錄（見 round_log.py）：設定 RTP_LOG_DIR 時，run_rtp_for_table 把每手結果寫入
+# {RTP_LOG_DIR}/{表名}_{策略}（RTP_LOG_FORMAT=npy 為 .npy chunk 目錄；parquet 需 pyarrow）。僅批次引擎支援
+LOG_DIR = os.environ.get("RTP_LOG_DIR", "").strip() or None
+LOG_FORMAT = os.environ.get("RTP_LOG_FORMAT", "npy").strip().lower()
+
+# 檢查點（見專案根目錄 checkpoint.py）：設定 RTP_CHECKPOINT_DIR 時，run_rtp_for_table 每 RTP_CHECKPOINT_ROUNDS 局
+# （預設 500 萬）把各策略的 RatioStats、亂數狀態（逐局引擎為牌靴狀態、批次引擎為下一批編號）與已完成局數寫入
+# {目錄}/{表名}_{策略}.npz；RTP_RESUME=1 時自該處續跑（未設 RTP_SEED 則沿用檢查點的 seed），結果與不中斷執行相同。
+# 不與逐手紀錄（RTP_LOG_DIR）同時使用
+CHECKPOINT_DIR = os.environ.get("RTP_CHECKPOINT_DIR", "").strip() or None
+CHECKPOINT_ROUNDS = int(float(os.environ.get("RTP_CHECKPOINT_ROUNDS", "5000000")))
+RESUME = os.environ.get("RTP_RESUME", "0").strip() not in ("", "0")
+
+# 效能剖析（見 instrumentation.py）：RTP_PROFILE=1 時 run_rtp_for_table 結束後印出洗牌 / 結算 / 查表 / 莊家補牌
+# 各階段的呼叫次數與抽樣計時，以及表外格 0.8× 保守值的次數；RTP_PROFILE_OUT 另寫 cProfile 的 pstats 檔
 
 # 是否一併計算「平滑推算表.backup.csv」的 RTP（True=兩張表各算策略 A/B；False=僅算平滑推算表.csv）
 CALCULATE_BACKUP_RTP = False
@@ -17,78 +61,64 @@ DATA_PATH = os.path.join(SCRIPT_DIR, "data", "blackjack 對照表 - 平滑推算
 DATA_PATH_BACKUP = os.path.join(SCRIPT_DIR, "data", "blackjack 對照表 - 平滑推算表.backup.csv")
 ORIGINAL_DATA_PATH = os.path.join(SCRIPT_DIR, "data", "blackjack 對照表 - 原始數據整理表.csv")
 
+# 本檔常以 spec_from_file_location 載入，確保同資料夾與專案根目錄（共用模組）可被 import
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import batch_engine
+import checkpoint
+import dealer_probability
+import hand_state
+import instrumentation
+import paired_eval
+import rng_streams
+import round_log
+import table_io
+from cashout_lookup import get_lookup, soft_row_name, with_lookup
+from rtp_stats import RatioStats
+from hand_state import CARD_STRIDE, EMPTY, NEXT, PAIR, SOFT, TOTAL
+from shoe import make_shoe
+
 # 莊家明牌欄位對應 (CSV 欄位名 -> 整數)
 DEALER_COLS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11]  # A = 11
 
-def create_shoe(num_decks=8):
-    """建立 8 副牌的牌靴"""
-    # 牌值：2-10 直接對應，J, Q, K 當作 10，A 當作 11
-    single_deck = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11] * 4
-    shoe = single_deck * num_decks
-    random.shuffle(shoe)
-    return shoe
+def create_shoe(num_decks=SHOE_DECKS, penetration=SHOE_PENETRATION, seed=None, strategy='A'):
+    """
+    建立牌靴（預設 8 副牌、剩 1 副時洗牌；num_decks=None 為無限副牌），見 shoe.py
+    同一 seed 下每個策略各有獨立的亂數流；shoe.seed 記錄實際使用的 seed
+    """
+    return make_shoe(num_decks, penetration, seed, key=("shoe", strategy))
 
 def calculate_hand(cards):
     """
-    計算手牌點數
-    回傳: (總點數, 是否為軟牌)
+    計算手牌點數（以 hand_state 轉移表逐張累加）
+    回傳: (總點數, 是否為軟牌)；爆牌時總點數為第一次超過 21 時的點數
     """
-    total = sum(cards)
-    aces = cards.count(11)
-    
-    # 處理 A 的點數 (11 或 1)
-    while total > 21 and aces > 0:
-        total -= 10
-        aces -= 1
-        
-    is_soft = aces > 0 and total <= 21
-    return total, is_soft
-
-def dealer_play(shoe, dealer_cards):
-    """莊家補牌邏輯：Infinite Blackjack 莊家通常在軟 17 停牌 (Stands on Soft 17)"""
-    while True:
-        total, is_soft = calculate_hand(dealer_cards)
-        if total < 17:
-            dealer_cards.append(shoe.pop())
-        else:
-            break
-    return total
+    state = hand_state.from_cards(cards)
+    return TOTAL[state], SOFT[state]
+
+def dealer_play(shoe, state):
+    """
+    莊家補牌邏輯：Infinite Blackjack 莊家通常在軟 17 停牌 (Stands on Soft 17)
+    state 為莊家目前手牌的 hand_state 狀態，每補一張牌只查一次轉移表；回傳最終點數
+    """
+    while TOTAL[state] < 17:
+        state = NEXT[state * CARD_STRIDE + shoe.pop()]
+    return TOTAL[state]
 
 def load_cashout_tables(csv_path):
     """
-    從 CSV 載入三個區塊：硬牌、軟牌、分牌。
-    回傳 dict: {'hard': df, 'soft': df, 'split': df}，欄位已正規化為 2..10, 11(A)。
+    從 CSV 載入三個區塊：硬牌、軟牌、分牌（依區塊標題解析並檢查格式，見 table_io.py）。
+    回傳 dict: {'hard': df, 'soft': df, 'split': df, 'lookup': CashoutLookup}，欄位已正規化為 2..10, 11(A)。
+    'lookup' 為預先編譯的陣列查表（見 cashout_lookup.py），DataFrame 僅供編輯與寫出 CSV。
     """
-    def _normalize_columns(df):
-        cols = []
-        for c in df.columns:
-            s = str(c).replace("A (11)", "11").replace("A", "11").strip()
-            try:
-                cols.append(int(s))
-            except ValueError:
-                cols.append(c)
-        df = df.copy()
-        df.columns = cols
-        return df
-
-    # CSV 結構：硬牌區 第1行標題、第2行起為 header、之後 15 行資料；軟牌區 第19行 header、9 行資料；分牌區 第32行 header、12 行資料
-    df_hard = pd.read_csv(csv_path, skiprows=1, nrows=15, index_col=0)
-    df_soft = pd.read_csv(csv_path, skiprows=19, nrows=9, index_col=0)
-    df_split = pd.read_csv(csv_path, skiprows=32, nrows=12, index_col=0)
-
-    df_hard = _normalize_columns(df_hard)
-    df_soft = _normalize_columns(df_soft)
-    df_split = _normalize_columns(df_split)
-    return {"hard": df_hard, "soft": df_soft, "split": df_split}
-
-
-def _soft_row_name(player_total):
-    """軟牌點數對應 CSV 列名：20 -> '20 (A,9)', 12 -> '12 (A,A)' 等。"""
-    if player_total == 12:
-        return "12 (A,A)"
-    if 13 <= player_total <= 20:
-        return f"{player_total} (A,{player_total - 11})"
-    return None
+    return table_io.load_tables(csv_path, with_lookup=True)
+
+
+_soft_row_name = soft_row_name
 
 
 def get_cashout_value(tables, player_total, dealer_upcard, is_soft, is_pair, base_bet):
@@ -96,7 +126,11 @@ def get_cashout_value(tables, player_total, dealer_upcard, is_soft, is_pair, bas
     從兌現表中查找金額，依牌型使用硬牌 / 軟牌 / 分牌區塊。
     tables: dict from load_cashout_tables()。
     若有對應不到則回傳保守估計 (注金 80%)。
+    tables 含 'lookup' 時直接以陣列索引查表，否則退回 DataFrame 查詢。
     """
+    lookup = tables.get("lookup")
+    if lookup is not None:
+        return lookup.cashout(player_total, dealer_upcard, is_soft, is_pair, base_bet)
     col = int(dealer_upcard) if dealer_upcard != 11 else 11
     if col == 1:
         col = 11
@@ -121,22 +155,41 @@ def get_cashout_value(tables, player_total, dealer_upcard, is_soft, is_pair, bas
         return base_bet * 0.8
 
 
+def _exact_stand_return(player_total, dealer_upcard, player_cards, base_bet):
+    """
+    硬 17+ 停牌的期望拿回金額：莊家分佈取自 dealer_probability，副牌數與發牌的牌靴相同（SHOE_DECKS，
+    移除玩家手牌與明牌；無限副牌時不移除）。
+    """
+    c1, c2 = player_cards
+    if c1 > c2:
+        c1, c2 = c2, c1
+    return _cached_stand_return(player_total, dealer_upcard, c1, c2, base_bet, SHOE_DECKS)
+
+
+@lru_cache(maxsize=4096)
+def _cached_stand_return(player_total, dealer_upcard, c1, c2, base_bet, num_decks):
+    removed = (c1, c2) if num_decks is not None else ()
+    outcome = dealer_probability.dealer_outcome(dealer_upcard, num_decks, removed)
+    return dealer_probability.stand_return(player_total, outcome, base_bet)
+
+
 def _resolve_single_hand(shoe, cards, dealer_upcard, tables, base_bet):
     """
     單手「可兌換就兌現、否則比牌」。供策略 B 分牌後每手使用。
     分牌後再成對視為 is_pair=True 可兌現、不允許再分。
     回傳該手拿回金額。
     """
-    total, is_soft = calculate_hand(cards)
+    state = hand_state.from_cards(cards)
+    total, is_soft, is_pair = TOTAL[state], SOFT[state], PAIR[state]
     if total > 21:
         return 0.0
-    is_pair = len(cards) == 2 and cards[0] == cards[1]
     can_cash = is_pair or is_soft or total < 17
     if can_cash:
         return get_cashout_value(tables, total, dealer_upcard, is_soft, is_pair, base_bet)
     # 硬 17+：莊家補牌並比大小
-    dealer_cards = [dealer_upcard, shoe.pop()]
-    dealer_final = dealer_play(shoe, dealer_cards)
+    if DEALER_MODE == "exact":
+        return _exact_stand_return(total, dealer_upcard, cards, base_bet)
+    dealer_final = dealer_play(shoe, hand_state.from_cards((dealer_upcard, shoe.pop())))
     if dealer_final > 21:
         return base_bet * 2
     if total > dealer_final:
@@ -148,27 +201,23 @@ def _resolve_single_hand(shoe, cards, dealer_upcard, tables, base_bet):
 
 def play_round(shoe, df_table):
     """模擬單局遊戲（策略 A：第一次可兌換就兌換，對子不分牌直接兌現）。回傳 (amount, key)。"""
-    # 若牌靴剩餘牌量不足，重新洗牌 (設定為低於 1 Deck 時洗牌)
-    if len(shoe) < 52:
-        shoe.extend(create_shoe(8))
-        random.shuffle(shoe)
+    # 越過切牌卡則換上新牌靴（預設剩 1 副牌時）
+    shoe.start_round()
 
     # 初始發牌
-    player_cards = [shoe.pop(), shoe.pop()]
-    dealer_cards = [shoe.pop()]  # 莊家明牌
+    player_cards = (shoe.pop(), shoe.pop())
+    dealer_upcard = shoe.pop()  # 莊家明牌
     # 莊家暗牌先扣著，這裡為了簡化我們先不抽出暗牌，等輪到莊家再抽即可
-    
-    dealer_upcard = dealer_cards[0]
+    dealer_state = NEXT[EMPTY * CARD_STRIDE + dealer_upcard]
 
     # --- 檢查玩家是否有 Blackjack ---
-    player_total, is_soft = calculate_hand(player_cards)
-    if player_total == 21 and len(player_cards) == 2:
+    state = NEXT[NEXT[EMPTY * CARD_STRIDE + player_cards[0]] * CARD_STRIDE + player_cards[1]]
+    player_total, is_soft = TOTAL[state], SOFT[state]
+    if player_total == 21:
         # 玩家 BJ，莊家需要檢查是否也 BJ
-        dealer_hidden = shoe.pop()
-        dealer_cards.append(dealer_hidden)
-        dealer_total, _ = calculate_hand(dealer_cards)
-        
-        if dealer_total == 21:
+        dealer_state = NEXT[dealer_state * CARD_STRIDE + shoe.pop()]
+
+        if TOTAL[dealer_state] == 21:
             return BASE_BET, None  # Push (退回本金 100)
         else:
             return BASE_BET * 2.5, None  # BJ 賠 3:2，含本金拿回 250
@@ -176,7 +225,7 @@ def play_round(shoe, df_table):
     # --- 判斷是否觸發「兌現 (Cash Out)」 ---
     # 根據規則：硬 17 以上 (且非對子) 無法補牌/分牌 -> 直接停牌
     # 其餘情況 (硬 < 17、軟牌、對子) -> 觸發兌現
-    is_pair = (len(player_cards) == 2 and player_cards[0] == player_cards[1])
+    is_pair = PAIR[state]
     can_cash_out = False
     
     if is_pair:
@@ -203,8 +252,9 @@ def play_round(shoe, df_table):
         return cashout_amount, cashout_key
     else:
         # --- 硬 17 以上，系統不給兌現，強制停牌，與莊家比大小 ---
-        dealer_cards.append(shoe.pop())
-        dealer_final = dealer_play(shoe, dealer_cards)
+        if DEALER_MODE == "exact":
+            return _exact_stand_return(player_total, dealer_upcard, player_cards, BASE_BET), None
+        dealer_final = dealer_play(shoe, NEXT[dealer_state * CARD_STRIDE + shoe.pop()])
         if dealer_final > 21:
             return BASE_BET * 2, None
         elif player_total > dealer_final:
@@ -220,25 +270,19 @@ def _play_round_strategy_b(shoe, tables):
     策略 B 單局：若初始為對子則分牌，兩手各補一張後每手可兌換就兌現、否則比牌。
     回傳 (amount, bet_amount)，bet_amount 為 1 或 2 注。
     """
-    if len(shoe) < 52:
-        shoe.extend(create_shoe(8))
-        random.shuffle(shoe)
-
-    player_cards = [shoe.pop(), shoe.pop()]
-    dealer_cards = [shoe.pop()]
-    dealer_upcard = dealer_cards[0]
-
-    player_total, is_soft = calculate_hand(player_cards)
-    if player_total == 21 and len(player_cards) == 2:
-        dealer_hidden = shoe.pop()
-        dealer_cards.append(dealer_hidden)
-        dealer_total, _ = calculate_hand(dealer_cards)
-        if dealer_total == 21:
+    shoe.start_round()
+
+    player_cards = (shoe.pop(), shoe.pop())
+    dealer_upcard = shoe.pop()
+
+    state = NEXT[NEXT[EMPTY * CARD_STRIDE + player_cards[0]] * CARD_STRIDE + player_cards[1]]
+    if TOTAL[state] == 21:
+        dealer_state = NEXT[NEXT[EMPTY * CARD_STRIDE + dealer_upcard] * CARD_STRIDE + shoe.pop()]
+        if TOTAL[dealer_state] == 21:
             return BASE_BET, BASE_BET
         return BASE_BET * 2.5, BASE_BET
 
-    is_pair = player_cards[0] == player_cards[1]
-    if not is_pair:
+    if not PAIR[state]:
         amount = _resolve_single_hand(shoe, player_cards, dealer_upcard, tables, BASE_BET)
         return amount, BASE_BET
 
@@ -251,74 +295,205 @@ def _play_round_strategy_b(shoe, tables):
     return r1 + r2, 2 * BASE_BET
 
 
-def run_simulation(tables, n_rounds, seed=None, strategy='A'):
+def run_simulation(tables, n_rounds, seed=None, strategy='A', engine=None, precision=None):
     """
     使用給定的兌現表執行 n_rounds 局，回傳 (總拿回金額, 總下注金額, RTP%)。
     供校準腳本呼叫，可傳入修改後的 tables。
     strategy: 'A' 第一次可兌換就兌換、對子不分牌；'B' 對子分牌後兩手各自兌現。
+    engine: 'scalar' / 'batch'，預設為 SIMULATION_ENGINE。
+    precision: RTP 95% 信賴區間半寬（百分點）達到此值即提前停止；None 表示跑滿 n_rounds。
     """
-    if seed is not None:
-        random.seed(seed)
-    shoe = create_shoe(8)
-    total_returned = 0.0
-    total_bet = 0.0
-    if strategy == 'A':
-        for _ in range(n_rounds):
+    if (engine or SIMULATION_ENGINE) == 'batch':
+        return batch_engine.run_simulation_batch(tables, n_rounds, seed=seed, strategy=strategy,
+                                                 precision=precision)
+    tables = with_lookup(tables)
+    shoe = create_shoe(seed=seed, strategy=strategy)
+    stats = _simulate_strategy(shoe, tables, strategy, n_rounds, precision)
+    return stats.sum_r, stats.sum_b, stats.rtp_pct
+
+
+def _simulate_strategy(shoe, tables, strategy, n_rounds, precision=None, progress=None, stats=None, checkpoint=None):
+    """
+    逐局模擬單一策略，回傳 RatioStats（seed 為牌靴的 seed）。每 PROGRESS_INTERVAL 局呼叫一次 progress(stats)
+    與 checkpoint(stats)，並在信賴區間半寬 ≤ precision 時提前停止。
+    stats: 自檢查點續跑時傳入已累積的 RatioStats（牌靴須已還原到同一時點），自第 stats.n + 1 局接著模擬。
+    """
+    if stats is None:
+        stats = RatioStats(shoe.seed)
+    add = stats.add
+    for i in range(stats.n + 1, n_rounds + 1):
+        if strategy == 'A':
             amt, _ = play_round(shoe, tables)
-            total_returned += amt
-        total_bet = n_rounds * BASE_BET
-    else:
-        for _ in range(n_rounds):
+            add(amt, BASE_BET)
+        else:
             amt, bet_amt = _play_round_strategy_b(shoe, tables)
-            total_returned += amt
-            total_bet += bet_amt
-    rtp_pct = (total_returned / total_bet) * 100 if total_bet > 0 else 0.0
-    return total_returned, total_bet, rtp_pct
+            add(amt, bet_amt)
+        if i % PROGRESS_INTERVAL == 0:
+            if progress is not None:
+                progress(stats)
+            if checkpoint is not None:
+                checkpoint(stats)
+            if stats.reached(precision):
+                break
+    return stats
 
 
-def run_rtp_for_table(tables, table_label, n_rounds):
+def _print_progress(stats):
+    print(f"  已模擬 {stats.n} 局 | 目前估計 RTP: {stats.summary()}")
+
+
+def _print_strategy_result(table_label, strategy, stats, precision):
+    lo, hi = stats.interval()
+    print(f"\n=== {table_label} - 策略 {strategy} 最終結果 ===")
+    print(f"總模擬局數: {stats.n}")
+    print(f"總下注金額: {stats.sum_b:.0f}")
+    print(f"總拿回金額: {stats.sum_r:.2f}")
+    print(f"★ 策略 {strategy} RTP: {stats.rtp_pct:.2f}%")
+    print(f"  標準誤: {stats.std_error_pct:.4f}% | 95% 信賴區間: [{lo:.4f}%, {hi:.4f}%]")
+    print(f"  seed: {stats.seed}（以 RTP_SEED={stats.seed} 重現）")
+    if stats.reached(precision):
+        print(f"  已達要求精度 ±{precision}%，提前停止")
+
+
+def _log_path(log_dir, table_label, strategy, log_format):
+    name = f"{table_label}_{strategy}"
+    return os.path.join(log_dir, name + (".parquet" if log_format == "parquet" else ""))
+
+
+def _checkpoint_path(checkpoint_dir, table_label, strategy):
+    return os.path.join(checkpoint_dir, f"{table_label}_{strategy}.npz")
+
+
+def _checkpoint_seed(checkpoint_dir, table_label):
+    """該表任一策略的檢查點所記錄的 seed；都沒有時回傳 None。"""
+    for strategy in ('A', 'B'):
+        params = checkpoint.saved_params(_checkpoint_path(checkpoint_dir, table_label, strategy))
+        if params:
+            return params["seed"]
+    return None
+
+
+def _simulate_resumable(tables, strategy, n_rounds, precision, seed, use_batch, ckpt, resume):
+    """
+    以檢查點執行單一策略，回傳 RatioStats。每 ckpt.every 局寫入 RatioStats 與亂數狀態，結束時寫入 finished；
+    resume=True 且檢查點存在時自該處續跑，已結束的策略直接取回結果。
+    """
+    restored = ckpt.load() if resume else None
+    stats = state = arrays = None
+    if restored is not None:
+        state, arrays = restored
+        stats = RatioStats.from_dict(state["stats"])
+        print(f"自檢查點 {ckpt.path} 續跑：已完成 {stats.n} 局")
+        if state["finished"]:
+            return stats
+
+    if use_batch:
+        def save_batch(s, batch_index):
+            if ckpt.due(s.n):
+                ckpt.save(s.n, {"stats": s.to_dict(), "batch_index": batch_index, "finished": False})
+
+        stats = batch_engine.simulate_stats(tables, n_rounds, seed=seed, strategy=strategy, progress=_print_progress,
+                                            precision=precision, stats=stats,
+                                            batch_index=state["batch_index"] if state else 0, checkpoint=save_batch)
+    else:
+        shoe = create_shoe(seed=seed, strategy=strategy)
+        if state is not None:
+            shoe.set_state(state["shoe"], arrays)
+
+        def save_scalar(s):
+            if ckpt.due(s.n):
+                shoe_state, shoe_arrays = shoe.get_state()
+                ckpt.save(s.n, {"stats": s.to_dict(), "shoe": shoe_state, "finished": False}, shoe_arrays)
+
+        stats = _simulate_strategy(shoe, tables, strategy, n_rounds, precision, progress=_print_progress,
+                                   stats=stats, checkpoint=save_scalar)
+    ckpt.save(stats.n, {"stats": stats.to_dict(), "finished": True})
+    return stats
+
+
+def run_rtp_for_table(tables, table_label, n_rounds, engine=None, precision=None, seed=SIMULATION_SEED,
+                      log_dir=LOG_DIR, log_format=LOG_FORMAT, profile=None, checkpoint_dir=CHECKPOINT_DIR,
+                      resume=RESUME):
     """
     對單一兌現表依序跑策略 A、策略 B，並印出該表名稱下的兩組 RTP 結果。
+    每個進度點印出 RTP 與 95% 信賴區間；precision（百分點，預設 SIMULATION_PRECISION，0 為不提前停止）達到即提前停止。
+    兩個策略共用 seed、各取獨立的亂數流；seed 為 None 時自動產生並印出。
+    log_dir 指定時以批次引擎執行並寫入逐手紀錄（round_log），可事後以 round_log.aggregate_by_cell 分析。
+    profile: 是否剖析（見 instrumentation.py），None 時依 RTP_PROFILE；結束時印出各階段摘要，不影響結果。
+    checkpoint_dir: 每 CHECKPOINT_ROUNDS 局把各策略的狀態寫入 {checkpoint_dir}/{表名}_{策略}.npz；
+    resume=True 時自該處續跑（seed 為 None 時沿用檢查點的 seed）。參數或兌現表不同時引發 checkpoint.CheckpointError。
     回傳 (rtp_a, rtp_b) 方便彙總顯示。
     """
-    shoe = create_shoe(8)
-
-    # --- 策略 A ---
-    print(f"\n開始模擬 [{table_label}] 策略 A...")
-    total_returned_a = 0.0
-    for i in range(n_rounds):
-        amt, _ = play_round(shoe, tables)
-        total_returned_a += amt
-        if (i + 1) % 1000000 == 0:
-            current_rtp = (total_returned_a / ((i + 1) * BASE_BET)) * 100
-            print(f"  已模擬 {i + 1} 局 | 目前估計 RTP: {current_rtp:.2f}%")
-    total_bet_a = n_rounds * BASE_BET
-    rtp_a = (total_returned_a / total_bet_a) * 100
-    print(f"\n=== {table_label} - 策略 A 最終結果 ===")
-    print(f"總模擬局數: {n_rounds}")
-    print(f"總下注金額: {total_bet_a}")
-    print(f"總拿回金額: {total_returned_a:.2f}")
-    print(f"★ 策略 A RTP: {rtp_a:.2f}%")
-
-    # --- 策略 B ---
-    print(f"\n開始模擬 [{table_label}] 策略 B...")
-    shoe = create_shoe(8)
-    total_returned_b = 0.0
-    total_bet_b = 0.0
-    for i in range(n_rounds):
-        amt, bet_amt = _play_round_strategy_b(shoe, tables)
-        total_returned_b += amt
-        total_bet_b += bet_amt
-        if (i + 1) % 1000000 == 0:
-            current_rtp = (total_returned_b / total_bet_b) * 100
-            print(f"  已模擬 {i + 1} 局 | 目前估計 RTP: {current_rtp:.2f}%")
-    rtp_b = (total_returned_b / total_bet_b) * 100 if total_bet_b > 0 else 0.0
-    print(f"\n=== {table_label} - 策略 B 最終結果 ===")
-    print(f"總模擬局數: {n_rounds}")
-    print(f"總下注金額: {total_bet_b}")
-    print(f"總拿回金額: {total_returned_b:.2f}")
-    print(f"★ 策略 B RTP: {rtp_b:.2f}%")
-    return rtp_a, rtp_b
+    if precision is None:
+        precision = SIMULATION_PRECISION
+    if checkpoint_dir and log_dir:
+        print("檢查點不支援與逐手紀錄同時使用，本次不寫檢查點")
+        checkpoint_dir = None
+    if checkpoint_dir and resume and seed is None:
+        seed = _checkpoint_seed(checkpoint_dir, table_label)
+    seed = rng_streams.make_seed(seed)
+    use_batch = (engine or SIMULATION_ENGINE) == 'batch'
+    if log_dir and not use_batch:
+        print("逐手紀錄僅批次引擎支援，本次改用批次引擎")
+        use_batch = True
+    if not use_batch:
+        tables = with_lookup(tables)
+
+    results = []
+    with instrumentation.session(table_label, profile, globals()):
+        for strategy in ('A', 'B'):
+            suffix = "（批次引擎）" if use_batch else ""
+            print(f"\n開始模擬 [{table_label}] 策略 {strategy}{suffix}...")
+            if use_batch and log_dir:
+                path = _log_path(log_dir, table_label, strategy, log_format)
+                with round_log.RoundLogWriter(path, log_format) as sink:
+                    stats = batch_engine.simulate_stats(tables, n_rounds, seed=seed, strategy=strategy,
+                                                        progress=_print_progress, precision=precision, sink=sink)
+                print(f"逐手紀錄已寫入 {path}（{sink.rows} 筆）")
+            elif checkpoint_dir:
+                params = {"table": hashlib.sha1(get_lookup(tables).values.tobytes()).hexdigest(),
+                          "strategy": strategy, "seed": seed, "n_rounds": int(n_rounds), "precision": precision,
+                          "engine": "batch" if use_batch else "scalar"}
+                if not use_batch:
+                    params.update(dealer_mode=DEALER_MODE, shoe_decks=SHOE_DECKS, penetration=SHOE_PENETRATION)
+                ckpt = checkpoint.Checkpointer(_checkpoint_path(checkpoint_dir, table_label, strategy),
+                                               "rtp_" + params["engine"], params, CHECKPOINT_ROUNDS)
+                stats = _simulate_resumable(tables, strategy, n_rounds, precision, seed, use_batch, ckpt, resume)
+            elif use_batch:
+                stats = batch_engine.simulate_stats(tables, n_rounds, seed=seed, strategy=strategy,
+                                                    progress=_print_progress, precision=precision)
+            else:
+                stats = _simulate_strategy(create_shoe(seed=seed, strategy=strategy), tables, strategy, n_rounds,
+                                           precision, progress=_print_progress)
+            _print_strategy_result(table_label, strategy, stats, precision)
+            results.append(stats.rtp_pct)
+    return tuple(results)
+
+
+def run_paired_comparison(tables_list, n_rounds=PAIRED_ROUNDS, seed=SIMULATION_SEED, stream_path=CARD_STREAM_PATH):
+    """
+    以共同亂數比較多張兌現表的策略 A / B。tables_list: [(標籤, tables), ...]，第一張表的策略 A 為基準。
+    stream_path 指定時重用（或建立）該牌流檔，使不同次執行也比較同一批牌。
+    """
+    if stream_path and os.path.exists(stream_path):
+        stream = paired_eval.load_card_stream(stream_path)
+        print(f"\n載入牌流 {stream_path}（{stream.shape[0]} 局）")
+    else:
+        seed = rng_streams.make_seed(seed)
+        print(f"\n產生 {n_rounds} 局共同牌流（seed: {seed}）...")
+        stream = paired_eval.generate_card_stream(n_rounds, seed)
+        if stream_path:
+            paired_eval.save_card_stream(stream_path, stream)
+            print(f"牌流已存至 {stream_path}")
+    configs = [(label, tables, strategy) for label, tables in tables_list for strategy in ('A', 'B')]
+    stats = paired_eval.compare(configs, stream)
+    paired_eval.print_comparison(configs, stats)
+    return stats
+
+
+# 校準腳本每次以 spec_from_file_location 重新載入本檔並直接呼叫 run_simulation，啟用剖析時於載入當下即替換熱點函式
+if instrumentation.ENABLED:
+    instrumentation.install(globals())
 
 
 # --- 主程式 ---
@@ -334,6 +509,16 @@ def main():
         print(f"讀取平滑推算表 CSV 失敗: {e}")
         return
 
+    if PAIRED_MODE:
+        # 配對模式的目的即為比較兩張表，backup 一律納入（讀取失敗則只比較策略 A / B）
+        tables_list = [("平滑推算表", tables_smooth)]
+        try:
+            tables_list.append(("平滑推算表.backup", load_cashout_tables(DATA_PATH_BACKUP)))
+        except Exception as e:
+            print(f"\n讀取平滑推算表.backup CSV 失敗: {e}，僅比較策略 A / B")
+        run_paired_comparison(tables_list)
+        return
+
     rtp_a_smooth, rtp_b_smooth = run_rtp_for_table(tables_smooth, "平滑推算表", n_rounds)
     rtp_summary.append(("平滑推算表", rtp_a_smooth, rtp_b_smooth))
 
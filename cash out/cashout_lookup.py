@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+預先編譯的兌現查表：把 {'hard','soft','split'} DataFrame 轉成不可變的稠密陣列，
+以 (區塊, 玩家點數, 莊家明牌) 直接索引，取代逐次組列名、`in df.index` 與 `df.loc`。
+
+查不到的格子（例如軟 21、分牌 20、對子 2,2）預先填入保守估計 80（注金 80%），
+因此查表永遠是 O(1) 索引，不需要例外處理。DataFrame 仍保留用於編輯與寫出 CSV；
+lookup 為編譯當下的快照，編輯 DataFrame 後需重新 compile_lookup。
+"""
+import numpy as np
+
+# 兌現表區塊編號
+BLOCK_HARD, BLOCK_SOFT, BLOCK_SPLIT = 0, 1, 2
+BLOCK_NAMES = ("hard", "soft", "split")
+
+# 查表失敗時的保守兌現（每 100 元注金 80 元，即注金 80%）
+FALLBACK_CASHOUT = 80.0
+
+N_TOTALS = 22      # 玩家點數 0..21
+N_UPCARDS = 12     # 莊家明牌 0..11（實際使用 2..11）
+
+
+def soft_row_name(player_total):
+    """軟牌點數對應 CSV 列名：20 -> '20 (A,9)', 12 -> '12 (A,A)' 等；無對應列回傳 None。"""
+    if player_total == 12:
+        return "12 (A,A)"
+    if 13 <= player_total <= 20:
+        return f"{player_total} (A,{player_total - 11})"
+    return None
+
+
+def iter_table_cells(tables):
+    """
+    逐一產生兌現表中存在的格子 (區塊編號, 玩家點數, 莊家明牌, 列名)。
+    對應規則與 get_cashout_value 相同：軟牌僅 12..20 有列，硬牌/分牌列名即點數。
+    """
+    for b, block in enumerate(BLOCK_NAMES):
+        df = tables[block]
+        for total in range(N_TOTALS):
+            row = soft_row_name(total) if block == "soft" else total
+            if row is None or row not in df.index:
+                continue
+            for col in range(2, N_UPCARDS):
+                if col in df.columns:
+                    yield b, total, col, row
+
+
+def block_index(is_soft, is_pair):
+    """依牌型選區塊：對子優先，其次軟牌，其餘為硬牌。"""
+    if is_pair:
+        return BLOCK_SPLIT
+    if is_soft:
+        return BLOCK_SOFT
+    return BLOCK_HARD
+
+
+class CashoutLookup:
+    """
+    不可變的兌現查表。
+    values: (3, 22, 12) float64，單位為每 100 元注金，查不到的格子為 FALLBACK_CASHOUT。
+    valid: (3, 22, 12) bool，True 表示該格確實存在於兌現表中。
+    """
+
+    __slots__ = ("values", "valid", "_flat", "_valid_flat")
+
+    def __init__(self, values, valid):
+        values = np.array(values, dtype=np.float64)
+        valid = np.array(valid, dtype=bool)
+        values.setflags(write=False)
+        valid.setflags(write=False)
+        object.__setattr__(self, "values", values)
+        object.__setattr__(self, "valid", valid)
+        # 純量查詢走 Python list，避免每次產生 numpy 純量
+        object.__setattr__(self, "_flat", values.ravel().tolist())
+        object.__setattr__(self, "_valid_flat", valid.ravel().tolist())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CashoutLookup 為不可變物件")
+
+    @classmethod
+    def from_tables(cls, tables):
+        values = np.full((3, N_TOTALS, N_UPCARDS), FALLBACK_CASHOUT, dtype=np.float64)
+        valid = np.zeros((3, N_TOTALS, N_UPCARDS), dtype=bool)
+        for b, total, col, row in iter_table_cells(tables):
+            values[b, total, col] = float(tables[BLOCK_NAMES[b]].loc[row, col])
+            valid[b, total, col] = True
+        return cls(values, valid)
+
+    @staticmethod
+    def flat_index(block, player_total, dealer_upcard):
+        """(區塊, 點數, 明牌) 的攤平索引；超出範圍回傳 -1。"""
+        if dealer_upcard == 1:
+            dealer_upcard = 11
+        if not (0 <= player_total < N_TOTALS and 2 <= dealer_upcard < N_UPCARDS):
+            return -1
+        return (block * N_TOTALS + player_total) * N_UPCARDS + dealer_upcard
+
+    def lookup(self, block, player_total, dealer_upcard):
+        """純量查表，回傳每 100 元注金的兌現金額（查不到為 80）。"""
+        idx = self.flat_index(block, player_total, dealer_upcard)
+        return self._flat[idx] if idx >= 0 else FALLBACK_CASHOUT
+
+    def is_valid(self, block, player_total, dealer_upcard):
+        """該格是否存在於兌現表中（False 表示會走 80% 保守估計）。"""
+        idx = self.flat_index(block, player_total, dealer_upcard)
+        return idx >= 0 and self._valid_flat[idx]
+
+    def cashout(self, player_total, dealer_upcard, is_soft, is_pair, base_bet):
+        """與 get_cashout_value 相同語意的兌現金額。"""
+        return self.lookup(block_index(is_soft, is_pair), player_total, dealer_upcard) * (base_bet / 100.0)
+
+    def gather(self, blocks, totals, upcards):
+        """向量化查表：三個同形狀整數陣列，回傳每 100 元注金的兌現金額陣列。"""
+        return self.values[blocks, totals, upcards]
+
+
+def compile_lookup(tables):
+    """由兌現表 DataFrame 編譯 CashoutLookup。"""
+    return CashoutLookup.from_tables(tables)
+
+
+def get_lookup(tables):
+    """取出 tables 內已編譯的 lookup；沒有時（例如校準腳本修改後的新表）即時編譯。"""
+    lookup = tables.get("lookup")
+    if lookup is None:
+        lookup = compile_lookup(tables)
+    return lookup
+
+
+def with_lookup(tables):
+    """回傳附帶 'lookup' 的淺複本（已有則原樣回傳），供模擬迴圈在開始前編譯一次。"""
+    if tables.get("lookup") is not None:
+        return tables
+    out = dict(tables)
+    out["lookup"] = compile_lookup(tables)
+    return out
+
+
+class EditableTable:
+    """
+    可逐格修改的兌現表：修改同時寫入 DataFrame 與表值陣列，並記錄髒格（攤平索引 -> 修改前的值），
+    供 exact_rtp.IncrementalRTP 只重算改到的格子。建構時複製 DataFrame，不影響原表。
+    """
+
+    def __init__(self, tables):
+        self.tables = {block: tables[block].copy() for block in BLOCK_NAMES}
+        lookup = get_lookup(tables)
+        self.values = lookup.values.copy()
+        self.valid = lookup.valid
+        self._dirty = {}
+        self._lookup = lookup
+
+    def set(self, block, player_total, dealer_upcard, value):
+        """修改一格（block 為區塊名或編號）；表中沒有的格子引發 KeyError。"""
+        b = BLOCK_NAMES.index(block) if isinstance(block, str) else int(block)
+        idx = CashoutLookup.flat_index(b, player_total, dealer_upcard)
+        if idx < 0 or not self.valid.flat[idx]:
+            raise KeyError(f"表中沒有此格: {BLOCK_NAMES[b]} {player_total} vs {dealer_upcard}")
+        col = 11 if dealer_upcard == 1 else dealer_upcard
+        row = soft_row_name(player_total) if b == BLOCK_SOFT else player_total
+        value = float(value)
+        self._dirty.setdefault(idx, float(self.values.flat[idx]))
+        self.values.flat[idx] = value
+        self.tables[BLOCK_NAMES[b]].loc[row, col] = value
+        self._lookup = None
+
+    @property
+    def dirty(self):
+        """尚未取走的髒格數。"""
+        return len(self._dirty)
+
+    def take_dirty(self):
+        """取走並清空髒格，回傳 [(攤平索引, 舊值, 新值), ...]（改回原值的格子略過）。"""
+        changes = [(idx, old, float(self.values.flat[idx]))
+                   for idx, old in self._dirty.items() if self.values.flat[idx] != old]
+        self._dirty = {}
+        return changes
+
+    def lookup(self):
+        """目前表值的 CashoutLookup（直接由表值陣列建立，不重新走 DataFrame）。"""
+        if self._lookup is None:
+            self._lookup = CashoutLookup(self.values, self.valid)
+        return self._lookup
+
+    def to_tables(self):
+        """附帶 lookup 的 tables dict（DataFrame 為目前狀態的複本）。"""
+        out = {block: df.copy() for block, df in self.tables.items()}
+        out["lookup"] = self.lookup()
+        return out
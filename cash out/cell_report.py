@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+逐格貢獻報表：模擬時以預先配置的陣列累加每個兌現格 (區塊, 玩家點數, 莊家明牌) 的命中次數與拿回金額，
+以及 BJ（贏/和）、不可兌現比牌（贏/和/輸）各類結果的手數與拿回金額，策略 A / B 各一份。
+
+CellContributions 實作 round_log 的 sink 介面（append(records)），直接交給 batch_engine.simulate_stats；
+每批只做幾次 bincount，不保留逐手紀錄，1e8 局也只佔固定記憶體。
+
+write_report_csv 以平滑推算表的區塊格式寫出（硬牌 / 軟牌 / 分牌，同一組列與欄），可直接畫熱圖：
+- 命中率：每局命中該格的機率（%）
+- RTP 貢獻：該格拿回金額 / 總下注（百分點），全部格子加上 BJ、比牌即為 RTP
+表中沒有的格子（以保守值 80 兌現）不在 CSV 內，合計列於 print_report。
+
+用法：python cell_report.py [局數]（環境變數 CELL_REPORT_DIR 指定輸出目錄，預設 data/）
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 專案根目錄放有共用模組（rng_streams.py 等）
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import batch_engine
+import round_log
+import rng_streams
+import table_io
+from cashout_lookup import BLOCK_NAMES, N_TOTALS, N_UPCARDS, iter_table_cells
+
+N_CELLS = round_log.N_CELLS
+SHAPE = (3, N_TOTALS, N_UPCARDS)
+
+# 非兌現結果類別（依拿回金額 / 下注判斷）
+OUTCOMES = ("bj_win", "bj_push", "stand_win", "stand_push", "stand_loss")
+OUTCOME_LABELS = {
+    "bj_win": "BJ 贏", "bj_push": "BJ 和（莊家亦 BJ）",
+    "stand_win": "比牌贏", "stand_push": "比牌和", "stand_loss": "比牌輸",
+}
+_BJ_WIN, _BJ_PUSH, _STAND_WIN, _STAND_PUSH, _STAND_LOSS = range(len(OUTCOMES))
+
+DATA_DIR = os.path.join(SCRIPT_DIR, "data")
+SMOOTH_PATH = os.path.join(DATA_DIR, "blackjack 對照表 - 平滑推算表.csv")
+REPORT_ROUNDS = int(float(os.environ.get("CELL_REPORT_ROUNDS", "20000000")))
+REPORT_DIR = os.environ.get("CELL_REPORT_DIR", "").strip() or None
+
+
+class CellContributions:
+    """
+    單一策略的逐格累加器。hits / returns: 攤平的 (3, 22, 12) 陣列（同 CashoutLookup 索引）；
+    outcome_hands / outcome_returns: 依 OUTCOMES 順序；n_rounds / total_bet: 局數與下注合計。
+    """
+
+    def __init__(self, strategy='A'):
+        self.strategy = strategy
+        self.hits = np.zeros(N_CELLS, dtype=np.int64)
+        self.returns = np.zeros(N_CELLS)
+        self.outcome_hands = np.zeros(len(OUTCOMES), dtype=np.int64)
+        self.outcome_returns = np.zeros(len(OUTCOMES))
+        self.n_rounds = 0
+        self.total_bet = 0.0
+
+    def append(self, records):
+        """累加一批 round_log 紀錄（sink 介面）。"""
+        cell = records["cell"]
+        payout = records["payout"]
+        bet = records["bet"].astype(np.float64)
+        flags = records["flags"]
+        cashed = cell >= 0
+        self.hits += np.bincount(cell[cashed], minlength=N_CELLS)
+        self.returns += np.bincount(cell[cashed], weights=payout[cashed], minlength=N_CELLS)
+
+        bj = (flags & round_log.FLAG_BLACKJACK) != 0
+        stand = (flags & round_log.FLAG_STAND) != 0
+        category = np.full(cell.shape, -1, dtype=np.int64)
+        category[bj & (payout > bet)] = _BJ_WIN
+        category[bj & (payout <= bet)] = _BJ_PUSH
+        category[stand & (payout > bet)] = _STAND_WIN
+        category[stand & (payout == bet)] = _STAND_PUSH
+        category[stand & (payout < bet)] = _STAND_LOSS
+        known = category >= 0
+        self.outcome_hands += np.bincount(category[known], minlength=len(OUTCOMES))
+        self.outcome_returns += np.bincount(category[known], weights=payout[known], minlength=len(OUTCOMES))
+
+        self.n_rounds += int(np.count_nonzero((flags & round_log.FLAG_SPLIT_SECOND) == 0))
+        self.total_bet += float(bet.sum())
+
+    def merge(self, other):
+        self.hits += other.hits
+        self.returns += other.returns
+        self.outcome_hands += other.outcome_hands
+        self.outcome_returns += other.outcome_returns
+        self.n_rounds += other.n_rounds
+        self.total_bet += other.total_bet
+
+    @property
+    def rtp_pct(self):
+        if not self.total_bet:
+            return 0.0
+        return (self.returns.sum() + self.outcome_returns.sum()) / self.total_bet * 100
+
+    def hit_rate(self):
+        """每局命中各格的機率（%），(3, 22, 12)。"""
+        return (self.hits / max(self.n_rounds, 1) * 100).reshape(SHAPE)
+
+    def contribution(self):
+        """各格對 RTP 的貢獻（百分點），(3, 22, 12)。"""
+        return (self.returns / self.total_bet * 100 if self.total_bet else self.returns * 0).reshape(SHAPE)
+
+
+def to_tables(values, tables):
+    """把 (3, 22, 12) 陣列填入與 tables 相同列/欄的 DataFrame（表中沒有的格子略過）。"""
+    out = {block: pd.DataFrame(np.nan, index=tables[block].index, columns=tables[block].columns)
+           for block in BLOCK_NAMES}
+    for b, total, col, row in iter_table_cells(tables):
+        out[BLOCK_NAMES[b]].loc[row, col] = values[b, total, col]
+    return out
+
+
+def off_table_mask(tables):
+    """表中沒有的格子（以保守值兌現）為 True 的 (3, 22, 12) 布林陣列。"""
+    mask = np.ones(SHAPE, dtype=bool)
+    for b, total, col, _ in iter_table_cells(tables):
+        mask[b, total, col] = False
+    return mask
+
+
+def write_report_csv(path, values, tables, digits=6):
+    """以平滑推算表格式寫出 (3, 22, 12) 陣列 values，小數 digits 位。"""
+    table_io.write_tables(path, to_tables(values, tables), fmt=lambda v: f"{float(v):.{digits}f}")
+
+
+def collect(tables, n_rounds, seed=None, strategies=('A', 'B'), num_decks=8, precision=None):
+    """以批次引擎模擬各策略並累加逐格貢獻，回傳 ({策略: CellContributions}, {策略: RatioStats})。"""
+    seed = rng_streams.make_seed(seed)
+    contributions, stats = {}, {}
+    for strategy in strategies:
+        acc = CellContributions(strategy)
+        stats[strategy] = batch_engine.simulate_stats(tables, n_rounds, seed=seed, strategy=strategy,
+                                                      num_decks=num_decks, precision=precision, sink=acc)
+        contributions[strategy] = acc
+    return contributions, stats
+
+
+def report_paths(out_dir, table_label, strategy):
+    """(命中率 CSV, RTP 貢獻 CSV) 的路徑。"""
+    prefix = os.path.join(out_dir, f"blackjack 對照表 - {table_label} - 策略{strategy}")
+    return prefix + " - 命中率.csv", prefix + " - RTP貢獻.csv"
+
+
+def write_report(acc, tables, out_dir, table_label):
+    """寫出單一策略的命中率與 RTP 貢獻兩份 CSV，回傳路徑。"""
+    os.makedirs(out_dir, exist_ok=True)
+    hit_path, contrib_path = report_paths(out_dir, table_label, acc.strategy)
+    write_report_csv(hit_path, acc.hit_rate(), tables)
+    write_report_csv(contrib_path, acc.contribution(), tables)
+    return hit_path, contrib_path
+
+
+def print_report(acc, tables, top=10):
+    """印出 RTP 拆解（兌現格 / 表外格 / 各類結果）與貢獻最大的 top 格。"""
+    contribution = acc.contribution()
+    off = off_table_mask(tables)
+    print(f"\n=== 策略 {acc.strategy} 逐格貢獻（{acc.n_rounds} 局）RTP {acc.rtp_pct:.4f}% ===")
+    print(f"  兌現格（表內）: 命中 {acc.hits.reshape(SHAPE)[~off].sum()} 次，貢獻 {contribution[~off].sum():.4f}%")
+    print(f"  兌現格（表外，保守值）: 命中 {acc.hits.reshape(SHAPE)[off].sum()} 次，貢獻 {contribution[off].sum():.4f}%")
+    for i, name in enumerate(OUTCOMES):
+        share = acc.outcome_returns[i] / acc.total_bet * 100 if acc.total_bet else 0.0
+        print(f"  {OUTCOME_LABELS[name]}: {acc.outcome_hands[i]} 手，貢獻 {share:.4f}%")
+    flat_contribution = contribution.ravel()
+    for flat in np.argsort(flat_contribution)[::-1][:top]:
+        b, total, col = np.unravel_index(flat, SHAPE)
+        print(f"  {BLOCK_NAMES[b]:5s} {total:2d} vs {col:2d}: 命中率 {acc.hit_rate().ravel()[flat]:.4f}%，"
+              f"貢獻 {flat_contribution[flat]:.4f}%")
+
+
+def main():
+    n_rounds = int(float(sys.argv[1])) if len(sys.argv) > 1 else REPORT_ROUNDS
+    out_dir = REPORT_DIR or DATA_DIR
+    tables = table_io.load_tables(SMOOTH_PATH)
+    contributions, stats = collect(tables, n_rounds)
+    print(f"seed: {stats['A'].seed}")
+    for strategy, acc in contributions.items():
+        print_report(acc, tables)
+        for path in write_report(acc, tables, out_dir, "平滑推算表"):
+            print(f"已寫出 {path}")
+
+
+if __name__ == "__main__":
+    main()
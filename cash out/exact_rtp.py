@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+兌現表 RTP 解析解（取代蒙地卡羅）。
+
+列舉所有「玩家起手兩張 × 莊家明牌」組合，以精確機率加權；需與莊家比牌時以遞迴求莊家 S17 最終點數分佈。
+因策略 A / B 都是「可兌現就兌現」，每格被命中的機率與表值無關，故：
+
+    RTP_A = (固定回報_A + Σ 命中機率_A × 表值) / 注金
+    RTP_B = (固定回報_B + Σ 命中機率_B × 表值) / 期望下注_B
+
+固定回報為 BJ 與硬 17+ 比牌的期望拿回金額（莊家分佈取自 dealer_probability）。命中機率只需依牌組計算一次（cell_weights 有快取），
+之後任何兌現表的 RTP 都只是一次內積。
+
+牌組：num_decks=None 為無限副牌（完全精確）；num_decks=N 為每局一副新 N 副牌靴（無放回）。
+有限牌靴下莊家牌組僅移除玩家起手兩張與明牌，分牌後兩手補牌的移除效應不計。
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from dealer_probability import add_card, dealer_outcome, stand_return
+import batch_engine
+import rng_streams
+from batch_engine import BASE_BET, CARD_VALUES, RANK_COUNTS_PER_DECK
+from cashout_lookup import BLOCK_HARD, BLOCK_NAMES, BLOCK_SOFT, BLOCK_SPLIT, get_lookup, iter_table_cells
+
+RANKS = tuple(int(v) for v in CARD_VALUES)        # 2..11
+RANK_COUNTS = tuple(int(c) for c in RANK_COUNTS_PER_DECK)
+
+CellWeights = namedtuple("CellWeights", ["prob_a", "prob_b", "fixed_a", "fixed_b", "bet_b"])
+CellWeights.__doc__ = """
+每格命中機率與固定回報（與表值無關）。
+prob_a / prob_b: (3, 22, 12) 陣列，每局命中該格的期望次數（策略 B 分牌時一局可命中兩次）。
+fixed_a / fixed_b: 每局非兌現結果（BJ、比牌）的期望拿回金額。
+bet_b: 策略 B 每局期望下注金額（策略 A 恆為 BASE_BET）。
+"""
+
+
+def _two_card(c1, c2):
+    """兩張牌的 (點數, 是否軟牌, 是否對子)。"""
+    total, soft = add_card(*add_card(0, 0, c1), c2)
+    return total, soft > 0, c1 == c2
+
+
+class _Composition:
+    """抽牌機率：無限副牌或 N 副牌無放回。"""
+
+    def __init__(self, num_decks):
+        self.num_decks = num_decks
+        self.counts = None if num_decks is None else [c * num_decks for c in RANK_COUNTS]
+
+    def prob(self, removed, rank_idx):
+        """已移除 removed（點數索引序列）後，下一張為 rank_idx 的機率。"""
+        if self.counts is None:
+            return RANK_COUNTS[rank_idx] / 52.0
+        left = self.counts[rank_idx] - sum(1 for r in removed if r == rank_idx)
+        return max(left, 0) / (sum(self.counts) - len(removed))
+
+    def dealer(self, upcard, removed):
+        """莊家 DealerOutcome；removed 中的明牌由 dealer_outcome 自行移除。"""
+        cards = [RANKS[r] for r in removed]
+        cards.remove(upcard)
+        return dealer_outcome(upcard, self.num_decks, cards)
+
+
+def _resolve_hand(c1, c2, upcard, dealer, prob, weight):
+    """
+    單手「可兌現就兌現、否則比牌」：可兌現時把 weight 累加到 prob 對應格並回傳 0，
+    否則回傳比牌的期望拿回金額 × weight。
+    """
+    total, soft, pair = _two_card(c1, c2)
+    if pair or soft or total < 17:
+        block = BLOCK_SPLIT if pair else (BLOCK_SOFT if soft else BLOCK_HARD)
+        prob[block, total, upcard] += weight
+        return 0.0
+    return weight * stand_return(total, dealer, BASE_BET)
+
+
+@lru_cache(maxsize=8)
+def cell_weights(num_decks=None):
+    """計算（並快取）num_decks 牌組下策略 A / B 的 CellWeights。"""
+    comp = _Composition(num_decks)
+    prob_a = np.zeros((3, 22, 12))
+    prob_b = np.zeros((3, 22, 12))
+    fixed_a = fixed_b = 0.0
+    bet_b = 0.0
+    n = len(RANKS)
+    for i1 in range(n):
+        p1 = comp.prob((), i1)
+        for i2 in range(n):
+            p12 = p1 * comp.prob((i1,), i2)
+            if p12 == 0.0:
+                continue
+            for iu in range(n):
+                w = p12 * comp.prob((i1, i2), iu)
+                if w == 0.0:
+                    continue
+                c1, c2, up = RANKS[i1], RANKS[i2], RANKS[iu]
+                removed = (i1, i2, iu)
+                total, _, pair = _two_card(c1, c2)
+
+                if total == 21:
+                    # 玩家 BJ：莊家暗牌補成 21 則 Push，否則 3:2
+                    need = 21 - up
+                    p_dbj = comp.prob(removed, RANKS.index(need)) if need in RANKS else 0.0
+                    bj = w * (BASE_BET * p_dbj + BASE_BET * 2.5 * (1.0 - p_dbj))
+                    fixed_a += bj
+                    fixed_b += bj
+                    bet_b += w * BASE_BET
+                    continue
+
+                dealer = comp.dealer(up, removed)
+                ret = _resolve_hand(c1, c2, up, dealer, prob_a, w)
+                fixed_a += ret
+                if not pair:
+                    fixed_b += _resolve_hand(c1, c2, up, dealer, prob_b, w)
+                    bet_b += w * BASE_BET
+                    continue
+
+                # 策略 B 分牌：兩手各補一張（第二張在第一張之後抽出）
+                bet_b += w * 2 * BASE_BET
+                for j1 in range(n):
+                    q1 = comp.prob(removed, j1)
+                    if q1 == 0.0:
+                        continue
+                    fixed_b += _resolve_hand(c1, RANKS[j1], up, dealer, prob_b, w * q1)
+                    for j2 in range(n):
+                        q2 = comp.prob(removed + (j1,), j2)
+                        if q2 == 0.0:
+                            continue
+                        fixed_b += _resolve_hand(c2, RANKS[j2], up, dealer, prob_b, w * q1 * q2)
+    for arr in (prob_a, prob_b):
+        arr.setflags(write=False)
+    return CellWeights(prob_a, prob_b, fixed_a, fixed_b, bet_b)
+
+
+def simulated_cell_weights(n_rounds, seed=None, num_decks=8, batch_size=batch_engine.DEFAULT_BATCH_SIZE):
+    """
+    cell_weights 的蒙地卡羅版：以批次引擎跑一次 n_rounds 局（策略 A / B 共用同一批牌），
+    統計每格兌現次數與非兌現結果的拿回金額，換算成每局平均後以 CellWeights 回傳。
+    表值設為 0 時拿回金額即只剩 BJ 與比牌，故同一份統計可評估任何兌現表。
+    """
+    seed = rng_streams.make_seed(seed)
+    zeros = np.zeros((3, 22, 12))
+    hits_a = np.zeros(zeros.size, dtype=np.int64)
+    hits_b = np.zeros(zeros.size, dtype=np.int64)
+    fixed_a = fixed_b = bet_b = 0.0
+    n_rounds = int(n_rounds)
+    for i, start in enumerate(range(0, n_rounds, batch_size)):
+        rng = rng_streams.generator(seed, "cell_weights", i)
+        cards = batch_engine.deal_cards(rng, min(batch_size, n_rounds - start), num_decks)
+        returned, _ = batch_engine.evaluate_batch(cards, zeros, 'A', hits=hits_a)
+        fixed_a += float(returned.sum())
+        returned, bet = batch_engine.evaluate_batch(cards, zeros, 'B', hits=hits_b)
+        fixed_b += float(returned.sum())
+        bet_b += float(bet.sum())
+    prob_a = (hits_a / n_rounds).reshape(zeros.shape)
+    prob_b = (hits_b / n_rounds).reshape(zeros.shape)
+    for arr in (prob_a, prob_b):
+        arr.setflags(write=False)
+    return CellWeights(prob_a, prob_b, fixed_a / n_rounds, fixed_b / n_rounds, bet_b / n_rounds)
+
+
+def rtp_from_values(values, weights):
+    """以 CashoutLookup.values 表值陣列與 CellWeights 計算 (rtp_a, rtp_b)（%）。"""
+    scale = BASE_BET / 100.0
+    ret_a = weights.fixed_a + float((weights.prob_a * values).sum()) * scale
+    ret_b = weights.fixed_b + float((weights.prob_b * values).sum()) * scale
+    return ret_a / BASE_BET * 100, ret_b / weights.bet_b * 100
+
+
+class IncrementalRTP:
+    """
+    逐格增量的 RTP 評估器：保存每格命中機率與目前的每格貢獻（拿回金額），
+    修改 k 格只需 O(k) 即得新 RTP 與差值，不必重做內積或重新模擬。
+
+    weights 可為 cell_weights（精確）或 simulated_cell_weights（模擬）的結果。
+    浮點累加誤差可用 resync() 以完整內積重新校正。
+    """
+
+    def __init__(self, values, weights):
+        self.weights = weights
+        self._scale = BASE_BET / 100.0
+        self._prob_a = weights.prob_a.ravel()
+        self._prob_b = weights.prob_b.ravel()
+        self.values = np.array(values, dtype=np.float64).ravel()
+        self.resync()
+
+    @classmethod
+    def from_tables(cls, tables, num_decks=None, weights=None):
+        return cls(get_lookup(tables).values, weights if weights is not None else cell_weights(num_decks))
+
+    def resync(self):
+        """以完整內積重新計算每格貢獻與總拿回金額。"""
+        self.contrib_a = self._prob_a * self.values * self._scale
+        self.contrib_b = self._prob_b * self.values * self._scale
+        self._ret_a = self.weights.fixed_a + float(self.contrib_a.sum())
+        self._ret_b = self.weights.fixed_b + float(self.contrib_b.sum())
+
+    @property
+    def rtp(self):
+        """目前的 (rtp_a, rtp_b)（%）。"""
+        return self._ret_a / BASE_BET * 100, self._ret_b / self.weights.bet_b * 100
+
+    def apply(self, changes):
+        """
+        套用 [(攤平索引, 舊值, 新值), ...]（如 EditableTable.take_dirty() 的結果），回傳 (Δrtp_a, Δrtp_b)。
+        舊值僅作說明，以評估器內目前的值為準。
+        """
+        before_a, before_b = self.rtp
+        for idx, _, new in changes:
+            new_a = float(self._prob_a[idx] * new * self._scale)
+            new_b = float(self._prob_b[idx] * new * self._scale)
+            self._ret_a += new_a - self.contrib_a[idx]
+            self._ret_b += new_b - self.contrib_b[idx]
+            self.contrib_a[idx] = new_a
+            self.contrib_b[idx] = new_b
+            self.values[idx] = new
+        after_a, after_b = self.rtp
+        return after_a - before_a, after_b - before_b
+
+    def update(self, editable):
+        """取走 EditableTable 的髒格並套用，回傳 (Δrtp_a, Δrtp_b)。"""
+        return self.apply(editable.take_dirty())
+
+    def copy(self):
+        out = object.__new__(IncrementalRTP)
+        out.__dict__.update(self.__dict__)
+        for name in ("values", "contrib_a", "contrib_b"):
+            setattr(out, name, getattr(self, name).copy())
+        return out
+
+
+def exact_rtp(tables, num_decks=None):
+    """兌現表 tables 的精確 (策略 A RTP%, 策略 B RTP%)。"""
+    return rtp_from_values(get_lookup(tables).values, cell_weights(num_decks))
+
+
+def cell_hit_probabilities(tables, num_decks=None, strategy='A'):
+    """
+    每局兌現時命中各格的機率，回傳 {(區塊名, 列名, 莊家明牌): 機率}，鍵與 play_round 的 cashout_key 相同。
+    僅列出表中存在的格子；查不到而採用 80% 保守估計的情況不列入。
+    """
+    weights = cell_weights(num_decks)
+    prob = weights.prob_a if strategy == 'A' else weights.prob_b
+    return {
+        (BLOCK_NAMES[b], row, col): float(prob[b, total, col])
+        for b, total, col, row in iter_table_cells(tables)
+    }
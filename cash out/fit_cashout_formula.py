@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+由平滑推算表重新擬合 cashout_calculate.calculate_cashout 的多項式係數。
+
+硬牌 / 軟牌兩個區塊各擬合一個 (玩家點數 P, 莊家明牌 D) 的多項式曲面（總次數 ≤ FIT_DEGREE，預設 3，
+與原本手寫公式的 10 項相同：1, P, D, P², PD, D², P³, P²D, PD², D³），以 NumPy 最小平方法求解，
+印出 R²、RMSE 與殘差最大的格子，結果寫成 JSON 係數檔（COEFFICIENTS_PATH，預設專案根目錄的
+cashout_coefficients.json）。calculate_cashout 第一次呼叫時才讀取此檔，之後與內建公式同樣查表。
+
+各校準腳本寫回平滑推算表後會自動呼叫 refit()（REFIT_CASHOUT_FORMULA=0 可關閉），公式因此與表同步。
+用法：python fit_cashout_formula.py [CSV 路徑]
+"""
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import table_io
+import cashout_calculate
+from cashout_calculate import COEFFICIENTS_PATH
+
+FIT_DEGREE = int(os.environ.get("FIT_DEGREE", "3"))
+REFIT_ENABLED = os.environ.get("REFIT_CASHOUT_FORMULA", "1").strip().lower() not in ("0", "false", "no")
+SMOOTH_PATH = os.path.join(SCRIPT_DIR, "data", "blackjack 對照表 - 平滑推算表.csv")
+REPORT_TOP = 8
+FIT_BLOCKS = ("hard", "soft")
+
+
+def poly_terms(degree=FIT_DEGREE):
+    """總次數 ≤ degree 的 (P 次方, D 次方) 項，依次數、再依 P 次方由高到低排列。"""
+    return [(i, d - i) for d in range(degree + 1) for i in range(d, -1, -1)]
+
+
+def design_matrix(P, D, terms):
+    P = np.asarray(P, dtype=np.float64)
+    D = np.asarray(D, dtype=np.float64)
+    return np.stack([P ** i * D ** j for i, j in terms], axis=-1)
+
+
+def block_samples(df):
+    """區塊 DataFrame -> (P, D, 值, 格子標籤)；軟牌列名 '20 (A,9)' 取前面的點數。"""
+    P, D, y, labels = [], [], [], []
+    for row in df.index:
+        total = int(str(row).split(" ", 1)[0])
+        for col in df.columns:
+            P.append(total)
+            D.append(int(col))
+            y.append(float(df.loc[row, col]))
+            labels.append((row, int(col)))
+    return np.array(P), np.array(D), np.array(y), labels
+
+
+def fit_block(df, terms):
+    """最小平方擬合單一區塊，回傳 (係數, 殘差, 格子標籤, R², RMSE)。"""
+    P, D, y, labels = block_samples(df)
+    X = design_matrix(P, D, terms)
+    coef, *_ = np.linalg.lstsq(X, y, rcond=None)
+    resid = y - X @ coef
+    ss_tot = float(((y - y.mean()) ** 2).sum())
+    r2 = 1.0 - float((resid ** 2).sum()) / ss_tot if ss_tot else 1.0
+    return coef, resid, labels, r2, float(np.sqrt((resid ** 2).mean()))
+
+
+def fit_tables(tables, degree=FIT_DEGREE):
+    """擬合硬牌與軟牌區塊，回傳 {區塊: {'coef', 'resid', 'labels', 'r2', 'rmse'}} 與項目列表。"""
+    terms = poly_terms(degree)
+    fits = {}
+    for block in FIT_BLOCKS:
+        coef, resid, labels, r2, rmse = fit_block(tables[block], terms)
+        fits[block] = {"coef": coef, "resid": resid, "labels": labels, "r2": r2, "rmse": rmse}
+    return fits, terms
+
+
+def print_fit_report(fits, top=REPORT_TOP):
+    for block, fit in fits.items():
+        resid = fit["resid"]
+        print(f"  {block}: R² {fit['r2']:.4f}，RMSE {fit['rmse']:.2f}，最大殘差 {np.abs(resid).max():.1f}")
+        for k in np.argsort(np.abs(resid))[::-1][:top]:
+            row, col = fit["labels"][k]
+            print(f"    {str(row):>9} vs {col:2d}: 表值 - 公式 = {resid[k]:+.1f}")
+
+
+def write_coefficients(path, fits, terms, source_path):
+    """寫出 calculate_cashout 讀取的 JSON 係數檔（先寫暫存檔再改名）。"""
+    with open(source_path, "rb") as f:
+        source_sha1 = hashlib.sha1(f.read()).hexdigest()
+    payload = {
+        "terms": [list(t) for t in terms],
+        "source": os.path.basename(source_path),
+        "source_sha1": source_sha1,
+    }
+    for block, fit in fits.items():
+        payload[block] = {"coef": [float(c) for c in fit["coef"]], "r2": fit["r2"], "rmse": fit["rmse"]}
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def refit(csv_path=SMOOTH_PATH, out_path=COEFFICIENTS_PATH, degree=FIT_DEGREE, quiet=False):
+    """讀表、擬合、寫出係數檔；回傳擬合結果。"""
+    fits, terms = fit_tables(table_io.load_tables(csv_path), degree)
+    write_coefficients(out_path, fits, terms, csv_path)
+    cashout_calculate.reload_coefficients()
+    if not quiet:
+        print(f"兌現公式已重新擬合（{degree} 次多項式）並寫入 {out_path}")
+        print_fit_report(fits)
+    return fits
+
+
+def refit_after_calibration(csv_path=SMOOTH_PATH):
+    """校準腳本寫回平滑推算表後呼叫；REFIT_CASHOUT_FORMULA=0 時略過。"""
+    if REFIT_ENABLED:
+        refit(csv_path)
+
+
+if __name__ == "__main__":
+    refit(sys.argv[1] if len(sys.argv) > 1 else SMOOTH_PATH)
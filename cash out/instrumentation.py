@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+選配的效能剖析：設定環境變數 RTP_PROFILE=1（或呼叫 run_rtp_for_table(..., profile=True)）時，
+把模擬熱點函式換成「計數 + 抽樣計時」的包裝，結束時印出各階段摘要；未啟用時不替換任何函式，沒有額外開銷。
+
+階段（PHASES）：
+- shuffle：洗牌（Shoe._load、InfiniteShoe._refill、batch_engine.deal_cards）
+- hand_eval：單局 / 整批結算（play_round、_play_round_strategy_b、batch_engine.evaluate_batch）
+- lookup：查表（get_cashout_value）；另計以 0.8× 保守值兌現（表外格）的次數
+- dealer_play：莊家補牌與比牌期望值（dealer_play、_exact_stand_return）
+- exact：解析解與命中權重（exact_rtp.rtp_from_values、simulated_cell_weights）
+每次呼叫都計數，並以 perf_counter 抽樣計時：第 1 次必計時，之後間隔為 1..2N−1 的隨機整數（平均 N = RTP_PROFILE_SAMPLE，
+預設 64；取自獨立的 random.Random，避免與每 256 次才洗一批牌靴之類的週期對齊），總時間以抽樣平均 × 呼叫次數估計。
+階段彼此巢狀（hand_eval 含 lookup 與 dealer_play），各列為含子呼叫的時間。
+包裝只轉呼叫原函式，不消耗模擬的亂數流，結果與未啟用時逐位元相同。
+
+RTP_PROFILE_OUT=路徑 時另以 cProfile 記錄整段並寫出 pstats 檔（python -m pstats 路徑 檢視）；
+路徑含 {label} 時代入表名 / 腳本名，避免同一次執行的多段剖析互相覆蓋。
+"""
+import cProfile
+import functools
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+
+ENABLED = os.environ.get("RTP_PROFILE", "0").strip().lower() not in ("", "0", "false", "no")
+SAMPLE_EVERY = max(1, int(os.environ.get("RTP_PROFILE_SAMPLE", "64")))
+PROFILE_OUTPUT = os.environ.get("RTP_PROFILE_OUT", "").strip() or None
+
+PHASES = ("shuffle", "hand_eval", "lookup", "dealer_play", "exact")
+
+
+class PhaseTimer:
+    """單一函式的呼叫次數與抽樣計時。"""
+
+    __slots__ = ("phase", "name", "calls", "sampled", "seconds", "next_sample")
+
+    def __init__(self, phase, name):
+        self.phase = phase
+        self.name = name
+        self.calls = 0
+        self.next_sample = 1
+        self.sampled = 0
+        self.seconds = 0.0
+
+    @property
+    def mean_s(self):
+        return self.seconds / self.sampled if self.sampled else 0.0
+
+    @property
+    def estimated_s(self):
+        """抽樣平均 × 呼叫次數。"""
+        return self.mean_s * self.calls
+
+
+class Profiler:
+    """各函式的 PhaseTimer 與事件計數（counters）；一個行程共用模組層級的 PROFILER。"""
+
+    def __init__(self, sample_every=SAMPLE_EVERY):
+        self.sample_every = sample_every
+        self.timers = {}
+        self.counters = Counter()
+        self.lookup = None   # 批次引擎最近一次 get_lookup 的結果，用來判斷表外格
+        self._rng = random.Random(0)
+
+    def reset(self):
+        for timer in self.timers.values():
+            timer.calls = timer.sampled = 0
+            timer.seconds = 0.0
+            timer.next_sample = 1
+        self.counters.clear()
+
+    def timer(self, phase, name):
+        key = (phase, name)
+        if key not in self.timers:
+            self.timers[key] = PhaseTimer(phase, name)
+        return self.timers[key]
+
+    def wrap(self, func, phase, name):
+        """回傳計數 + 抽樣計時的包裝函式。"""
+        timer = self.timer(phase, name)
+        gap = functools.partial(self._rng.randint, 1, 2 * self.sample_every - 1)
+        perf = time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer.calls += 1
+            if timer.calls != timer.next_sample:
+                return func(*args, **kwargs)
+            timer.next_sample += gap()
+            start = perf()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.seconds += perf() - start
+                timer.sampled += 1
+        wrapper._instrumented = True
+        return wrapper
+
+    def wrap_cashout(self, func):
+        """get_cashout_value 的包裝：另計 DataFrame 查詢與表外格（0.8× 保守值）的次數。"""
+        from cashout_lookup import block_index
+        timed = self.wrap(func, "lookup", "get_cashout_value")
+        counters = self.counters
+
+        @functools.wraps(func)
+        def wrapper(tables, player_total, dealer_upcard, is_soft, is_pair, base_bet):
+            lookup = tables.get("lookup")
+            if lookup is None:
+                counters["lookup_dataframe"] += 1
+            elif not lookup.is_valid(block_index(is_soft, is_pair), player_total, dealer_upcard):
+                counters["cashout_fallback"] += 1
+            return timed(tables, player_total, dealer_upcard, is_soft, is_pair, base_bet)
+        wrapper._instrumented = True
+        return wrapper
+
+    def wrap_evaluate_batch(self, func):
+        """
+        batch_engine.evaluate_batch 的包裝：以自備的 hits 陣列取得每格兌現次數（再加回呼叫端的 hits），
+        表值為最近一次 get_lookup 的結果時，表外格的兌現手數計入 cashout_fallback。
+        """
+        import batch_engine
+        from round_log import N_CELLS
+        timed = self.wrap(func, "hand_eval", "batch_engine.evaluate_batch")
+        counters = self.counters
+
+        @functools.wraps(func)
+        def wrapper(cards, values, strategy='A', base_bet=batch_engine.BASE_BET, hits=None, sink=None):
+            own = np.zeros(N_CELLS, dtype=np.int64)
+            out = timed(cards, values, strategy, base_bet, own, sink)
+            if hits is not None:
+                hits += own
+            counters["batch_rounds"] += int(cards.shape[0])
+            lookup = self.lookup
+            if lookup is not None and values is lookup.values:
+                counters["batch_cashout_hands"] += int(own.sum())
+                counters["cashout_fallback"] += int(own[~lookup.valid.ravel()].sum())
+            return out
+        wrapper._instrumented = True
+        return wrapper
+
+    def wrap_get_lookup(self, func):
+        @functools.wraps(func)
+        def wrapper(tables):
+            self.lookup = func(tables)
+            return self.lookup
+        wrapper._instrumented = True
+        return wrapper
+
+    def print_summary(self, label, wall_s):
+        """印出各階段（含子呼叫）的呼叫次數、抽樣數、平均延遲與估計總時間，以及事件計數。"""
+        print(f"\n=== 效能剖析：{label}（總耗時 {wall_s:.2f}s，平均每 {self.sample_every} 次呼叫計時一次）===")
+        print(f"  {'階段':<11} {'函式':<34} {'呼叫次數':>12} {'抽樣':>9} {'平均 µs':>10} {'估計 s':>9} {'佔比':>7}")
+        order = {phase: i for i, phase in enumerate(PHASES)}
+        timers = sorted((t for t in self.timers.values() if t.calls),
+                        key=lambda t: (order.get(t.phase, len(order)), -t.estimated_s))
+        for t in timers:
+            share = t.estimated_s / wall_s * 100 if wall_s else 0.0
+            print(f"  {t.phase:<13} {t.name:<36} {t.calls:>14,} {t.sampled:>11,} {t.mean_s * 1e6:>12.3f}"
+                  f" {t.estimated_s:>11.3f} {share:>8.1f}%")
+        lookups = self.timers.get(("lookup", "get_cashout_value"))
+        cashed = (lookups.calls if lookups else 0) + self.counters["batch_cashout_hands"]
+        fallback = self.counters["cashout_fallback"]
+        if cashed:
+            print(f"  表外格以 0.8× 保守值兌現: {fallback:,} / {cashed:,} 次（{fallback / cashed * 100:.4f}%）")
+        if self.counters["lookup_dataframe"]:
+            print(f"  未編譯 lookup、走 DataFrame 查詢: {self.counters['lookup_dataframe']:,} 次")
+        if self.counters["batch_rounds"]:
+            print(f"  批次引擎局數: {self.counters['batch_rounds']:,}")
+        import dealer_probability
+        for name, info in dealer_probability.cache_info().items():
+            if info.hits or info.misses:
+                print(f"  dealer_probability.{name} 快取: 命中 {info.hits:,} / 未命中 {info.misses:,}")
+
+
+PROFILER = Profiler()
+_depth = 0
+
+
+def _patch(owner, attr, make_wrapper):
+    """以 make_wrapper(原函式) 取代 owner 的 attr（owner 為模組、類別或 globals() dict）；已包裝則略過。"""
+    if isinstance(owner, dict):
+        func = owner.get(attr)
+        if func is not None and not getattr(func, "_instrumented", False):
+            owner[attr] = make_wrapper(func)
+        return
+    func = getattr(owner, attr, None)
+    if func is not None and not getattr(func, "_instrumented", False):
+        setattr(owner, attr, make_wrapper(func))
+
+
+def install(namespace=None, profiler=None):
+    """
+    替換共用模組（shoe、batch_engine、exact_rtp）的熱點函式；namespace 為「cash out RTP.py」的 globals()
+    時一併替換逐局引擎的函式。可重複呼叫（已包裝的函式不會再包一次）。
+    """
+    import batch_engine
+    import exact_rtp
+    import shoe
+    p = profiler or PROFILER
+    _patch(shoe.Shoe, "_load", lambda f: p.wrap(f, "shuffle", "Shoe._load"))
+    _patch(shoe.InfiniteShoe, "_refill", lambda f: p.wrap(f, "shuffle", "InfiniteShoe._refill"))
+    _patch(batch_engine, "deal_cards", lambda f: p.wrap(f, "shuffle", "batch_engine.deal_cards"))
+    _patch(batch_engine, "evaluate_batch", p.wrap_evaluate_batch)
+    _patch(batch_engine, "get_lookup", p.wrap_get_lookup)
+    _patch(exact_rtp, "rtp_from_values", lambda f: p.wrap(f, "exact", "exact_rtp.rtp_from_values"))
+    _patch(exact_rtp, "simulated_cell_weights", lambda f: p.wrap(f, "exact", "exact_rtp.simulated_cell_weights"))
+    if namespace is not None:
+        _patch(namespace, "play_round", lambda f: p.wrap(f, "hand_eval", "play_round"))
+        _patch(namespace, "_play_round_strategy_b", lambda f: p.wrap(f, "hand_eval", "_play_round_strategy_b"))
+        _patch(namespace, "get_cashout_value", p.wrap_cashout)
+        _patch(namespace, "dealer_play", lambda f: p.wrap(f, "dealer_play", "dealer_play"))
+        _patch(namespace, "_exact_stand_return", lambda f: p.wrap(f, "dealer_play", "_exact_stand_return"))
+
+
+def output_path(label, output=PROFILE_OUTPUT):
+    """pstats 檔路徑：output 含 {label} 時代入（去除不適合檔名的字元）。"""
+    if output is None:
+        return None
+    return output.replace("{label}", re.sub(r'[\\/:*?"<>|\s]+', "_", label))
+
+
+@contextmanager
+def session(label, enabled=None, namespace=None, output=PROFILE_OUTPUT):
+    """
+    剖析一段執行：enabled 為 None 時依 RTP_PROFILE。啟用時安裝包裝、歸零計數，結束時印出摘要，
+    output（RTP_PROFILE_OUT）非空時另寫 cProfile 的 pstats 檔。巢狀的 session 併入最外層，不重複輸出。
+    """
+    global _depth
+    if not (ENABLED if enabled is None else enabled):
+        yield None
+        return
+    install(namespace)
+    _depth += 1
+    if _depth > 1:
+        try:
+            yield PROFILER
+        finally:
+            _depth -= 1
+        return
+    PROFILER.reset()
+    profile = cProfile.Profile() if output else None
+    start = time.perf_counter()
+    if profile is not None:
+        profile.enable()
+    try:
+        yield PROFILER
+    finally:
+        if profile is not None:
+            profile.disable()
+        _depth -= 1
+        PROFILER.print_summary(label, time.perf_counter() - start)
+        if profile is not None:
+            path = output_path(label, output)
+            profile.dump_stats(path)
+            print(f"  cProfile 結果已寫入 {path}")
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+逐手結果紀錄：模擬時把每一手的 (明牌, 玩家點數, 旗標, 兌現格, 拿回金額, 下注) 寫成定長紀錄，
+事後不需重跑即可追查 RTP 偏差。
+
+寫入端 RoundLogWriter 只保留一個 chunk_rows 筆的預先配置緩衝區，寫滿即落地，記憶體用量固定：
+- format="npy"：目錄下依序寫出 chunk_00000.npy、chunk_00001.npy…（結構化陣列，可 memory-map），
+  close() 時寫出 manifest.json 記錄 chunk 數與筆數；開始寫入時先清除目錄內舊的 chunk 與 manifest
+- format="parquet"：單一 .parquet 檔，每個 chunk 一個 row group（需安裝 pyarrow）
+
+讀取端 iter_chunks / aggregate_by_cell 逐 chunk 讀取（npy 以 memory-map、parquet 逐 row group），
+不會把整份紀錄載入記憶體，1e8 局的紀錄也能彙總。npy 目錄只讀 manifest 列出的 chunk 並核對筆數，
+沒有 manifest（寫入未正常結束）或內容不符時引發 RoundLogError，不會把不完整或其他次執行的紀錄混進分析。
+
+紀錄以「手」為單位：策略 B 分牌的兩手各一筆（第二筆帶 FLAG_SPLIT_SECOND），BJ 局一筆；
+每局 RTP 仍為 Σ拿回 / Σ下注。兌現格 cell 為 CashoutLookup 的攤平索引（-1 表示未兌現）。
+"""
+import glob
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from cashout_lookup import N_TOTALS, N_UPCARDS
+
+RECORD_DTYPE = np.dtype([
+    ("upcard", "u1"),
+    ("total", "u1"),
+    ("flags", "u1"),
+    ("cell", "i2"),
+    ("payout", "f8"),
+    ("bet", "u2"),
+])
+
+FLAG_SOFT = 1
+FLAG_PAIR = 2
+FLAG_BLACKJACK = 4
+FLAG_STAND = 8           # 硬 17+ 不可兌現，與莊家比牌
+FLAG_SPLIT = 16          # 策略 B 分牌後的手
+FLAG_SPLIT_SECOND = 32   # 分牌的第二手（與前一筆屬同一局）
+
+DEFAULT_CHUNK_ROWS = 1 << 20
+MANIFEST_NAME = "manifest.json"
+N_CELLS = 3 * N_TOTALS * N_UPCARDS
+
+CellAggregate = namedtuple("CellAggregate", [
+    "hits", "returns", "bj_hands", "bj_return", "stand_hands", "stand_return", "n_hands", "total_bet",
+])
+CellAggregate.__doc__ = """
+aggregate_by_cell 的結果。hits / returns: (3, 22, 12) 陣列，每格兌現次數與拿回金額合計；
+bj_* / stand_*: BJ 與比牌的手數及拿回金額；n_hands / total_bet: 全部手數與下注合計。
+"""
+
+
+class RoundLogError(ValueError):
+    """逐手紀錄不完整或與 manifest 不符。"""
+
+
+def _chunk_path(path, index):
+    return os.path.join(path, f"chunk_{index:05d}.npy")
+
+
+class RoundLogWriter:
+    """逐手紀錄的串流寫入端；以 with 使用或最後呼叫 close()。"""
+
+    def __init__(self, path, format="npy", chunk_rows=DEFAULT_CHUNK_ROWS):
+        if format not in ("npy", "parquet"):
+            raise ValueError(f"不支援的紀錄格式: {format}")
+        self.path = path
+        self.format = format
+        self.rows = 0
+        self._buf = np.empty(chunk_rows, dtype=RECORD_DTYPE)
+        self._fill = 0
+        self._n_chunks = 0
+        self._parquet = None
+        if format == "npy":
+            os.makedirs(path, exist_ok=True)
+            # 同一目錄重複使用時，先移除上一次的 manifest 與 chunk（manifest 先刪，中斷時不會留下對不上的 manifest）
+            manifest = os.path.join(path, MANIFEST_NAME)
+            if os.path.exists(manifest):
+                os.remove(manifest)
+            for old in glob.glob(os.path.join(path, "chunk_*.npy")):
+                os.remove(old)
+        else:
+            import pyarrow.parquet as pq   # 選配相依
+            self._pq = pq
+            parent = os.path.dirname(os.path.abspath(path))
+            os.makedirs(parent, exist_ok=True)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def append(self, records):
+        """加入一批紀錄（RECORD_DTYPE 結構化陣列）。"""
+        start = 0
+        while start < records.shape[0]:
+            take = min(self._buf.shape[0] - self._fill, records.shape[0] - start)
+            self._buf[self._fill:self._fill + take] = records[start:start + take]
+            self._fill += take
+            start += take
+            if self._fill == self._buf.shape[0]:
+                self._flush()
+        self.rows += records.shape[0]
+
+    def _flush(self):
+        if not self._fill:
+            return
+        chunk = self._buf[:self._fill]
+        if self.format == "npy":
+            np.save(_chunk_path(self.path, self._n_chunks), chunk)
+        else:
+            table = _to_arrow(chunk)
+            if self._parquet is None:
+                self._parquet = self._pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table, row_group_size=self._fill)
+        self._n_chunks += 1
+        self._fill = 0
+
+    def close(self, complete=True):
+        """寫出剩餘緩衝；complete=False（例如模擬中途發生例外）時不寫 manifest，讀取端會拒絕這份紀錄。"""
+        self._flush()
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+        if self.format == "npy" and complete:
+            self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = {"format": "npy", "n_chunks": self._n_chunks, "rows": self.rows,
+                    "fields": list(RECORD_DTYPE.names)}
+        tmp = os.path.join(self.path, MANIFEST_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(self.path, MANIFEST_NAME))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+
+
+def _to_arrow(chunk):
+    import pyarrow as pa
+    return pa.table({name: chunk[name] for name in RECORD_DTYPE.names})
+
+
+def read_manifest(path):
+    """讀取 npy 紀錄目錄的 manifest（{"n_chunks", "rows", …}）；不存在時引發 RoundLogError。"""
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise RoundLogError(f"{path}: 找不到 {MANIFEST_NAME}（寫入未正常結束，或不是 RoundLogWriter 的輸出）")
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def iter_chunks(path):
+    """
+    逐 chunk 讀出紀錄（RECORD_DTYPE 陣列）；path 為 npy 目錄或 .parquet 檔。
+    npy 目錄只讀 manifest 列出的 chunk，缺檔或筆數與 manifest 不符時引發 RoundLogError。
+    """
+    if os.path.isdir(path):
+        manifest = read_manifest(path)
+        rows = 0
+        for i in range(manifest["n_chunks"]):
+            chunk_path = _chunk_path(path, i)
+            if not os.path.exists(chunk_path):
+                raise RoundLogError(f"{path}: manifest 列出的 {os.path.basename(chunk_path)} 不存在")
+            chunk = np.load(chunk_path, mmap_mode="r")
+            rows += chunk.shape[0]
+            yield chunk
+        if rows != manifest["rows"]:
+            raise RoundLogError(f"{path}: 讀到 {rows} 筆，manifest 記錄 {manifest['rows']} 筆")
+        return
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(path)
+    for i in range(pf.num_row_groups):
+        group = pf.read_row_group(i)
+        out = np.empty(group.num_rows, dtype=RECORD_DTYPE)
+        for name in RECORD_DTYPE.names:
+            out[name] = group.column(name).to_numpy()
+        yield out
+
+
+def aggregate_by_cell(path):
+    """逐 chunk 彙總紀錄，回傳 CellAggregate。"""
+    hits = np.zeros(N_CELLS, dtype=np.int64)
+    returns = np.zeros(N_CELLS)
+    bj_hands = stand_hands = n_hands = 0
+    bj_return = stand_return = total_bet = 0.0
+    for chunk in iter_chunks(path):
+        cell = np.asarray(chunk["cell"])
+        payout = np.asarray(chunk["payout"])
+        flags = np.asarray(chunk["flags"])
+        cashed = cell >= 0
+        hits += np.bincount(cell[cashed], minlength=N_CELLS)
+        returns += np.bincount(cell[cashed], weights=payout[cashed], minlength=N_CELLS)
+        bj = (flags & FLAG_BLACKJACK) != 0
+        stand = (flags & FLAG_STAND) != 0
+        bj_hands += int(bj.sum())
+        bj_return += float(payout[bj].sum())
+        stand_hands += int(stand.sum())
+        stand_return += float(payout[stand].sum())
+        n_hands += int(chunk.shape[0])
+        total_bet += float(np.asarray(chunk["bet"], dtype=np.float64).sum())
+    shape = (3, N_TOTALS, N_UPCARDS)
+    return CellAggregate(hits.reshape(shape), returns.reshape(shape), bj_hands, bj_return,
+                         stand_hands, stand_return, n_hands, total_bet)
+
+
+def make_records(upcard, total, flags, cell, payout, bet):
+    """由同長度的欄位陣列組成 RECORD_DTYPE 結構化陣列。"""
+    out = np.empty(np.shape(upcard)[0], dtype=RECORD_DTYPE)
+    out["upcard"] = upcard
+    out["total"] = total
+    out["flags"] = flags
+    out["cell"] = cell
+    out["payout"] = payout
+    out["bet"] = bet
+    return out
+
+
+def print_summary(path, top=10):
+    """印出紀錄的 RTP 與拿回金額最多的 top 個兌現格。"""
+    from cashout_lookup import BLOCK_NAMES
+    agg = aggregate_by_cell(path)
+    rtp = agg.returns.sum() + agg.bj_return + agg.stand_return
+    print(f"{path}: {agg.n_hands} 手 | RTP {rtp / agg.total_bet * 100:.4f}%")
+    print(f"  BJ: {agg.bj_hands} 手，拿回 {agg.bj_return:.0f} | 比牌: {agg.stand_hands} 手，拿回 {agg.stand_return:.0f}")
+    for flat in np.argsort(agg.returns.ravel())[::-1][:top]:
+        b, total, col = np.unravel_index(flat, agg.returns.shape)
+        share = agg.returns.ravel()[flat] / agg.total_bet * 100
+        print(f"  {BLOCK_NAMES[b]:5s} {total:2d} vs {col:2d}: {agg.hits.ravel()[flat]} 次，貢獻 RTP {share:.4f}%")
+
+
+if __name__ == "__main__":
+    import sys
+    for log_path in sys.argv[1:]:
+        print_summary(log_path)
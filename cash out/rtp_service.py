@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+常駐 RTP 服務：啟動時載入兌現表、編譯查表並預先算好 exact_rtp 的 cell_weights 與莊家機率快取，
+之後以本機 HTTP/JSON（或 Unix socket）接收整表上傳與逐格修改，回傳策略 A / B 的精確或模擬 RTP。
+免去每次修改表格都重新 import pandas、重新解析 CSV、從零模擬的冷啟動成本；精確 RTP 為毫秒級。
+
+啟動：python rtp_service.py
+  RTP_SERVICE_HOST / RTP_SERVICE_PORT：監聽位址（預設 127.0.0.1:8765）
+  RTP_SERVICE_SOCKET：改為監聽此 Unix socket 路徑（例如 curl --unix-socket 使用）
+  RTP_SERVICE_WARM_DECKS：啟動時預先計算 cell_weights 的牌組，逗號分隔（預設 "inf,8"）
+
+API（皆為 JSON）：
+  GET    /health                    服務狀態與已載入的表名
+  GET    /tables/<名稱>              表值 {"hard": {列: {明牌: 值}}, "soft": …, "split": …}
+  PUT    /tables/<名稱>              上傳整表：{"csv": "平滑推算表格式的 CSV 內容"} 或 {"from": "既有表名"}
+  PATCH  /tables/<名稱>              逐格修改：{"cells": [{"block": "hard", "total": 16, "upcard": 10, "value": 85}, …]}
+  DELETE /tables/<名稱>
+  POST   /rtp                       {"table": 名稱, "mode": "exact"|"simulate", "num_decks": null|8,
+                                     "rounds": 局數, "seed": 整數, "precision": 百分點}
+
+上傳與修改會回傳修改後的精確 RTP（無限副牌）；逐格修改以 IncrementalRTP 只重算改到的格子並回傳差值；模擬走 batch_engine，策略 A / B 在常駐執行緒池中同時執行。
+"""
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 專案根目錄放有共用模組（rng_streams.py、dealer_probability.py 等）
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import batch_engine
+import exact_rtp
+import rng_streams
+import table_io
+from cashout_lookup import BLOCK_NAMES, EditableTable, compile_lookup
+
+SERVICE_HOST = os.environ.get("RTP_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("RTP_SERVICE_PORT", "8765"))
+SERVICE_SOCKET = os.environ.get("RTP_SERVICE_SOCKET", "").strip() or None
+WARM_DECKS = [None if d.strip().lower() in ("inf", "infinite") else int(d)
+              for d in os.environ.get("RTP_SERVICE_WARM_DECKS", "inf,8").split(",") if d.strip()]
+DEFAULT_TABLE = "平滑推算表"
+SMOOTH_PATH = os.path.join(SCRIPT_DIR, "data", "blackjack 對照表 - 平滑推算表.csv")
+DEFAULT_SIM_ROUNDS = 10_000_000
+MAX_SIM_ROUNDS = 1_000_000_000
+
+
+class ServiceError(Exception):
+    """回應給客戶端的錯誤（HTTP 狀態碼 + 訊息）。"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _parse_num_decks(value):
+    """null / "inf" 為無限副牌，其餘須為正整數；不合法時回 400。"""
+    if value is None or str(value).strip().lower() in ("inf", "infinite"):
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"num_decks 需為正整數或 \"inf\"，收到 {value!r}")
+    num_decks = int(value)
+    if num_decks <= 0:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"num_decks 需為正整數或 \"inf\"，收到 {value!r}")
+    return num_decks
+
+
+class TableStore:
+    """
+    已載入的兌現表。每張表為 {'hard','soft','split','lookup'} dict，並附一個 exact_rtp.IncrementalRTP（無限副牌）；
+    修改時以 EditableTable 套用、只重算改到的格子，再整份替換（copy-on-write），正在計算的請求持有舊快照。
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._evaluators = {}
+        self._lock = threading.Lock()
+
+    def names(self):
+        with self._lock:
+            return sorted(self._tables)
+
+    def get(self, name):
+        with self._lock:
+            tables = self._tables.get(name)
+        if tables is None:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"找不到表格: {name}")
+        return tables
+
+    def put(self, name, tables):
+        tables = {block: tables[block] for block in BLOCK_NAMES}
+        tables["lookup"] = compile_lookup(tables)
+        evaluator = exact_rtp.IncrementalRTP.from_tables(tables)
+        with self._lock:
+            self._tables[name] = tables
+            self._evaluators[name] = evaluator
+        return tables
+
+    def delete(self, name):
+        with self._lock:
+            if self._tables.pop(name, None) is None:
+                raise ServiceError(HTTPStatus.NOT_FOUND, f"找不到表格: {name}")
+            del self._evaluators[name]
+
+    def patch(self, name, cells):
+        """套用 [{"block", "total", "upcard", "value"}, …]，回傳 (修改後的 IncrementalRTP, (Δrtp_a, Δrtp_b))。"""
+        with self._lock:
+            old = self._tables.get(name)
+            if old is None:
+                raise ServiceError(HTTPStatus.NOT_FOUND, f"找不到表格: {name}")
+            editable = EditableTable(old)
+            for cell in cells:
+                try:
+                    editable.set(*_parse_cell(cell))
+                except KeyError as e:
+                    raise ServiceError(HTTPStatus.BAD_REQUEST, e.args[0])
+            evaluator = self._evaluators[name].copy()
+            delta = evaluator.update(editable)
+            self._tables[name] = editable.to_tables()
+            self._evaluators[name] = evaluator
+        return evaluator, delta
+
+
+def _parse_cell(cell):
+    try:
+        block = str(cell["block"])
+        total = int(cell["total"])
+        upcard = int(cell["upcard"])
+        value = float(cell["value"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"格子格式錯誤 {cell!r}: {e}")
+    if block not in BLOCK_NAMES:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"未知區塊: {block}")
+    # 與上傳 / 載入 CSV 相同的範圍（table_io），NaN 亦不通過
+    if not table_io.VALUE_MIN <= value <= table_io.VALUE_MAX:
+        raise ServiceError(HTTPStatus.BAD_REQUEST,
+                           f"數值 {value:g} 超出 [{table_io.VALUE_MIN:g}, {table_io.VALUE_MAX:g}]: {cell!r}")
+    return block, total, 11 if upcard == 1 else upcard, value
+
+
+def load_csv_text(text):
+    """解析平滑推算表格式的 CSV 內容（與 load_cashout_tables 相同規則）。"""
+    try:
+        return table_io.parse_tables_text(str(text))
+    except table_io.TableFormatError as e:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"CSV 格式錯誤: {e}")
+
+
+class RTPService:
+    """服務狀態：表格、常駐執行緒池與已預熱的 cell_weights。"""
+
+    def __init__(self, warm_decks=WARM_DECKS):
+        self.store = TableStore()
+        self.pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rtp-sim")
+        self.started = time.time()
+        for num_decks in warm_decks:
+            exact_rtp.cell_weights(num_decks)
+
+    def exact(self, tables, num_decks=None):
+        rtp_a, rtp_b = exact_rtp.exact_rtp(tables, num_decks)
+        return {"rtp_a": rtp_a, "rtp_b": rtp_b}
+
+    def simulate(self, tables, rounds, seed=None, num_decks=8, precision=None):
+        seed = rng_streams.make_seed(seed)
+        futures = {
+            strategy: self.pool.submit(batch_engine.simulate_stats, tables, rounds, seed=seed, strategy=strategy,
+                                       num_decks=num_decks, precision=precision)
+            for strategy in ('A', 'B')
+        }
+        out = {"seed": str(seed)}
+        for strategy, future in futures.items():
+            stats = future.result()
+            key = strategy.lower()
+            out[f"rtp_{key}"] = stats.rtp_pct
+            out[f"half_width_{key}"] = stats.half_width()
+            out[f"rounds_{key}"] = stats.n
+        return out
+
+    def handle(self, method, path, body):
+        """分派一個請求，回傳 JSON 可序列化的 dict。"""
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        if method == "GET" and parts == ["health"]:
+            return {"status": "ok", "tables": self.store.names(), "uptime_s": time.time() - self.started}
+        if method == "POST" and parts == ["rtp"]:
+            return self._rtp(body)
+        if len(parts) == 2 and parts[0] == "tables":
+            name = unquote(parts[1])
+            if method == "GET":
+                return _dump_tables(self.store.get(name))
+            if method == "PUT":
+                return self._put(name, body)
+            if method == "PATCH":
+                return self._patch(name, body)
+            if method == "DELETE":
+                self.store.delete(name)
+                return {"deleted": name}
+        raise ServiceError(HTTPStatus.NOT_FOUND, f"不支援的請求: {method} {path}")
+
+    def _put(self, name, body):
+        if "csv" in body:
+            tables = load_csv_text(body["csv"])
+        elif "from" in body:
+            tables = self.store.get(str(body["from"]))
+        else:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "需提供 csv 或 from")
+        tables = self.store.put(name, tables)
+        return {"table": name, **self.exact(tables)}
+
+    def _patch(self, name, body):
+        cells = body.get("cells")
+        if not isinstance(cells, list) or not cells:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "cells 需為非空陣列")
+        evaluator, (delta_a, delta_b) = self.store.patch(name, cells)
+        rtp_a, rtp_b = evaluator.rtp
+        return {"table": name, "rtp_a": rtp_a, "rtp_b": rtp_b, "delta_a": delta_a, "delta_b": delta_b}
+
+    def _rtp(self, body):
+        tables = self.store.get(str(body.get("table", DEFAULT_TABLE)))
+        mode = str(body.get("mode", "exact")).lower()
+        t0 = time.perf_counter()
+        try:
+            if mode == "exact":
+                out = self.exact(tables, _parse_num_decks(body.get("num_decks")))
+            elif mode == "simulate":
+                rounds = int(float(body.get("rounds", DEFAULT_SIM_ROUNDS)))
+                if not 0 < rounds <= MAX_SIM_ROUNDS:
+                    raise ServiceError(HTTPStatus.BAD_REQUEST, f"rounds 需介於 1 與 {MAX_SIM_ROUNDS}")
+                precision = body.get("precision")
+                out = self.simulate(tables, rounds, body.get("seed"), _parse_num_decks(body.get("num_decks", 8)),
+                                    float(precision) if precision is not None else None)
+            else:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, f"未知模式: {mode}")
+        except (TypeError, ValueError) as e:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, str(e))
+        out["mode"] = mode
+        out["elapsed_ms"] = (time.perf_counter() - t0) * 1000
+        return out
+
+
+def _dump_tables(tables):
+    return {
+        block: {str(row): {str(col): float(v) for col, v in tables[block].loc[row].items()}
+                for row in tables[block].index}
+        for block in BLOCK_NAMES
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None   # 由 make_server 設定
+
+    def _dispatch(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError as e:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, f"JSON 格式錯誤: {e}")
+            if not isinstance(body, dict):
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "請求內容需為 JSON 物件")
+            status, payload = HTTPStatus.OK, self.service.handle(self.command, self.path, body)
+        except ServiceError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception as e:
+            # 未預期的錯誤仍回傳 JSON 500，避免客戶端只看到連線中斷
+            self.log_error("%s", traceback.format_exc().rstrip())
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_PUT = do_PATCH = do_DELETE = do_POST = _dispatch
+
+    def address_string(self):
+        # Unix socket 的 client_address 為空字串
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, fmt, *args):
+        sys.stderr.write(f"[rtp_service] {self.address_string()} {fmt % args}\n")
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def make_server(service, host=SERVICE_HOST, port=SERVICE_PORT, socket_path=SERVICE_SOCKET):
+    """建立（尚未啟動的）HTTP 伺服器；socket_path 指定時監聽 Unix socket。"""
+    handler = type("RTPHandler", (_Handler,), {"service": service})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return _UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    t0 = time.perf_counter()
+    service = RTPService()
+    service.store.put(DEFAULT_TABLE, table_io.load_tables(SMOOTH_PATH))
+    server = make_server(service)
+    where = SERVICE_SOCKET or f"http://{SERVICE_HOST}:{server.server_port}"
+    print(f"RTP 服務已啟動於 {where}（預熱 {time.perf_counter() - t0:.1f} 秒，表格: {service.store.names()}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.pool.shutdown(wait=False)
+        if SERVICE_SOCKET and os.path.exists(SERVICE_SOCKET):
+            os.remove(SERVICE_SOCKET)
+
+
+if __name__ == "__main__":
+    main()
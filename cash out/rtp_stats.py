@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+RTP 模擬的執行中統計：累積每局 (拿回金額, 下注金額) 的一階、二階動差，
+隨時給出 RTP、標準誤與信賴區間，並判斷是否已達要求的精度（可提前停止模擬）。
+
+RTP = Σ拿回 / Σ下注 為比例估計量（策略 B 每局下注 1 或 2 注），標準誤以 delta method 計算：
+    Var(RTP) ≈ Var(拿回 - RTP × 下注) / (n × 平均下注²)
+策略 A 每局下注固定時即退化為一般的 Var(拿回) / (n × 注金²)。
+"""
+import math
+
+import numpy as np
+
+CONFIDENCE_Z = 1.96          # 95% 信賴區間
+MIN_ROUNDS_FOR_STOP = 100_000  # 提前停止前至少模擬的局數，避免早期變異數估計不穩
+
+
+class RatioStats:
+    """Σ拿回 / Σ下注 的執行中統計。"""
+
+    __slots__ = ("n", "sum_r", "sum_b", "sum_rr", "sum_bb", "sum_rb", "seed")
+    _MOMENTS = ("n", "sum_r", "sum_b", "sum_rr", "sum_bb", "sum_rb")
+
+    def __init__(self, seed=None):
+        # 產生這份統計的亂數 seed（見 rng_streams），供重現；合併時保留自己的值
+        self.seed = seed
+        self.n = 0
+        self.sum_r = 0.0
+        self.sum_b = 0.0
+        self.sum_rr = 0.0
+        self.sum_bb = 0.0
+        self.sum_rb = 0.0
+
+    def add(self, returned, bet):
+        """加入一局。"""
+        self.n += 1
+        self.sum_r += returned
+        self.sum_b += bet
+        self.sum_rr += returned * returned
+        self.sum_bb += bet * bet
+        self.sum_rb += returned * bet
+
+    def add_batch(self, returned, bet):
+        """加入一批（NumPy 陣列）。"""
+        self.n += int(returned.shape[0])
+        self.sum_r += float(returned.sum())
+        self.sum_b += float(bet.sum())
+        self.sum_rr += float((returned * returned).sum())
+        self.sum_bb += float((bet * bet).sum())
+        self.sum_rb += float((returned * bet).sum())
+
+    def merge(self, other):
+        """合併另一份統計（例如平行 worker 的結果）。"""
+        for name in self._MOMENTS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def to_dict(self):
+        """可 JSON 序列化的 dict（檢查點用）；浮點數以 repr 往返，還原後繼續累加的結果逐位元相同。"""
+        return {name: getattr(self, name) for name in ("seed",) + self._MOMENTS}
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(d["seed"])
+        for name in cls._MOMENTS:
+            setattr(stats, name, d[name])
+        return stats
+
+    @property
+    def rtp_pct(self):
+        return (self.sum_r / self.sum_b) * 100 if self.sum_b > 0 else 0.0
+
+    @property
+    def std_error_pct(self):
+        """RTP 的標準誤（百分點）。"""
+        if self.n < 2 or self.sum_b <= 0:
+            return float("inf")
+        n = self.n
+        ratio = self.sum_r / self.sum_b
+        mean_b = self.sum_b / n
+        # E[(r - ratio·b)²]；以 ratio 代入後其平均恰為 0，故即為變異數
+        resid = (self.sum_rr - 2 * ratio * self.sum_rb + ratio * ratio * self.sum_bb) / n
+        var = max(resid, 0.0) * n / (n - 1)
+        return math.sqrt(var / n) / mean_b * 100
+
+    def half_width(self, z=CONFIDENCE_Z):
+        """信賴區間半寬（百分點）。"""
+        return z * self.std_error_pct
+
+    def interval(self, z=CONFIDENCE_Z):
+        """(下界%, 上界%)"""
+        rtp, half = self.rtp_pct, self.half_width(z)
+        return rtp - half, rtp + half
+
+    def reached(self, precision, z=CONFIDENCE_Z):
+        """信賴區間半寬是否已 ≤ precision（百分點）；precision 為 None / 0 表示不提前停止。"""
+        if not precision or self.n < MIN_ROUNDS_FOR_STOP:
+            return False
+        return self.half_width(z) <= precision
+
+    def summary(self, z=CONFIDENCE_Z):
+        """進度列用的簡短字串，如「96.80% ± 0.012% (SE 0.0061%)」。"""
+        return f"{self.rtp_pct:.4f}% ± {self.half_width(z):.4f}% (SE {self.std_error_pct:.4f}%)"
+
+
+class JointRatioStats:
+    """
+    多組設定（不同兌現表 / 策略）在同一批牌上的聯合統計，用於共同亂數 (CRN) 配對比較。
+    每組 k 有 (拿回 r_k, 下注 b_k)；累積所有變數的一階與交叉二階動差，
+    RTP 差值 RTP_i - RTP_j 的標準誤以 delta method 計算，自動計入兩者的正相關。
+    """
+
+    def __init__(self, n_configs):
+        self.k = n_configs
+        self.n = 0
+        self._sum = np.zeros(2 * n_configs)
+        self._cross = np.zeros((2 * n_configs, 2 * n_configs))
+
+    def add_batch(self, results):
+        """results: [(returned, bet), ...]，每組一對同長度的 NumPy 陣列（同一批牌）。"""
+        cols = np.empty((results[0][0].shape[0], 2 * self.k))
+        for i, (returned, bet) in enumerate(results):
+            cols[:, 2 * i] = returned
+            cols[:, 2 * i + 1] = bet
+        self.n += cols.shape[0]
+        self._sum += cols.sum(axis=0)
+        self._cross += cols.T @ cols
+
+    def _means_cov(self):
+        mean = self._sum / self.n
+        cov = (self._cross / self.n - np.outer(mean, mean)) * self.n / max(self.n - 1, 1)
+        return mean, cov
+
+    def rtp_pct(self, i):
+        return self._sum[2 * i] / self._sum[2 * i + 1] * 100
+
+    def _gradient(self, i, mean):
+        """RTP_i（比例）對各平均數的梯度。"""
+        g = np.zeros(2 * self.k)
+        g[2 * i] = 1.0 / mean[2 * i + 1]
+        g[2 * i + 1] = -mean[2 * i] / mean[2 * i + 1] ** 2
+        return g
+
+    def std_error_pct(self, i):
+        mean, cov = self._means_cov()
+        g = self._gradient(i, mean)
+        return math.sqrt(max(g @ cov @ g, 0.0) / self.n) * 100
+
+    def diff_pct(self, i, j):
+        """RTP_i - RTP_j（百分點）。"""
+        return self.rtp_pct(i) - self.rtp_pct(j)
+
+    def diff_std_error_pct(self, i, j):
+        """配對差值的標準誤（百分點）。"""
+        mean, cov = self._means_cov()
+        g = self._gradient(i, mean) - self._gradient(j, mean)
+        return math.sqrt(max(g @ cov @ g, 0.0) / self.n) * 100
+
+    def independent_diff_std_error_pct(self, i, j):
+        """假設兩組使用獨立牌局時差值的標準誤，用來對照 CRN 的變異數縮減。"""
+        return math.hypot(self.std_error_pct(i), self.std_error_pct(j))
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+逐局引擎的牌靴：預先洗好的整副牌靴放在陣列緩衝區，以讀取游標發牌，取代每局檢查 len(shoe)、
+list.extend 新牌再對整個串列 random.shuffle 的做法。
+
+兩種模式：
+- Shoe（num_decks 副牌 + 切牌卡）：一次以 NumPy 洗好 SHOE_BATCH 副牌靴，游標越過切牌卡後，
+  下一局開始時換上一副新牌靴。penetration 為切牌卡位置（佔整副牌靴的比例）。
+- InfiniteShoe（無限副牌 / 連續洗牌機 CSM）：每張牌獨立、13 種牌面等機率，
+  自預先產生的亂數位元組流依序讀取，讀完再整批補充。Infinite Blackjack 實際即以此方式發牌。
+
+兩者都提供 pop()（與原本的 list 牌靴相同用法）與 start_round()（每局開始時呼叫，必要時換牌靴）。
+亂數流取自 rng_streams.generator(seed, *key)；seed 為 None 時自動產生，並記錄在 shoe.seed 以便重現。
+"""
+import numpy as np
+
+import rng_streams
+
+# 牌值：2-10 直接對應，J, Q, K 當作 10，A 當作 11
+FACE_VALUES = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11], dtype=np.uint8)
+SINGLE_DECK = np.tile(FACE_VALUES, 4)
+
+DEFAULT_NUM_DECKS = 8
+SHOE_BATCH = 256               # 一次洗好的牌靴數
+INFINITE_STREAM_CARDS = 1 << 20  # 無限副牌模式一次產生的牌數
+
+
+class Shoe:
+    """num_decks 副牌的牌靴，游標越過切牌卡後於下一局開始時換上新牌靴。"""
+
+    __slots__ = ("num_decks", "cut", "seed", "_rng", "_batch", "_next", "_cards", "_pos")
+
+    def __init__(self, num_decks=DEFAULT_NUM_DECKS, penetration=None, seed=None, key=("shoe",)):
+        if penetration is None:
+            # 預設剩不到 1 副牌時洗牌（已發張數 > cut），與原本 len(shoe) < 52 的規則相同
+            penetration = 1.0 - 1.0 / num_decks if num_decks > 1 else 0.75
+        if not 0.0 < penetration < 1.0:
+            raise ValueError("penetration 必須介於 0 與 1 之間")
+        self.num_decks = num_decks
+        self.cut = int(len(SINGLE_DECK) * num_decks * penetration)
+        self.seed = rng_streams.make_seed(seed)
+        self._rng = rng_streams.generator(self.seed, *key)
+        self._batch = None
+        self._next = SHOE_BATCH
+        self._load()
+
+    def _load(self):
+        """換上下一副已洗好的牌靴；整批用完時一次洗 SHOE_BATCH 副。"""
+        if self._next >= SHOE_BATCH:
+            full = np.tile(SINGLE_DECK, self.num_decks)
+            self._batch = self._rng.permuted(np.tile(full, (SHOE_BATCH, 1)), axis=1)
+            self._next = 0
+        # 純量發牌走 Python list，避免每張牌產生 numpy 純量
+        self._cards = self._batch[self._next].tolist()
+        self._next += 1
+        self._pos = 0
+
+    def start_round(self):
+        """每局開始時呼叫：已越過切牌卡（已發張數 > cut）則換新牌靴。"""
+        if self._pos > self.cut:
+            self._load()
+
+    def get_state(self):
+        """(可 JSON 序列化的 dict, {名稱: 陣列})，供檢查點保存；set_state 還原後發出的牌與原牌靴完全相同。"""
+        state = {"rng": self._rng.bit_generator.state, "next": self._next, "pos": self._pos}
+        return state, {"shoe_batch": self._batch}
+
+    def set_state(self, state, arrays):
+        self._rng.bit_generator.state = state["rng"]
+        self._batch = arrays["shoe_batch"]
+        self._next = state["next"]
+        self._cards = self._batch[self._next - 1].tolist()
+        self._pos = state["pos"]
+
+    def pop(self):
+        """發一張牌。牌靴在局中用盡（切牌卡設得過深時）則直接換新牌靴。"""
+        pos = self._pos
+        if pos >= len(self._cards):
+            self._load()
+            pos = 0
+        self._pos = pos + 1
+        return self._cards[pos]
+
+    def __len__(self):
+        """牌靴剩餘張數。"""
+        return len(self._cards) - self._pos
+
+
+class InfiniteShoe:
+    """無限副牌（CSM）：自預先產生的亂數牌流依序發牌，每張牌獨立。"""
+
+    __slots__ = ("seed", "_rng", "_cards", "_pos")
+
+    def __init__(self, seed=None, key=("shoe",)):
+        self.seed = rng_streams.make_seed(seed)
+        self._rng = rng_streams.generator(self.seed, *key)
+        self._refill()
+
+    def _refill(self):
+        faces = self._rng.integers(0, len(FACE_VALUES), size=INFINITE_STREAM_CARDS, dtype=np.uint8)
+        self._cards = FACE_VALUES[faces].tolist()
+        self._pos = 0
+
+    def start_round(self):
+        """無限副牌不需洗牌。"""
+
+    def get_state(self):
+        """同 Shoe.get_state。"""
+        state = {"rng": self._rng.bit_generator.state, "pos": self._pos}
+        return state, {"shoe_cards": np.array(self._cards, dtype=np.uint8)}
+
+    def set_state(self, state, arrays):
+        self._rng.bit_generator.state = state["rng"]
+        self._cards = arrays["shoe_cards"].tolist()
+        self._pos = state["pos"]
+
+    def pop(self):
+        pos = self._pos
+        if pos >= INFINITE_STREAM_CARDS:
+            self._refill()
+            pos = 0
+        self._pos = pos + 1
+        return self._cards[pos]
+
+
+def make_shoe(num_decks=DEFAULT_NUM_DECKS, penetration=None, seed=None, key=("shoe",)):
+    """num_decks=None 回傳 InfiniteShoe，否則回傳 Shoe。key 為 rng_streams 的用途鍵（如依策略區分）。"""
+    if num_decks is None:
+        return InfiniteShoe(seed, key)
+    return Shoe(num_decks, penetration, seed, key)
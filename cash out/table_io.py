@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+兌現表 CSV 的統一讀寫：取代各腳本以 skiprows=1/19/32、nrows=15/9/12 各讀三次 CSV 的做法。
+
+讀取以標準庫 csv 單次掃描，依區塊標題（硬牌 / 軟牌 / 分牌）切分，標題下一行為欄名列，
+之後逐行讀到空白行或下一個標題為止，因此增減列不會使區塊錯位。讀完即檢查：
+- 三個區塊都存在、欄位恰為莊家明牌 2..10、A (11)
+- 硬牌 / 分牌列名為 2..21 的整數、軟牌列名為 '20 (A,9)' 等既定格式，且不重複
+- 數值介於 [VALUE_MIN, VALUE_MAX]；「-」或空白只在 allow_missing=True（原始數據表）時允許
+格式不符一律引發 TableFormatError，並指出檔名與行號。
+
+解析結果以檔案內容的 SHA-1 為鍵，快取為同目錄的隱藏 .npz 檔（「.{檔名}.npz」）；
+內容未變時直接讀 .npz，load_lookup 完全不經過 pandas。目錄不可寫時略過快取。
+"""
+import csv
+import hashlib
+import io
+import os
+
+import numpy as np
+
+from cashout_lookup import BLOCK_NAMES, FALLBACK_CASHOUT, N_TOTALS, N_UPCARDS, CashoutLookup, soft_row_name
+
+BLOCK_TITLES = {"hard": "硬牌", "soft": "軟牌", "split": "分牌"}
+HEADER_LABEL = "您的點數 \\ 莊家"
+DEALER_COLUMNS = (2, 3, 4, 5, 6, 7, 8, 9, 10, 11)
+VALUE_MIN, VALUE_MAX = 0.0, 500.0
+MISSING_MARKS = ("", "-")
+CACHE_VERSION = 1
+CACHE_ENABLED = os.environ.get("TABLE_CACHE", "1").strip().lower() not in ("0", "false", "no")
+
+
+class TableFormatError(ValueError):
+    """兌現表 CSV 格式不符。"""
+
+
+def _column_value(label):
+    s = str(label).replace("A (11)", "11").replace("A", "11").strip()
+    return int(s)
+
+
+def _row_total(block, label, where):
+    """列名 -> 玩家點數；軟牌列名須與 soft_row_name 一致。"""
+    label = label.strip()
+    try:
+        total = int(label.split(" ", 1)[0])
+    except ValueError:
+        raise TableFormatError(f"{where}: 無法解析列名 {label!r}")
+    if block == "soft":
+        if soft_row_name(total) != label:
+            raise TableFormatError(f"{where}: 軟牌列名 {label!r} 應為 {soft_row_name(total)!r}")
+    elif label != str(total) or not 2 <= total <= 21:
+        raise TableFormatError(f"{where}: 列名 {label!r} 應為 2..21 的整數")
+    return total
+
+
+def _parse_value(cell, where, allow_missing):
+    cell = cell.strip()
+    if cell in MISSING_MARKS:
+        if not allow_missing:
+            raise TableFormatError(f"{where}: 缺少數值")
+        return np.nan
+    try:
+        value = float(cell)
+    except ValueError:
+        raise TableFormatError(f"{where}: 無法解析數值 {cell!r}")
+    if not VALUE_MIN <= value <= VALUE_MAX:
+        raise TableFormatError(f"{where}: 數值 {value:g} 超出 [{VALUE_MIN:g}, {VALUE_MAX:g}]")
+    return value
+
+
+def parse_blocks(lines, source="<csv>", allow_missing=False):
+    """
+    單次掃描 CSV 內容（行的可迭代物件），回傳 {區塊名: (列名 list, 玩家點數 list, 數值 (列, 10) 陣列)}。
+    缺漏以 NaN 表示。
+    """
+    titles = {title: block for block, title in BLOCK_TITLES.items()}
+    found = {}
+    block = None
+    expect_header = False
+    rows = []
+
+    def _finish():
+        if block is not None:
+            if not rows:
+                raise TableFormatError(f"{source}: {BLOCK_TITLES[block]} 區塊沒有資料列")
+            labels = [r[0] for r in rows]
+            if len(set(labels)) != len(labels):
+                raise TableFormatError(f"{source}: {BLOCK_TITLES[block]} 區塊有重複列名")
+            found[block] = (labels, [r[1] for r in rows], np.array([r[2] for r in rows], dtype=np.float64))
+
+    for line_no, fields in enumerate(csv.reader(lines), start=1):
+        where = f"{source} 第 {line_no} 行"
+        fields = [f.strip() for f in fields]
+        first = fields[0] if fields else ""
+        if first in titles:
+            _finish()
+            block = titles[first]
+            if block in found:
+                raise TableFormatError(f"{where}: 重複的 {first} 區塊")
+            expect_header, rows = True, []
+            continue
+        if not any(fields):
+            _finish()
+            block = None
+            continue
+        if block is None:
+            raise TableFormatError(f"{where}: 區塊標題（硬牌 / 軟牌 / 分牌）之外的資料")
+        if expect_header:
+            try:
+                columns = tuple(_column_value(c) for c in fields[1:] if c)
+            except ValueError:
+                columns = ()
+            if first != HEADER_LABEL or columns != DEALER_COLUMNS:
+                raise TableFormatError(f"{where}: 欄名列應為「{HEADER_LABEL},2,…,10,A (11)」")
+            expect_header = False
+            continue
+        cells = fields[1:]
+        if len(cells) < len(DEALER_COLUMNS) or any(cells[len(DEALER_COLUMNS):]):
+            raise TableFormatError(f"{where}: 應有 {len(DEALER_COLUMNS)} 個數值")
+        values = [_parse_value(c, f"{where} 第 {i + 2} 欄", allow_missing)
+                  for i, c in enumerate(cells[:len(DEALER_COLUMNS)])]
+        rows.append((first, _row_total(block, first, where), values))
+    _finish()
+    missing = [BLOCK_TITLES[b] for b in BLOCK_NAMES if b not in found]
+    if missing:
+        raise TableFormatError(f"{source}: 缺少區塊 {'、'.join(missing)}")
+    return found
+
+
+def _cache_path(path):
+    head, name = os.path.split(os.path.abspath(path))
+    return os.path.join(head, f".{name}.npz")
+
+
+def _digest(data, allow_missing):
+    return hashlib.sha1(data + f"|v{CACHE_VERSION}|{int(allow_missing)}".encode()).hexdigest()
+
+
+def _load_cached(path, allow_missing):
+    """快取命中時取自 .npz，否則解析 CSV 並寫入快取；回傳 parse_blocks 的結果。"""
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = _digest(data, allow_missing)
+    cache = _cache_path(path)
+    if CACHE_ENABLED and os.path.exists(cache):
+        try:
+            with np.load(cache, allow_pickle=False) as z:
+                if str(z["digest"]) == digest:
+                    return {b: (z[f"{b}_labels"].tolist(), z[f"{b}_totals"].tolist(), z[f"{b}_values"])
+                            for b in BLOCK_NAMES}
+        except (OSError, KeyError, ValueError):
+            pass
+    text = data.decode("utf-8-sig")
+    blocks = parse_blocks(io.StringIO(text, newline=""), source=os.path.basename(path),
+                          allow_missing=allow_missing)
+    if CACHE_ENABLED:
+        _write_cache(cache, blocks, digest)
+    return blocks
+
+
+def _write_cache(cache, blocks, digest):
+    arrays = {"digest": np.array(digest)}
+    for b, (labels, totals, values) in blocks.items():
+        arrays[f"{b}_labels"] = np.array(labels, dtype=str)
+        arrays[f"{b}_totals"] = np.array(totals, dtype=np.int16)
+        arrays[f"{b}_values"] = values
+    tmp = f"{cache}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, cache)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _lookup_from_blocks(blocks):
+    values = np.full((3, N_TOTALS, N_UPCARDS), FALLBACK_CASHOUT, dtype=np.float64)
+    valid = np.zeros((3, N_TOTALS, N_UPCARDS), dtype=bool)
+    cols = list(DEALER_COLUMNS)
+    for b, block in enumerate(BLOCK_NAMES):
+        _, totals, arr = blocks[block]
+        for total, row in zip(totals, arr):
+            values[b, total, cols] = row
+            valid[b, total, cols] = True
+    return CashoutLookup(values, valid)
+
+
+def _to_frames(blocks):
+    import pandas as pd
+    out = {}
+    for block in BLOCK_NAMES:
+        labels, totals, values = blocks[block]
+        index = labels if block == "soft" else totals
+        out[block] = pd.DataFrame(values.copy(), index=index, columns=list(DEALER_COLUMNS))
+    return out
+
+
+def load_tables(path, with_lookup=False):
+    """
+    讀取平滑推算表格式的 CSV，回傳 {'hard','soft','split'} DataFrame（欄位為 2..11，硬牌 / 分牌列名為整數）。
+    with_lookup=True 時另附已編譯的 'lookup'。
+    """
+    blocks = _load_cached(path, allow_missing=False)
+    tables = _to_frames(blocks)
+    if with_lookup:
+        tables["lookup"] = _lookup_from_blocks(blocks)
+    return tables
+
+
+def load_lookup(path):
+    """只取 CashoutLookup（不經過 pandas），供只需查表的引擎使用。"""
+    blocks = _load_cached(path, allow_missing=False)
+    return _lookup_from_blocks(blocks)
+
+
+def load_missing_mask(path):
+    """讀取允許「-」缺漏的原始數據表，回傳三個區塊的布林 DataFrame（True 表示缺漏）。"""
+    blocks = _load_cached(path, allow_missing=True)
+    return {block: df.isna() for block, df in _to_frames(blocks).items()}
+
+
+def parse_tables_text(text, with_lookup=True):
+    """解析 CSV 內容字串（不快取），回傳同 load_tables。"""
+    blocks = parse_blocks(io.StringIO(text.lstrip("\ufeff"), newline=""))
+    tables = _to_frames(blocks)
+    if with_lookup:
+        tables["lookup"] = _lookup_from_blocks(blocks)
+    return tables
+
+
+def format_int(v):
+    return str(int(round(float(v))))
+
+
+def write_tables(path, tables, fmt=format_int):
+    """以平滑推算表的區塊格式寫出 tables；fmt 為儲存格格式（預設四捨五入為整數），NaN 寫為空白。"""
+    blank = "," * len(DEALER_COLUMNS)
+
+    def _write_block(f, block, df):
+        f.write(BLOCK_TITLES[block] + blank + "\n")
+        f.write(HEADER_LABEL + "," + ",".join("A (11)" if c == 11 else str(c) for c in df.columns) + "\n")
+        for idx in df.index:
+            row_vals = [fmt(v) if v == v else "" for v in (df.loc[idx, c] for c in df.columns)]
+            # 列名含逗號（如 "20 (A,9)"）必須用雙引號包住，否則 CSV 解析會錯
+            idx_str = str(idx)
+            if "," in idx_str:
+                idx_str = '"' + idx_str + '"'
+            f.write(idx_str + "," + ",".join(row_vals) + "\n")
+
+    with open(path, "w", encoding="utf-8") as f:
+        _write_block(f, "hard", tables["hard"])
+        f.write(blank + "\n")
+        _write_block(f, "soft", tables["soft"])
+        f.write(blank + "\n")
+        f.write(blank + "\n")
+        _write_block(f, "split", tables["split"])
@@ -1,3 +1,22 @@
+import json
+import os
+
+import numpy as np
+
+# 查表範圍：玩家點數 4..21、莊家明牌 2..11、硬/軟（共 18 × 10 × 2 格）
+MIN_SUM, MAX_SUM = 4, 21
+MIN_DEALER, MAX_DEALER = 2, 11
+
+# 由平滑推算表重新擬合的係數檔（見 cash out/fit_cashout_formula.py）；不存在時使用下方內建公式
+COEFFICIENTS_PATH = os.environ.get("CASHOUT_COEFFICIENTS") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cashout_coefficients.json")
+
+_model = None       # 係數檔內容：{是否軟牌: [(P 次方, D 次方, 係數), ...]}，第一次使用時讀取
+_model_loaded = False
+_grid = None
+_grid_rows = None
+
+
 def calculate_cashout(player_sum, dealer_card, is_soft=False):
     """
     計算 Blackjack 預期兌現金額
@@ -10,7 +29,16 @@ def calculate_cashout(player_sum, dealer_card, is_soft=False):
     返回:
     int: 預估兌現金額
     """
-    
+    # 整數輸入直接查預先算好的表（結果與下方公式完全相同）
+    if player_sum.__class__ is int and dealer_card.__class__ is int \
+            and MIN_SUM <= player_sum <= MAX_SUM and MIN_DEALER <= dealer_card <= MAX_DEALER:
+        rows = _grid_rows if _grid_rows is not None else _build_grid()[1]
+        return rows[player_sum - MIN_SUM][dealer_card - MIN_DEALER][1 if is_soft else 0]
+    return _formula(player_sum, dealer_card, is_soft)
+
+
+def _formula(player_sum, dealer_card, is_soft=False):
+    """calculate_cashout 的多項式計算本體（查表範圍外或非整數輸入時使用）。"""
     P = player_sum
     D = dealer_card
     
@@ -20,7 +48,11 @@ def calculate_cashout(player_sum, dealer_card, is_soft=False):
     if not (2 <= D <= 11):
         return 0  # 莊家牌不合理
 
-    if not is_soft:
+    model = _model if _model_loaded else _load_model()
+    if model is not None:
+        # --- 重新擬合的係數 ---
+        cashout = sum(c * P**i * D**j for i, j, c in model[bool(is_soft)])
+    elif not is_soft:
         # --- 硬牌公式 (Hard Hand) ---
         # 基於三次多項式回歸 (R^2 ≈ 0.83)
         cashout = (
@@ -54,6 +86,66 @@ def calculate_cashout(player_sum, dealer_card, is_soft=False):
     # 確保金額不為負數，並四捨五入取整
     return max(0, int(round(cashout)))
 
+
+def _load_model():
+    global _model, _model_loaded
+    model = None
+    if os.path.exists(COEFFICIENTS_PATH):
+        with open(COEFFICIENTS_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        model = {
+            soft: [(int(i), int(j), float(c)) for (i, j), c in zip(data["terms"], data[block]["coef"])]
+            for soft, block in ((False, "hard"), (True, "soft"))
+        }
+    _model, _model_loaded = model, True
+    return model
+
+
+def _build_grid():
+    """建立 CASHOUT_GRID[玩家點數 - 4, 莊家明牌 - 2, 是否軟牌]（第一次使用時建立一次）。"""
+    global _grid, _grid_rows
+    grid = np.array([
+        [[_formula(p, d, soft) for soft in (False, True)] for d in range(MIN_DEALER, MAX_DEALER + 1)]
+        for p in range(MIN_SUM, MAX_SUM + 1)
+    ], dtype=np.int64)
+    grid.setflags(write=False)
+    _grid, _grid_rows = grid, grid.tolist()
+    return _grid, _grid_rows
+
+
+def reload_coefficients():
+    """重新擬合後讓常駐行程改用新的係數檔（清除已讀取的係數與查表）。"""
+    global _model, _model_loaded, _grid, _grid_rows
+    _model, _model_loaded, _grid, _grid_rows = None, False, None, None
+
+
+def __getattr__(name):
+    # CASHOUT_GRID 於第一次存取時才建立，避免 import 時就讀取係數檔
+    if name == "CASHOUT_GRID":
+        return _grid if _grid is not None else _build_grid()[0]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def calculate_cashout_batch(player_sum, dealer_card, is_soft=False):
+    """
+    calculate_cashout 的向量化版本：三個可廣播的陣列（is_soft 可為純量），回傳同形狀的 int64 陣列。
+    逐元素結果與 calculate_cashout 相同（範圍外為 0）；整數輸入一次查表，非整數點數才逐一走公式。
+    """
+    P = np.asarray(player_sum)
+    D = np.asarray(dealer_card)
+    S = np.asarray(is_soft, dtype=bool)
+    P, D, S = np.broadcast_arrays(P, D, S)
+    out = np.zeros(P.shape, dtype=np.int64)
+    in_range = (P >= MIN_SUM) & (P <= MAX_SUM) & (D >= MIN_DEALER) & (D <= MAX_DEALER)
+    integral = in_range & (P == np.floor(P)) & (D == np.floor(D))
+    grid = _grid if _grid is not None else _build_grid()[0]
+    out[integral] = grid[P[integral].astype(np.intp) - MIN_SUM,
+                         D[integral].astype(np.intp) - MIN_DEALER,
+                         S[integral].astype(np.intp)]
+    for idx in map(tuple, np.argwhere(in_range & ~integral)):
+        out[idx] = _formula(P[idx].item(), D[idx].item(), bool(S[idx]))
+    return out
+
 # --- 測試範例 (您可以修改這裡的數值) ---
 if __name__ == "__main__":
     test_cases = [
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+莊家結果機率分佈（S17：軟 17 停牌），以遞迴精確計算並快取，取代逐局抽牌模擬莊家補牌。
+
+dealer_outcome(upcard, num_decks, removed) 回傳 DealerOutcome：
+- totals[k]: 莊家停在 17+k 點的機率（k = 0..4，即 17..21）
+- bust_by_cards[n]: 莊家以 n 張牌爆牌的機率（含明牌；Bust It 的「爆牌張數」）
+
+upcard=None 表示莊家從零張牌開始（Bust It 側注）。num_decks=None 為無限副牌；
+否則為 num_decks 副牌的牌靴，removed 為已自牌靴移除的牌（如玩家手牌，明牌會自動移除）。
+查詢結果與遞迴中間狀態都以有上限的 LRU 快取保存。
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+# 牌值 2..10、A(11)；每副牌各點數張數（10 點含 J/Q/K）
+CARD_VALUES = (2, 3, 4, 5, 6, 7, 8, 9, 10, 11)
+RANK_COUNTS_PER_DECK = (4, 4, 4, 4, 4, 4, 4, 4, 16, 4)
+CARDS_PER_DECK = 52
+
+# 莊家手牌張數上限（全為 A 與 2 的極端情形亦不超過此值）
+MAX_DEALER_CARDS = 12
+# 結果向量：前 5 格為停在 17..21，之後為以 0..MAX_DEALER_CARDS 張爆牌
+_N_TOTALS = 5
+_VECTOR_LEN = _N_TOTALS + MAX_DEALER_CARDS + 1
+
+DEALER_CACHE_SIZE = 4096        # dealer_outcome 查詢快取（每組 明牌 × 牌組 × 移除牌 一筆）
+STATE_CACHE_SIZE = 1 << 20      # 有限牌靴遞迴中間狀態快取
+
+DealerOutcome = namedtuple("DealerOutcome", ["totals", "bust_by_cards"])
+
+
+def _outcome_p_bust(self):
+    return sum(self.bust_by_cards)
+
+
+def _outcome_distribution(self):
+    """(P17, P18, P19, P20, P21, P爆牌)"""
+    return tuple(self.totals) + (sum(self.bust_by_cards),)
+
+
+DealerOutcome.p_bust = property(_outcome_p_bust)
+DealerOutcome.distribution = property(_outcome_distribution)
+
+
+def add_card(total, soft, card):
+    """手牌加一張牌：回傳 (新點數, 以 11 計的 A 張數)。"""
+    total += card
+    if card == 11:
+        soft += 1
+    if total > 21 and soft:
+        total -= 10
+        soft -= 1
+    return total, soft
+
+
+def _terminal(total, n_cards):
+    out = [0.0] * _VECTOR_LEN
+    if total > 21:
+        out[_N_TOTALS + n_cards] = 1.0
+    else:
+        out[total - 17] = 1.0
+    return tuple(out)
+
+
+@lru_cache(maxsize=STATE_CACHE_SIZE)
+def _infinite_state(total, soft, n_cards):
+    """無限副牌：自 (total, soft, n_cards) 起補牌至停牌的結果向量。"""
+    if total >= 17:
+        return _terminal(total, n_cards)
+    acc = [0.0] * _VECTOR_LEN
+    for card, weight in zip(CARD_VALUES, RANK_COUNTS_PER_DECK):
+        p = weight / CARDS_PER_DECK
+        sub = _infinite_state(*add_card(total, soft, card), n_cards + 1)
+        for k in range(_VECTOR_LEN):
+            acc[k] += p * sub[k]
+    return tuple(acc)
+
+
+@lru_cache(maxsize=STATE_CACHE_SIZE)
+def _finite_state(total, soft, n_cards, counts):
+    """有限牌靴：剩餘牌組 counts 下自 (total, soft, n_cards) 起補牌至停牌的結果向量。"""
+    if total >= 17:
+        return _terminal(total, n_cards)
+    remaining = sum(counts)
+    acc = [0.0] * _VECTOR_LEN
+    for i, c in enumerate(counts):
+        if not c:
+            continue
+        p = c / remaining
+        sub = _finite_state(*add_card(total, soft, CARD_VALUES[i]), n_cards + 1,
+                            counts[:i] + (c - 1,) + counts[i + 1:])
+        for k in range(_VECTOR_LEN):
+            acc[k] += p * sub[k]
+    return tuple(acc)
+
+
+def shoe_counts(num_decks, removed=()):
+    """num_decks 副牌移除 removed（牌值序列）後的各點數張數，依 CARD_VALUES 順序。"""
+    counts = [c * num_decks for c in RANK_COUNTS_PER_DECK]
+    for card in removed:
+        i = CARD_VALUES.index(card)
+        if counts[i] == 0:
+            raise ValueError(f"牌靴中已無牌值 {card} 可移除")
+        counts[i] -= 1
+    return tuple(counts)
+
+
+@lru_cache(maxsize=DEALER_CACHE_SIZE)
+def _dealer_outcome_cached(upcard, num_decks, removed):
+    if upcard is None:
+        start = (0, 0, 0)
+    else:
+        start = (upcard, 1 if upcard == 11 else 0, 1)
+    if num_decks is None:
+        vec = _infinite_state(*start)
+    else:
+        taken = removed + ((upcard,) if upcard is not None else ())
+        vec = _finite_state(*start, shoe_counts(num_decks, taken))
+    return DealerOutcome(vec[:_N_TOTALS], vec[_N_TOTALS:])
+
+
+def dealer_outcome(upcard, num_decks=None, removed=()):
+    """
+    莊家明牌為 upcard（2..11，None 表示從零張開始）時的 DealerOutcome。
+    removed: 明牌以外已離開牌靴的牌值（僅 num_decks 非 None 時有意義，順序不影響結果）。
+    """
+    if num_decks is None:
+        removed = ()
+    return _dealer_outcome_cached(upcard, num_decks, tuple(sorted(removed)))
+
+
+def stand_return(player_total, outcome, base_bet):
+    """玩家停在 player_total（17..21）與莊家比牌的期望拿回金額（贏 2 倍、平手退本金）。"""
+    idx = player_total - 17
+    win = outcome.p_bust + sum(outcome.totals[:idx])
+    return base_bet * 2.0 * win + base_bet * outcome.totals[idx]
+
+
+def clear_caches():
+    """清除所有快取（例如長時間執行的服務需釋放記憶體時）。"""
+    _dealer_outcome_cached.cache_clear()
+    _infinite_state.cache_clear()
+    _finite_state.cache_clear()
+
+
+def cache_info():
+    """回傳各快取的 CacheInfo，供監控命中率。"""
+    return {
+        "dealer_outcome": _dealer_outcome_cached.cache_info(),
+        "infinite_state": _infinite_state.cache_info(),
+        "finite_state": _finite_state.cache_info(),
+    }
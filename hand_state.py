@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+手牌狀態壓縮為單一整數，加一張牌只需查一次預先算好的轉移表，取代每次重新加總整串手牌、數 A 的 calculate_hand。
+
+狀態 = ((點數 × 2 + 軟) × (MAX_CARDS + 1) + 張數) × 2 + 對子：
+- 點數：A 以 11 計、超過 21 時降為 1 後的總點數（0..31，> 21 為爆牌）
+- 軟：是否有 A 以 11 計（正規化後至多一張）
+- 張數：手牌張數，超過 MAX_CARDS 時停在 MAX_CARDS（Bust It 8 張以上合併計算，不受影響）
+- 對子：恰好兩張且牌值相同
+
+爆牌後的狀態再加牌只增加張數、點數不變。
+next_state(state, card) 以 card（2..11）查 NEXT；NEXT_TABLE 為同一份表的 (狀態, 牌值) NumPy 陣列，供向量化引擎使用。
+"""
+import numpy as np
+
+MAX_TOTAL = 31
+MAX_CARDS = 15
+N_STATES = (MAX_TOTAL + 1) * 2 * (MAX_CARDS + 1) * 2
+CARD_STRIDE = 12   # 轉移表每列以牌值 0..11 為索引（實際使用 2..11）
+
+
+def encode(total, soft, n_cards, pair=False):
+    """(點數, 是否軟牌, 張數, 是否對子) -> 狀態整數。"""
+    return ((total * 2 + bool(soft)) * (MAX_CARDS + 1) + min(n_cards, MAX_CARDS)) * 2 + bool(pair)
+
+
+def _add_card(total, soft, card):
+    """加一張牌並把以 11 計的 A 逐張降為 1，直到不爆牌或沒有軟 A。"""
+    total += card
+    if card == 11:
+        soft += 1
+    while total > 21 and soft:
+        total -= 10
+        soft -= 1
+    return total, soft
+
+
+def _build():
+    total = [0] * N_STATES
+    soft = [False] * N_STATES
+    count = [0] * N_STATES
+    pair = [False] * N_STATES
+    nxt = [0] * (N_STATES * CARD_STRIDE)
+    for t in range(MAX_TOTAL + 1):
+        for s in (0, 1):
+            for n in range(MAX_CARDS + 1):
+                for p in (0, 1):
+                    state = encode(t, s, n, p)
+                    total[state], soft[state], count[state], pair[state] = t, bool(s), n, bool(p)
+                    for card in range(2, 12):
+                        if t > 21:
+                            new_t, new_s = t, s
+                        else:
+                            new_t, new_s = _add_card(t, s, card)
+                        # 僅一張牌時點數即為該牌值，據此判斷第二張是否成對
+                        new_p = n == 1 and card == t
+                        nxt[state * CARD_STRIDE + card] = encode(new_t, new_s, n + 1, new_p)
+    return total, soft, count, pair, nxt
+
+
+TOTAL, SOFT, COUNT, PAIR, NEXT = _build()
+EMPTY = encode(0, False, 0)
+
+NEXT_TABLE = np.array(NEXT, dtype=np.int16).reshape(N_STATES, CARD_STRIDE)
+TOTAL_TABLE = np.array(TOTAL, dtype=np.int16)
+COUNT_TABLE = np.array(COUNT, dtype=np.int8)
+for _arr in (NEXT_TABLE, TOTAL_TABLE, COUNT_TABLE):
+    _arr.setflags(write=False)
+
+
+def next_state(state, card):
+    """狀態加一張牌值為 card（2..11）的牌。"""
+    return NEXT[state * CARD_STRIDE + card]
+
+
+def from_cards(cards, state=EMPTY):
+    """由牌值序列建立狀態（可自既有狀態 state 接續）。"""
+    for card in cards:
+        state = NEXT[state * CARD_STRIDE + card]
+    return state
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+選配的 C 加速後端：第一次使用時以本機 C 編譯器把 bj_kernels.c 編成共享函式庫，之後以 ctypes 載入。
+
+沒有編譯器、編譯失敗或設定環境變數 BJ_NATIVE=0 時，available() 為 False，各 wrapper 回傳 None，
+呼叫端（batch_engine、bust_it_infinite_deck）自動退回 NumPy 實作。兩條路徑對同一批牌的結果逐位元相同。
+
+編譯產物依原始碼雜湊命名，存放於 BJ_NATIVE_CACHE（預設 ~/.cache/infinite_blackjack），
+原始碼修改後會自動重新編譯；先寫入暫存檔再改名，多個 worker 行程同時編譯也不會互相覆蓋。
+編譯器可用 CC 環境變數指定（預設 cc）。
+"""
+import ctypes
+import hashlib
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bj_kernels.c")
+CACHE_DIR = os.environ.get("BJ_NATIVE_CACHE") or os.path.join(
+    os.path.expanduser("~"), ".cache", "infinite_blackjack")
+ENABLED = os.environ.get("BJ_NATIVE", "1").strip().lower() not in ("0", "false", "no")
+COMPILE_FLAGS = ("-O2", "-shared", "-fPIC", "-std=c99")
+
+_u8 = np.ctypeslib.ndpointer(dtype=np.uint8, flags="C_CONTIGUOUS")
+_i16 = np.ctypeslib.ndpointer(dtype=np.int16, flags="C_CONTIGUOUS")
+_i64 = np.ctypeslib.ndpointer(dtype=np.int64, flags="C_CONTIGUOUS")
+_f64 = np.ctypeslib.ndpointer(dtype=np.float64, flags="C_CONTIGUOUS")
+
+_lib = None
+_load_error = None
+_loaded = False
+
+
+def _build():
+    """編譯（或沿用快取的）共享函式庫，回傳其路徑。"""
+    with open(SOURCE_PATH, "rb") as f:
+        digest = hashlib.sha1(f.read() + " ".join(COMPILE_FLAGS).encode()).hexdigest()[:16]
+    lib_path = os.path.join(CACHE_DIR, f"bj_kernels_{digest}.so")
+    if os.path.exists(lib_path):
+        return lib_path
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".so", dir=CACHE_DIR)
+    os.close(fd)
+    try:
+        cc = os.environ.get("CC", "cc")
+        subprocess.run([cc, *COMPILE_FLAGS, "-o", tmp_path, SOURCE_PATH],
+                       check=True, capture_output=True)
+        os.replace(tmp_path, lib_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return lib_path
+
+
+def _load():
+    global _lib, _load_error, _loaded
+    _loaded = True
+    if not ENABLED:
+        _load_error = "BJ_NATIVE=0"
+        return
+    try:
+        lib = ctypes.CDLL(_build())
+    except (OSError, subprocess.CalledProcessError) as e:
+        _load_error = str(e)
+        return
+    lib.bj_dealer_draw_out.argtypes = [_u8, _u8, ctypes.c_int64, ctypes.c_int32, _i16]
+    lib.bj_dealer_draw_out.restype = None
+    lib.bj_resolve_hands.argtypes = [_u8, _u8, _u8, _u8, ctypes.c_int64, ctypes.c_int32,
+                                     _f64, ctypes.c_double, _f64, ctypes.c_void_p]
+    lib.bj_resolve_hands.restype = None
+    lib.bj_bust_histogram.argtypes = [_u8, ctypes.c_int64, ctypes.c_int32, _i64]
+    lib.bj_bust_histogram.restype = None
+    _lib = lib
+
+
+def _get_lib():
+    if not _loaded:
+        _load()
+    return _lib
+
+
+def available():
+    """C 後端是否可用。"""
+    return _get_lib() is not None
+
+
+def load_error():
+    """C 後端不可用的原因（可用時為 None）。"""
+    _get_lib()
+    return _load_error
+
+
+def _u8_array(a):
+    return np.ascontiguousarray(a, dtype=np.uint8)
+
+
+def dealer_draw_out(upcard, dealer_cards):
+    """batch_engine.dealer_draw_out 的 C 版；後端不可用時回傳 None。"""
+    lib = _get_lib()
+    if lib is None:
+        return None
+    dealer_cards = _u8_array(dealer_cards)
+    out = np.empty(dealer_cards.shape[0], dtype=np.int16)
+    lib.bj_dealer_draw_out(_u8_array(upcard), dealer_cards, dealer_cards.shape[0], dealer_cards.shape[1], out)
+    return out
+
+
+def resolve_hands(c1, c2, upcard, dealer_cards, values, base_bet, hits=None):
+    """batch_engine._resolve_hands 的 C 版（hits 需為 int64 連續陣列，原地累加）；後端不可用時回傳 None。"""
+    lib = _get_lib()
+    if lib is None:
+        return None
+    dealer_cards = _u8_array(dealer_cards)
+    n = dealer_cards.shape[0]
+    returned = np.empty(n, dtype=np.float64)
+    hits_ptr = None
+    if hits is not None:
+        if hits.dtype != np.int64 or not hits.flags.c_contiguous:
+            return None
+        hits_ptr = hits.ctypes.data
+    lib.bj_resolve_hands(_u8_array(c1), _u8_array(c2), _u8_array(upcard), dealer_cards, n,
+                         dealer_cards.shape[1], np.ascontiguousarray(values, dtype=np.float64),
+                         float(base_bet), returned, hits_ptr)
+    return returned
+
+
+def bust_histogram(cards):
+    """bust_count_histogram 的 C 版（長度 9 的 int64 直方圖）；後端不可用時回傳 None。"""
+    lib = _get_lib()
+    if lib is None:
+        return None
+    cards = _u8_array(cards)
+    hist = np.zeros(9, dtype=np.int64)
+    lib.bj_bust_histogram(cards, cards.shape[0], cards.shape[1], hist)
+    return hist
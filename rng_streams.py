@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+所有模擬共用的亂數層：以一個整數 seed 加上「用途鍵」決定每條亂數流（NumPy SeedSequence 的 spawn_key），
+取代全域 random.seed(...) 與未指定種子的 random.sample / random.choices。
+
+- generator(seed, *key)：用途鍵可為整數或字串，如 generator(seed, "batch", "A", 17) 為策略 A 第 17 批。
+  同一組 (seed, key) 永遠得到同一條亂數流，與先後順序、worker 數量無關，因此任何一批都能單獨重播。
+- seed_sequence(seed, i) 與 SeedSequence(seed).spawn(n)[i] 相同，可直接交給行程池的 worker。
+- make_seed(None) 產生新的 128 位元 seed；呼叫端應把它記錄在結果中，以便重現。
+"""
+import random
+import zlib
+
+import numpy as np
+
+
+def make_seed(seed=None):
+    """seed 為 None 時產生新的 seed（系統熵），否則原樣回傳。"""
+    if seed is None:
+        return int(np.random.SeedSequence().entropy)
+    return int(seed)
+
+
+def _key_part(part):
+    # 字串以 crc32 轉為固定整數（Python 內建 hash 每次執行不同）
+    if isinstance(part, str):
+        return zlib.crc32(part.encode("utf-8"))
+    return int(part)
+
+
+def seed_sequence(seed, *key):
+    """(seed, 用途鍵) 對應的 SeedSequence；seed 不可為 None。"""
+    if seed is None:
+        raise ValueError("seed 不可為 None，請先以 make_seed() 產生並記錄")
+    return np.random.SeedSequence(int(seed), spawn_key=tuple(_key_part(k) for k in key))
+
+
+def generator(seed, *key):
+    """(seed, 用途鍵) 對應的 NumPy Generator。"""
+    return np.random.default_rng(seed_sequence(seed, *key))
+
+
+def py_random(seed, *key):
+    """(seed, 用途鍵) 對應的標準庫 random.Random，供純 Python 迴圈（random.sample / choices）使用。"""
+    state = seed_sequence(seed, *key).generate_state(4, dtype=np.uint32)
+    return random.Random(int.from_bytes(state.tobytes(), "little"))